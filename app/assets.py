@@ -0,0 +1,64 @@
+"""
+MILARIPPA - Fichiers statiques versionnés
+=========================================
+asset_url("css/style.css") renvoie l'URL de la version construite par
+scripts/build_static.py (/assets/css/style.3f9a1c2e07.css), ou celle du
+fichier source (/static/css/style.css) si le build n'a pas été fait.
+
+send_asset() sert la variante précompressée (brotli, sinon gzip) acceptée
+par le navigateur. Le nom change avec le contenu : le navigateur peut
+garder le fichier un an sans jamais le revalider.
+"""
+
+import json
+import mimetypes
+from pathlib import Path
+
+from flask import abort, request, send_from_directory, url_for
+
+DIST_DIR = Path(__file__).resolve().parent / "static" / "dist"
+MANIFEST_FILE = "manifest.json"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]  # Par ordre de préférence
+
+_manifest = None
+_built = None
+
+
+def load_manifest() -> dict:
+    """Manifest du build (lu une fois par process ; vide sans build)."""
+    global _manifest, _built
+    if _manifest is None:
+        path = DIST_DIR / MANIFEST_FILE
+        _manifest = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        _built = {entry["path"]: entry["encodings"] for entry in _manifest.values()}
+    return _manifest
+
+
+def asset_url(path: str) -> str:
+    """URL d'un fichier de app/static/ (version construite si elle existe)."""
+    entry = load_manifest().get(path)
+    if entry is None:
+        return url_for("static", filename=path)
+    return url_for("asset", filename=entry["path"])
+
+
+def send_asset(filename: str):
+    """Réponse pour un fichier construit : variante compressée, cache immuable."""
+    load_manifest()
+    encodings = _built.get(filename)
+    if encodings is None:
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for encoding, suffix in ENCODINGS:
+        if encoding in encodings and request.accept_encodings[encoding]:
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype)
+
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE
+    response.vary.add("Accept-Encoding")
+    return response
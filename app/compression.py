@@ -0,0 +1,40 @@
+"""
+MILARIPPA - Compression des réponses JSON
+=========================================
+Les réponses JSON de plus de COMPRESS_MIN_BYTES (longs historiques de
+messages, listes de conversations) partent en gzip quand le navigateur
+l'accepte : le texte des messages se compresse plusieurs fois, ce qui
+compte sur mobile. En dessous du seuil, le gain ne couvre pas le coût.
+Les réponses streamées (NDJSON de /api/chat/batch) ne sont pas touchées.
+"""
+
+import gzip
+import os
+
+from flask import request
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_LEVEL = 6  # Compromis vitesse / taille (gzip -6)
+COMPRESSIBLE_MIMETYPES = {"application/json"}
+
+
+def compress_response(response):
+    """Hook after_request : compresse en gzip une réponse JSON assez grosse."""
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.is_streamed
+            or response.direct_passthrough
+            or not 200 <= response.status_code < 300
+            or "Content-Encoding" in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if not request.accept_encodings["gzip"]:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
@@ -0,0 +1,281 @@
+"""
+MILARIPPA - Stockage binaire des embeddings
+===========================================
+Remplace le JSONL "un chunk + son vecteur en texte par ligne" par deux
+fichiers alignés ligne à ligne :
+
+    vectors.npy   float32 ou float16 (n, dim), contigu, mappable en mémoire
+    meta.jsonl    une ligne JSON par vecteur (champs du chunk, sans le vecteur)
+
+La ligne i de meta.jsonl décrit le vecteur i. Les deux fichiers sont en
+ajout seul, comme l'ancien JSONL : la dernière ligne d'un id l'emporte.
+
+L'en-tête .npy a une taille fixe (HEADER_SIZE) et est réécrit après chaque
+ajout : le fichier reste lisible par np.load à tout moment. Après un crash,
+reconcile() ramène les deux fichiers au même nombre de lignes complètes.
+compact() réécrit le magasin sans ses lignes mortes (versions remplacées,
+chunks supprimés) et le substitue d'un coup.
+
+params.json garde les paramètres d'embedding (modèle, dimensions) du
+magasin : open_store() met de côté un magasin produit avec d'autres
+paramètres au lieu d'y ajouter des vecteurs d'une autre dimension.
+"""
+
+import ast
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+EMBEDDINGS_DIR = Path("data/chunks/embeddings")
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.jsonl"
+PARAMS_FILE = "params.json"
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+HEADER_SIZE = 128  # Magic + version + longueur + dictionnaire, complété par des espaces
+DTYPES = {"float32": np.float32, "float16": np.float16}
+COMPACT_BLOCK_ROWS = 4096  # Lignes recopiées par écriture lors d'un compactage
+
+
+def _npy_header(dtype: np.dtype, rows: int, dim: int) -> bytes:
+    """En-tête .npy (format 1.0) de taille fixe HEADER_SIZE."""
+    header = repr({"descr": np.dtype(dtype).str, "fortran_order": False, "shape": (rows, dim)}).encode("latin1")
+    padding = HEADER_SIZE - len(NPY_MAGIC) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError("En-tête .npy trop long")
+    header += b" " * padding + b"\n"
+    return NPY_MAGIC + len(header).to_bytes(2, "little") + header
+
+
+def _read_npy_header(f) -> tuple[np.dtype, int, int]:
+    """Lit (dtype, lignes, dimension) depuis un en-tête écrit par _npy_header."""
+    data = f.read(HEADER_SIZE)
+    if data[:len(NPY_MAGIC)] != NPY_MAGIC:
+        raise ValueError("Fichier .npy invalide")
+    header = ast.literal_eval(data[len(NPY_MAGIC) + 2:].decode("latin1"))
+    rows, dim = header["shape"]
+    return np.dtype(header["descr"]), rows, dim
+
+
+class EmbeddingStore:
+    """Vecteurs (.npy) + métadonnées (JSONL) alignés par numéro de ligne."""
+
+    def __init__(self, directory: Path = EMBEDDINGS_DIR, dtype: str = "float32", params: dict | None = None):
+        self.directory = Path(directory)
+        self.vectors_path = self.directory / VECTORS_FILE
+        self.meta_path = self.directory / META_FILE
+        self.params_path = self.directory / PARAMS_FILE
+        self.params = params
+        self.dtype = np.dtype(DTYPES[dtype])
+        self.dim = 0
+        self.rows = 0
+        self._reconciled = False
+
+        # Compactage interrompu entre les deux renommages : la copie compacte est complète
+        compacted = self.directory.with_name(self.directory.name + ".compact")
+        if not self.directory.exists() and compacted.exists():
+            os.replace(compacted, self.directory)
+
+        if self.vectors_path.exists():
+            with open(self.vectors_path, "rb") as f:
+                # Un magasin existant garde son type (float32 ou float16)
+                self.dtype, self.rows, self.dim = _read_npy_header(f)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def exists(self) -> bool:
+        return self.vectors_path.exists() and self.meta_path.exists()
+
+    def stored_params(self) -> dict | None:
+        """Paramètres d'embedding enregistrés (None pour un magasin d'avant params.json)."""
+        if not self.params_path.exists():
+            return None
+        return json.loads(self.params_path.read_text(encoding="utf-8"))
+
+    def archive(self) -> Path:
+        """Met le magasin de côté (dossier voisin horodaté) et repart d'un magasin vide."""
+        archived = self.directory.with_name(f"{self.directory.name}.archive-{time.strftime('%Y%m%d-%H%M%S')}")
+        os.replace(self.directory, archived)
+        self.dim = 0
+        self.rows = 0
+        self._reconciled = False
+        return archived
+
+    def reconcile(self) -> int:
+        """
+        Ramène vecteurs et métadonnées au même nombre de lignes complètes
+        (après une interruption au milieu d'un ajout). Retourne le nombre de
+        lignes retirées.
+        """
+        if not self.exists():
+            return 0
+
+        row_bytes = self.dim * self.dtype.itemsize
+        vector_rows = (self.vectors_path.stat().st_size - HEADER_SIZE) // row_bytes if row_bytes else 0
+
+        # Lignes JSON complètes (terminées par \n)
+        meta_ends = []
+        position = 0
+        with open(self.meta_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                meta_ends.append(position)
+
+        rows = min(vector_rows, len(meta_ends))
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(HEADER_SIZE + rows * row_bytes)
+            f.seek(0)
+            f.write(_npy_header(self.dtype, rows, self.dim))
+        with open(self.meta_path, "r+b") as f:
+            f.truncate(meta_ends[rows - 1] if rows else 0)
+
+        self.rows = rows
+        self._reconciled = True
+        return (vector_rows - rows) + (len(meta_ends) - rows)
+
+    def append(self, chunks: list[dict], vectors) -> None:
+        """
+        Ajoute des chunks et leurs vecteurs. Les vecteurs sont écrits (et
+        l'en-tête mis à jour) avant les métadonnées : une ligne de meta.jsonl
+        n'existe jamais sans son vecteur. Le premier ajout répare d'abord
+        un éventuel ajout interrompu.
+        """
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        if len(chunks) != len(vectors):
+            raise ValueError("Autant de vecteurs que de chunks attendus")
+        if not len(chunks):
+            return
+
+        if not self._reconciled:
+            self.reconcile()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.params is not None and not self.params_path.exists():
+            self.params_path.write_text(json.dumps(self.params, sort_keys=True), encoding="utf-8")
+        if not self.vectors_path.exists():
+            self.dim = vectors.shape[1]
+            with open(self.vectors_path, "wb") as f:
+                f.write(_npy_header(self.dtype, 0, self.dim))
+            self.meta_path.write_bytes(b"")
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Dimension {vectors.shape[1]} incompatible avec le magasin ({self.dim}) : "
+                             f"paramètres d'embedding changés ? Voir open_store()")
+
+        rows = self.rows + len(vectors)
+        with open(self.vectors_path, "r+b") as f:
+            f.seek(HEADER_SIZE + self.rows * self.dim * self.dtype.itemsize)
+            f.write(np.ascontiguousarray(vectors).tobytes())
+            f.seek(0)
+            f.write(_npy_header(self.dtype, rows, self.dim))
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            for chunk in chunks:
+                meta = {key: value for key, value in chunk.items() if key != "embedding"}
+                f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.rows = rows
+
+    def vectors(self) -> np.ndarray:
+        """Tous les vecteurs, mappés en mémoire en lecture seule."""
+        if not self.rows:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        return np.load(self.vectors_path, mmap_mode="r")[:self.rows]
+
+    def iter_meta(self):
+        """(ligne, métadonnées) de chaque ligne, dans l'ordre d'écriture."""
+        if not self.meta_path.exists():
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            for row, line in enumerate(f):
+                if row >= self.rows:
+                    break
+                yield row, json.loads(line)
+
+    def latest(self, keep_ids=None) -> tuple[list[dict], np.ndarray]:
+        """
+        Dernière version de chaque id (seulement les ids de keep_ids si
+        fourni) : (métadonnées, lignes correspondantes dans vectors()).
+        """
+        latest = {}
+        for row, meta in self.iter_meta():
+            if keep_ids is None or meta["id"] in keep_ids:
+                latest[meta["id"]] = (row, meta)
+        rows = np.fromiter((row for row, _ in latest.values()), dtype=np.int64, count=len(latest))
+        return [meta for _, meta in latest.values()], rows
+
+    def load(self, keep_ids=None) -> tuple[list[dict], np.ndarray]:
+        """Métadonnées + matrice des vecteurs (float32) des chunks vivants."""
+        chunks, rows = self.latest(keep_ids)
+        return chunks, np.asarray(self.vectors()[rows], dtype=np.float32)
+
+    def compact(self, keep_ids) -> int:
+        """
+        Réécrit le magasin avec seulement la dernière ligne de chaque id de
+        keep_ids, dans un dossier voisin substitué ensuite à l'original.
+        Retourne le nombre de lignes retirées.
+        """
+        chunks, rows = self.latest(keep_ids)
+        dropped = self.rows - len(chunks)
+        if dropped == 0 or not self.exists():
+            return 0
+
+        compacted = self.directory.with_name(self.directory.name + ".compact")
+        old = self.directory.with_name(self.directory.name + ".old")
+        shutil.rmtree(compacted, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+
+        # Copie compacte, par blocs, dans l'ordre d'écriture d'origine
+        order = np.argsort(rows, kind="stable")
+        vectors = self.vectors()
+        target = EmbeddingStore(compacted, dtype=self.dtype.name)
+        target.directory.mkdir(parents=True)
+        with open(target.vectors_path, "wb") as f:
+            f.write(_npy_header(self.dtype, 0, self.dim))
+        target.meta_path.write_bytes(b"")
+        if self.params_path.exists():
+            shutil.copyfile(self.params_path, target.params_path)
+        target.dim = self.dim
+        target._reconciled = True
+        for start in range(0, len(order), COMPACT_BLOCK_ROWS):
+            block = order[start:start + COMPACT_BLOCK_ROWS]
+            target.append([chunks[i] for i in block], vectors[rows[block]])
+
+        # Substitution : original → .old, copie → original
+        os.replace(self.directory, old)
+        os.replace(compacted, self.directory)
+        shutil.rmtree(old, ignore_errors=True)
+
+        self.rows = target.rows
+        return dropped
+
+
+def open_store(directory: Path, dtype: str, params: dict, dim: int | None = None) -> tuple[EmbeddingStore, Path | None]:
+    """
+    Ouvre le magasin des vecteurs produits avec params. Un magasin produit
+    avec d'autres paramètres (ou, sans params.json, d'une autre dimension
+    que dim) est mis de côté : (magasin vide, dossier archivé). Sinon
+    (magasin, None).
+    """
+    store = EmbeddingStore(directory, dtype=dtype, params=params)
+    if not store.exists():
+        return store, None
+    stored = store.stored_params()
+    if stored is None:
+        changed = bool(dim and store.dim and store.dim != dim)
+    else:
+        changed = stored != params
+    if not changed:
+        return store, None
+    archived = store.archive()
+    return EmbeddingStore(directory, dtype=dtype, params=params), archived
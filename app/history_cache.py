@@ -0,0 +1,103 @@
+"""
+MILARIPPA - Cache des historiques de conversation
+=================================================
+LRU borné des historiques récents (paires role/content, avec leur nombre de
+tokens), tenu à jour en write-through à chaque message sauvegardé. Une
+conversation active n'est lue dans la table `messages` qu'une seule fois.
+
+Chaque entrée porte le `updated_at` de la conversation au moment où elle a
+été écrite : si un autre worker a répondu entre-temps, la date en base a
+changé et l'historique est relu. Seul /api/chat remplit le cache, pour des
+conversations qui existent.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import tiktoken
+
+_encoder = None
+
+
+def count_tokens(text: str) -> int:
+    """Nombre de tokens d'un message (tokenizer cl100k_base, chargé au premier appel)."""
+    global _encoder
+    if _encoder is None:
+        _encoder = tiktoken.get_encoding("cl100k_base")
+    return len(_encoder.encode(text, disallowed_special=()))
+
+
+def _as_version(updated_at):
+    """updated_at comparable quel que soit son format (Supabase abrège les microsecondes)."""
+    if isinstance(updated_at, str):
+        return datetime.fromisoformat(updated_at)
+    return updated_at
+
+
+class HistoryCache:
+    """Historiques des conversations récentes, du plus ancien au plus récent usage."""
+
+    def __init__(self, max_conversations: int = 256):
+        self.max_conversations = max_conversations
+        self._entries = OrderedDict()  # conversation_id -> (messages, token_counts, version)
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str, updated_at) -> list[dict] | None:
+        """
+        Historique (copie) d'une conversation, ou None si elle n'est pas en
+        cache ou si la conversation a changé depuis (updated_at différent).
+        """
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            if entry[2] != _as_version(updated_at):
+                del self._entries[conversation_id]
+                return None
+            self._entries.move_to_end(conversation_id)
+            return [dict(message) for message in entry[0]]
+
+    def tokens(self, conversation_id: str) -> int:
+        """Total des tokens de l'historique en cache (0 si absent)."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            return sum(entry[1]) if entry else 0
+
+    def put(self, conversation_id: str, messages: list[dict], updated_at) -> None:
+        """Met en cache l'historique complet lu depuis la base, à la date updated_at."""
+        if self.max_conversations <= 0:
+            return
+        history = [{"role": m["role"], "content": m["content"]} for m in messages]
+        token_counts = [count_tokens(m["content"]) for m in history]
+        with self._lock:
+            self._entries[conversation_id] = (history, token_counts, _as_version(updated_at))
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+
+    def append(self, conversation_id: str, role: str, content: str) -> None:
+        """Write-through : ajoute un message sauvegardé à un historique déjà en cache."""
+        tokens = count_tokens(content)
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            entry[0].append({"role": role, "content": content})
+            entry[1].append(tokens)
+            self._entries.move_to_end(conversation_id)
+
+    def touch(self, conversation_id: str, updated_at) -> None:
+        """Nouvelle date de la conversation après nos propres écritures."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None:
+                self._entries[conversation_id] = (entry[0], entry[1], _as_version(updated_at))
+
+    def invalidate(self, conversation_id: str) -> None:
+        """Retire une conversation du cache (suppression, erreur d'écriture...)."""
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,63 @@
+"""
+MILARIPPA - Sérialisation JSON rapide
+=====================================
+Remplace le JSON par défaut de Flask (jsonify, request.json) par orjson,
+nettement plus rapide sur les longues listes de messages.
+
+Les réponses (jsonify) suivent le fournisseur par défaut de Flask : clés
+triées (sort_keys, désactivable via app.json.sort_keys = False), dates au
+format HTTP (http_date), indentation en mode debug (compact). Seule
+différence : les caractères non ASCII partent en UTF-8 au lieu d'échappements
+\\uXXXX (même JSON une fois décodé, plus court) ; une réponse ASCII est
+identique octet pour octet. dumps() produit le même JSON, sans espaces.
+"""
+
+import decimal
+from datetime import date
+
+import orjson
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+
+# Dates passées à _default (orjson les écrirait en ISO 8601, Flask en date HTTP)
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def _default(obj):
+    """Types non gérés nativement par orjson (mêmes conversions que Flask)."""
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """Fournisseur JSON de Flask basé sur orjson."""
+
+    sort_keys = True   # Comme DefaultJSONProvider
+    compact = None     # None : indenté en mode debug, compact sinon
+    mimetype = "application/json"
+
+    def _options(self, sort_keys: bool, indent: bool) -> int:
+        options = ORJSON_OPTIONS
+        if sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs) -> str:
+        options = self._options(kwargs.get("sort_keys", self.sort_keys), kwargs.get("indent") is not None)
+        return orjson.dumps(obj, default=_default, option=options).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        data = orjson.dumps(obj, default=_default, option=self._options(self.sort_keys, indent))
+        return self._app.response_class(data + b"\n", mimetype=self.mimetype)
@@ -2,28 +2,90 @@
 MILAREPA - Serveur Flask
 =========================
 Interface web pour discuter avec Milarepa.
-Historique sauvegardé dans Supabase.
+Historique sauvegardé dans Supabase, ou dans SQLite (STORAGE_BACKEND=sqlite).
 """
 
 import os
 import sys
-import json
+import time
 import hashlib
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify
+import hmac
+import threading
+from functools import wraps
+from flask import Flask, Response, abort, render_template, request, jsonify, stream_with_context
 from dotenv import load_dotenv
-from supabase import create_client
+from werkzeug.serving import make_server
 
 # Add app directory to path for relative imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from rag import generate_response
+import rag
+from rag import generate_response, generate_batch_responses, get_index_manager, storage, RETRIEVAL_BACKEND
+from history_cache import HistoryCache, count_tokens
+from json_provider import OrjsonProvider
+from assets import asset_url, send_asset
+from compression import compress_response
 
 load_dotenv()
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+app.jinja_env.globals["asset_url"] = asset_url
+app.after_request(compress_response)  # JSON > COMPRESS_MIN_BYTES en gzip
 
-# Clients
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Jeton des routes /admin/* (vide : routes désactivées)
+MAX_BATCH_QUESTIONS = 500  # Limite d'un appel /api/chat/batch (max 2048 entrées côté OpenAI)
+WARMUP_ATTEMPTS = 3        # Au-delà, statut "degraded" (toujours 503) et nouvelles tentatives plus espacées
+WARMUP_RETRY_SECONDS = 10
+WARMUP_DEGRADED_RETRY_SECONDS = 60
+WARMUP_MAX_ERRORS = 10     # Dernières erreurs gardées dans /readyz
+
+# Historiques des conversations actives (évite de relire `messages` à chaque question)
+history_cache = HistoryCache(max_conversations=int(os.getenv("HISTORY_CACHE_SIZE", 256)))
+
+
+# Préchauffage au démarrage (voir /readyz)
+warmup_state = {"status": "pending", "steps": {}, "errors": [], "seconds": None}
+_warmup_lock = threading.Lock()  # Pris une fois pour toutes par le premier start_warm_up()
+
+
+def run_warm_up():
+    """
+    Prépare tout ce que la première question paierait, en réessayant si un
+    service répond mal. Après WARMUP_ATTEMPTS échecs, l'app est "degraded"
+    (non prête) et réessaie jusqu'à ce que le préchauffage passe.
+    """
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            steps = rag.warm_up()
+            step = time.perf_counter()
+            count_tokens("Milarepa")  # Tokenizer de l'historique
+            app.jinja_env.get_template("index.html")
+            steps["templates"] = round(time.perf_counter() - step, 3)
+            warmup_state.update(status="ready", steps=steps)
+            break
+        except Exception as e:
+            print(f"⚠️  Préchauffage, tentative {attempt} : {e}")
+            warmup_state["errors"] = (warmup_state["errors"] + [str(e)])[-WARMUP_MAX_ERRORS:]
+            if attempt < WARMUP_ATTEMPTS:
+                time.sleep(WARMUP_RETRY_SECONDS)
+                continue
+            if warmup_state["status"] != "degraded":
+                warmup_state["status"] = "degraded"
+                print(f"🔥 Préchauffage degraded après {attempt} tentatives : nouvel essai toutes les "
+                      f"{WARMUP_DEGRADED_RETRY_SECONDS}s")
+            time.sleep(WARMUP_DEGRADED_RETRY_SECONDS)
+
+    warmup_state["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"🔥 Préchauffage {warmup_state['status']} en {warmup_state['seconds']}s {warmup_state['steps']}")
+
+
+def start_warm_up():
+    """Lance le préchauffage en arrière-plan (une seule fois par process, même entre threads)."""
+    if _warmup_lock.acquire(blocking=False):
+        threading.Thread(target=run_warm_up, name="warm-up", daemon=True).start()
 
 
 def get_user_id():
@@ -38,6 +100,28 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/assets/<path:filename>")
+def asset(filename):
+    """Fichiers statiques construits par scripts/build_static.py (noms versionnés, cache immuable)."""
+    return send_asset(filename)
+
+
+# ===== SANTÉ =====
+
+@app.route("/healthz")
+def healthz():
+    """Liveness : le process répond (aucun appel externe)."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness : 200 une fois le préchauffage réussi, 503 avant ou s'il échoue (degraded)."""
+    start_warm_up()  # Serveur WSGI qui n'exécute pas __main__ : la première sonde lance le préchauffage
+    code = 200 if warmup_state["status"] == "ready" else 503
+    return jsonify(warmup_state), code
+
+
 # ===== ENDPOINTS CONVERSATIONS =====
 
 @app.route("/api/conversations", methods=["GET"])
@@ -45,8 +129,7 @@ def get_conversations():
     """Récupère toutes les conversations de l'utilisateur."""
     try:
         user_id = get_user_id()
-        result = supabase.table("conversations").select("*").eq("user_id", user_id).order("updated_at", desc=True).execute()
-        return jsonify(result.data)
+        return jsonify(storage.list_conversations(user_id))
     except Exception as e:
         print(f"❌ Erreur: {e}")
         return jsonify({"error": str(e)}), 500
@@ -60,12 +143,9 @@ def create_conversation():
         data = request.json
         title = data.get("title", "Nouvelle conversation")
         
-        result = supabase.table("conversations").insert({
-            "user_id": user_id,
-            "title": title
-        }).execute()
+        conversation = storage.create_conversation(user_id, title)
         
-        return jsonify(result.data[0]), 201
+        return jsonify(conversation), 201
     except Exception as e:
         print(f"❌ Erreur: {e}")
         return jsonify({"error": str(e)}), 500
@@ -75,21 +155,11 @@ def create_conversation():
 def get_messages(conversation_id):
     """Récupère tous les messages d'une conversation."""
     try:
-        result = supabase.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at").execute()
+        # sources déjà décodées (colonne JSONB Supabase, JSON décodé par SQLiteStorage)
+        messages = storage.get_messages(conversation_id)
         
         print(f"📥 GET /api/conversations/{conversation_id}/messages")
-        print(f"   Résultat Supabase: {len(result.data)} messages trouvés")
-        
-        # Convertir sources JSON
-        messages = []
-        for msg in result.data:
-            if msg.get("sources"):
-                try:
-                    msg["sources"] = json.loads(msg["sources"]) if isinstance(msg["sources"], str) else msg["sources"]
-                except Exception as e:
-                    print(f"   ⚠️  Erreur parsing sources: {e}")
-                    msg["sources"] = []
-            messages.append(msg)
+        print(f"   Résultat {storage.__class__.__name__}: {len(messages)} messages trouvés")
         
         print(f"   ✓ {len(messages)} messages retournés au frontend")
         return jsonify(messages)
@@ -104,7 +174,8 @@ def get_messages(conversation_id):
 def delete_conversation(conversation_id):
     """Supprime une conversation et ses messages."""
     try:
-        supabase.table("conversations").delete().eq("id", conversation_id).execute()
+        storage.delete_conversation(conversation_id)
+        history_cache.invalidate(conversation_id)
         return jsonify({"status": "ok"})
     except Exception as e:
         print(f"❌ Erreur: {e}")
@@ -131,10 +202,18 @@ def chat():
         print(f"   Question: {question[:60]}...")
         print(f"   Conversation ID: {conversation_id}")
         
-        # Récupérer l'historique des messages
-        messages_result = supabase.table("messages").select("role, content").eq("conversation_id", conversation_id).order("created_at").execute()
-        history = messages_result.data if messages_result.data else []
-        print(f"   📋 Historique: {len(history)} messages")
+        conv = storage.get_conversation(conversation_id)
+        if conv is None:
+            return jsonify({"error": "Conversation introuvable"}), 404
+        
+        # Récupérer l'historique des messages (cache si la conversation n'a pas changé, sinon stockage)
+        history = history_cache.get(conversation_id, conv["updated_at"])
+        if history is None:
+            history = storage.get_history(conversation_id)
+            history_cache.put(conversation_id, history, conv["updated_at"])
+            print(f"   📋 Historique: {len(history)} messages (stockage)")
+        else:
+            print(f"   📋 Historique: {len(history)} messages (cache, {history_cache.tokens(conversation_id)} tokens)")
         
         # Générer la réponse RAG
         print(f"   🤖 Génération réponse RAG...")
@@ -143,32 +222,24 @@ def chat():
         
         # Sauvegarder le message utilisateur
         print(f"   💾 Sauvegarde message utilisateur...")
-        user_msg_result = supabase.table("messages").insert({
-            "conversation_id": conversation_id,
-            "role": "user",
-            "content": question
-        }).execute()
-        print(f"   ✓ Message utilisateur sauvegardé (ID: {user_msg_result.data[0].get('id', '?') if user_msg_result.data else 'erreur'})")
+        user_msg = storage.add_message(conversation_id, "user", question)
+        history_cache.append(conversation_id, "user", question)
+        print(f"   ✓ Message utilisateur sauvegardé (ID: {user_msg.get('id', 'erreur')})")
         
         # Sauvegarder la réponse
         print(f"   💾 Sauvegarde réponse assistant...")
-        sources_json = json.dumps(result.get("sources", []))
-        assistant_msg_result = supabase.table("messages").insert({
-            "conversation_id": conversation_id,
-            "role": "assistant",
-            "content": result["answer"],
-            "sources": sources_json
-        }).execute()
-        print(f"   ✓ Réponse assistant sauvegardée (ID: {assistant_msg_result.data[0].get('id', '?') if assistant_msg_result.data else 'erreur'})")
+        assistant_msg = storage.add_message(conversation_id, "assistant", result["answer"], result.get("sources", []))
+        history_cache.append(conversation_id, "assistant", result["answer"])
+        print(f"   ✓ Réponse assistant sauvegardée (ID: {assistant_msg.get('id', 'erreur')})")
         
         # Mettre à jour le titre si c'est le premier message
-        conv = supabase.table("conversations").select("title").eq("id", conversation_id).execute()
-        if conv.data and conv.data[0]["title"] == "Nouvelle conversation":
+        if conv["title"] == "Nouvelle conversation":
             title = question[:60].rstrip(".,!?") or "Nouvelle conversation"
-            supabase.table("conversations").update({"title": title, "updated_at": datetime.utcnow().isoformat()}).eq("id", conversation_id).execute()
+            updated_at = storage.touch_conversation(conversation_id, title=title)
             print(f"   ✓ Titre conversation mis à jour: '{title}'")
         else:
-            supabase.table("conversations").update({"updated_at": datetime.utcnow().isoformat()}).eq("id", conversation_id).execute()
+            updated_at = storage.touch_conversation(conversation_id)
+        history_cache.touch(conversation_id, updated_at)
         
         print(f"   ✅ Chat endpoint terminé avec succès")
         return jsonify({
@@ -177,14 +248,112 @@ def chat():
         })
     
     except Exception as e:
+        # L'historique en base peut ne plus correspondre au cache
+        history_cache.invalidate(conversation_id)
         print(f"❌ Erreur /api/chat: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/chat/batch", methods=["POST"])
+def chat_batch():
+    """
+    Pose un lot de questions sans historique (évaluations, équipe contenu).
+    Les réponses sont streamées en NDJSON, une ligne par question, dans
+    l'ordre où elles se terminent. Avec "persist": true, chaque question
+    est sauvegardée dans sa propre conversation.
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        data = {}
+    questions = data.get("questions")
+    persist = bool(data.get("persist", False))
+
+    # Une entrée invalide refuse tout le lot : les index des réponses suivent la liste envoyée
+    if not isinstance(questions, list) or not questions \
+            or not all(isinstance(q, str) and q.strip() for q in questions):
+        return jsonify({"error": "Liste de questions vide ou invalide"}), 400
+    questions = [q.strip() for q in questions]
+
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        return jsonify({"error": f"Maximum {MAX_BATCH_QUESTIONS} questions par lot"}), 400
+
+    user_id = get_user_id()
+    print(f"\n📨 POST /api/chat/batch")
+    print(f"   {len(questions)} questions (persistance: {'oui' if persist else 'non'})")
+
+    def stream():
+        done = 0
+        results = generate_batch_responses(questions)
+        try:
+            for index, result in results:
+                line = {"index": index, "question": questions[index], **result}
+                if persist and "error" not in result:
+                    try:
+                        line["conversation_id"] = save_batch_exchange(user_id, questions[index], result)
+                    except Exception as e:
+                        print(f"   ⚠️  Erreur sauvegarde question {index}: {e}")
+                        line["persist_error"] = str(e)
+                done += 1
+                yield app.json.dumps(line) + "\n"
+        except Exception as e:
+            print(f"❌ Erreur /api/chat/batch: {e}")
+            yield app.json.dumps({"error": str(e)}) + "\n"
+        finally:
+            # Client déconnecté : annule les appels Claude en attente (voir generate_batch_responses)
+            results.close()
+        print(f"   ✅ Lot terminé ({done}/{len(questions)} réponses)")
+
+    return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+
+def save_batch_exchange(user_id: str, question: str, result: dict) -> str:
+    """Sauvegarde une question du lot et sa réponse dans une nouvelle conversation."""
+    title = question[:60].rstrip(".,!?") or "Nouvelle conversation"
+    conversation_id = storage.create_conversation(user_id, title)["id"]
+
+    # Deux inserts séparés : created_at (NOW()) départage l'ordre des messages
+    storage.add_message(conversation_id, "user", question)
+    storage.add_message(conversation_id, "assistant", result["answer"], result.get("sources", []))
+    return conversation_id
+
+
+# ===== ADMIN =====
+
+def require_admin(view):
+    """Route réservée : en-tête "Authorization: Bearer <ADMIN_TOKEN>" (404 sans ADMIN_TOKEN)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            abort(404)
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"error": "Non autorisé"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.route("/admin/index", methods=["GET"])
+@require_admin
+def index_status():
+    """État de l'index de recherche servi (version active, chunks, temps de chargement)."""
+    if RETRIEVAL_BACKEND != "local":
+        return jsonify({"backend": RETRIEVAL_BACKEND})
+    try:
+        manager = get_index_manager()
+        manager.current  # Charge l'index s'il ne l'est pas encore
+        return jsonify({"backend": RETRIEVAL_BACKEND, **manager.status()})
+    except Exception as e:
+        print(f"❌ Erreur /admin/index: {e}")  # Détail dans les logs seulement
+        return jsonify({"backend": RETRIEVAL_BACKEND, "error": "Index indisponible"}), 500
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
     print("🏔️  MILARIPPA - Converse avec Milarepa")
     print(f"🌐 http://localhost:{port}\n")
-    app.run(host="0.0.0.0", port=port, debug=False)
+    # Port ouvert d'abord (le health check répond tout de suite), SDK chargés ensuite
+    server = make_server("0.0.0.0", port, app, threaded=True)
+    start_warm_up()
+    server.serve_forever()
@@ -3,59 +3,150 @@ MILARIPPA - Logique RAG
 =======================
 1. Reçoit une question
 2. Génère l'embedding de la question
-3. Cherche les passages les plus proches dans Supabase
+3. Cherche les passages les plus proches (Supabase ou index local)
 4. Envoie le tout à Claude avec le prompt Milarepa
 5. Retourne la réponse
+
+Les SDK (openai, anthropic, supabase) et numpy ne sont importés qu'au
+premier usage : le serveur ouvre son port sans les attendre, puis le
+préchauffage (warm_up) les charge en arrière-plan.
 """
 
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from openai import OpenAI
-from supabase import create_client
-import anthropic
 
-load_dotenv()
+from storage import RETRIEVAL_BACKEND, STORAGE_BACKEND, check_embedding_dimensions, create_storage
+
+if TYPE_CHECKING:
+    from vector_index import IndexManager, VectorIndex
 
-# Clients API
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
-claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+load_dotenv()
 
 # Config
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 0))  # Même valeur que pour le script 03
+check_embedding_dimensions(EMBEDDING_DIMENSIONS)  # Supabase : VECTOR(1536) seulement, refusé dès le démarrage
+EMBED_OPTIONS = {"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {}
 CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514")
 PROMPT_PATH = Path("config/milarepa_prompt.md")
 NUM_RESULTS = 5  # Nombre de passages à récupérer
+MATCH_THRESHOLD = 0.3
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))  # Appels Claude en parallèle
+
+INDEX_DIR = Path(os.getenv("INDEX_DIR", "data/index"))
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", 30))
+
+WARMUP_QUESTION = "Qui est Milarepa ?"
+
+_openai_client = None
+_claude_client = None
+_clients_lock = threading.Lock()
+_index_manager = None
+_index_manager_lock = threading.Lock()
+_system_prompt = None
+
+
+def get_openai_client():
+    """Client OpenAI (SDK importé et client créé au premier appel)."""
+    global _openai_client
+    if _openai_client is None:
+        with _clients_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _openai_client
+
+
+def get_claude_client():
+    """Client Anthropic (SDK importé et client créé au premier appel)."""
+    global _claude_client
+    if _claude_client is None:
+        with _clients_lock:
+            if _claude_client is None:
+                import anthropic
+                _claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    return _claude_client
 
 
 def load_system_prompt() -> str:
-    """Charge le prompt système de Milarepa."""
-    return PROMPT_PATH.read_text(encoding="utf-8")
+    """Prompt système de Milarepa (lu une fois par process : redémarrer après l'avoir modifié)."""
+    global _system_prompt
+    if _system_prompt is None:
+        _system_prompt = PROMPT_PATH.read_text(encoding="utf-8")
+    return _system_prompt
 
 
 def get_query_embedding(query: str) -> list[float]:
     """Génère l'embedding d'une question."""
-    response = openai_client.embeddings.create(
+    response = get_openai_client().embeddings.create(
         model=EMBEDDING_MODEL,
         input=query,
+        **EMBED_OPTIONS,
     )
     return response.data[0].embedding
 
 
+def get_query_embeddings(queries: list[str]) -> list[list[float]]:
+    """Génère les embeddings de plusieurs questions en une seule requête API."""
+    response = get_openai_client().embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=queries,
+        **EMBED_OPTIONS,
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def get_index_manager() -> "IndexManager":
+    """Gestionnaire de l'index local (un par process), qui surveille les nouvelles versions."""
+    global _index_manager
+    if _index_manager is None:
+        with _index_manager_lock:
+            if _index_manager is None:
+                from vector_index import IndexManager
+                manager = IndexManager(INDEX_DIR, poll_interval=INDEX_POLL_SECONDS)
+                manager.start_watching()
+                _index_manager = manager
+    return _index_manager
+
+
+def get_local_index() -> "VectorIndex":
+    """Snapshot actif de l'index local (la requête le garde jusqu'à la fin)."""
+    return get_index_manager().current
+
+
+# Conversations, messages et recherche Supabase (ou SQLite + index local)
+storage = create_storage(STORAGE_BACKEND, index_provider=get_local_index)
+
+
 def search_similar_chunks(query_embedding: list[float], num_results: int = NUM_RESULTS) -> list[dict]:
-    """Cherche les chunks les plus similaires dans Supabase."""
-    result = supabase.rpc("search_milarepa", {
-        "query_embedding": query_embedding,
-        "match_count": num_results,
-        "match_threshold": 0.3,
-    }).execute()
+    """Cherche les chunks les plus similaires (index local ou stockage)."""
+    if RETRIEVAL_BACKEND == "local":
+        return get_local_index().search(query_embedding, num_results, MATCH_THRESHOLD)
+    return storage.search_chunks(query_embedding, num_results, MATCH_THRESHOLD)
 
-    return result.data
+
+def search_similar_chunks_batch(query_embeddings: list[list[float]], num_results: int = NUM_RESULTS) -> list[list[dict]]:
+    """
+    Cherche les chunks de plusieurs questions en un minimum d'allers-retours
+    (search_milarepa_batch avec Supabase). Retourne une liste de résultats
+    par question, dans l'ordre des embeddings. Avec l'index local, toutes
+    les questions sont scorées en un produit matriciel.
+    """
+    if RETRIEVAL_BACKEND == "local":
+        return get_local_index().search_batch(query_embeddings, num_results, MATCH_THRESHOLD)
+    return storage.search_chunks_batch(query_embeddings, num_results, MATCH_THRESHOLD)
 
 
 def format_context(chunks: list[dict]) -> str:
-    """Formate les chunks trouvés en contexte lisible pour Claude."""
+    """
+    Formate les chunks trouvés en contexte lisible pour Claude.
+    Avec l'index local, c'est ici que les textes sont décompressés (LazyChunk).
+    """
     if not chunks:
         return "(Aucun passage pertinent trouvé dans les écrits)"
 
@@ -85,6 +176,11 @@ def generate_response(question: str, conversation_history: list[dict] = None) ->
     # 2. Recherche des passages pertinents
     chunks = search_similar_chunks(query_embedding)
 
+    return answer_with_chunks(question, chunks, conversation_history)
+
+
+def answer_with_chunks(question: str, chunks: list[dict], conversation_history: list[dict] = None) -> dict:
+    """Génère la réponse de Claude à partir des passages déjà récupérés."""
     # 3. Calculer le score de similarité moyen
     avg_similarity = 0.0
     if chunks:
@@ -103,7 +199,7 @@ def generate_response(question: str, conversation_history: list[dict] = None) ->
     messages.append({"role": "user", "content": question})
 
     # 6. Appel à Claude
-    response = claude_client.messages.create(
+    response = get_claude_client().messages.create(
         model=CLAUDE_MODEL,
         max_tokens=1024,
         system=system_prompt,
@@ -124,3 +220,67 @@ def generate_response(question: str, conversation_history: list[dict] = None) ->
             for c in chunks
         ],
     }
+
+
+def warm_up() -> dict:
+    """
+    Paie les coûts du démarrage avant la première question : prompt, index
+    local, connexions TLS vers OpenAI, Supabase et Anthropic (une question
+    fictive est vectorisée et cherchée, sans appel à Claude).
+    Retourne la durée de chaque étape (secondes) ; lève l'erreur d'une étape
+    indispensable.
+    """
+    timings = {}
+
+    def step(name, run):
+        start = time.perf_counter()
+        result = run()
+        timings[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    step("prompt", load_system_prompt)
+    if RETRIEVAL_BACKEND == "local":
+        step("index", get_local_index)
+    embedding = step("embedding", lambda: get_query_embedding(WARMUP_QUESTION))
+    step("search", lambda: search_similar_chunks(embedding))
+
+    # Connexion Anthropic seulement (liste des modèles, gratuite) : facultative
+    try:
+        step("claude", lambda: get_claude_client().models.list(limit=1))
+    except Exception as e:
+        print(f"⚠️  Préchauffage Anthropic ignoré : {e}")
+
+    return timings
+
+
+def generate_batch_responses(questions: list[str]):
+    """
+    Pipeline RAG pour un lot de questions (sans historique) :
+    un seul appel d'embeddings, recherche groupée, puis appels Claude
+    en parallèle (BATCH_CONCURRENCY au maximum).
+    Génère des tuples (index, résultat) au fur et à mesure qu'ils se terminent ;
+    en cas d'échec, le résultat contient une clé "error".
+    """
+    # 1. Embeddings de toutes les questions en une requête
+    query_embeddings = get_query_embeddings(questions)
+
+    # 2. Recherche groupée des passages
+    all_chunks = search_similar_chunks_batch(query_embeddings)
+
+    # 3. Claude, avec un parallélisme borné
+    executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY)
+    futures = {
+        executor.submit(answer_with_chunks, question, chunks): index
+        for index, (question, chunks) in enumerate(zip(questions, all_chunks))
+    }
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                yield index, future.result()
+            except Exception as e:
+                yield index, {"error": str(e)}
+    finally:
+        # Client déconnecté (générateur fermé) : les appels Claude pas encore partis
+        # sont annulés, et on n'attend pas ceux en vol (pas de `with`, qui les attendrait)
+        executor.shutdown(wait=False, cancel_futures=True)
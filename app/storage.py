@@ -0,0 +1,316 @@
+"""
+MILARIPPA - Stockage des conversations et recherche des chunks
+==============================================================
+Toutes les lectures/écritures de l'app (conversations, messages, recherche
+de chunks) passent par un objet Storage, choisi par STORAGE_BACKEND :
+
+    supabase  tables conversations/messages et RPC search_milarepa (défaut)
+    sqlite    base SQLite embarquée (WAL), recherche dans l'index local
+              construit par scripts/05_build_index.py
+
+SQLite convient à un déploiement sur une seule machine : pas d'aller-retour
+réseau, chaque écriture prend moins d'une milliseconde, et l'app tourne hors
+ligne (benchmarks, développement). Les deux backends renvoient les mêmes
+dicts que les tables Supabase (ids UUID en texte, dates ISO 8601, sources
+décodées).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+# Recherche : "supabase" (RPC search_milarepa) ou "local" (index mappé en mémoire).
+# Le stockage SQLite n'a pas de chunks : la recherche y est toujours locale.
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "local" if STORAGE_BACKEND == "sqlite" else "supabase")
+SUPABASE_VECTOR_DIM = 1536  # Colonne VECTOR(1536) et fonctions de recherche (scripts/migrations/)
+SQLITE_PATH = Path(os.getenv("SQLITE_PATH", "data/milarippa.db"))
+BATCH_SEARCH_SIZE = 50  # Questions par appel à search_milarepa_batch
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "0"))  # Candidats explorés par l'index HNSW (0 = réglage de la base)
+
+# Même schéma que scripts/migrations/ (sans les chunks, servis par l'index local)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    sources TEXT,                 -- JSON
+    created_at TEXT NOT NULL
+);
+
+-- Liste des conversations d'un utilisateur, les plus récentes d'abord
+CREATE INDEX IF NOT EXISTS conversations_user_updated_idx ON conversations(user_id, updated_at DESC);
+-- Messages d'une conversation dans l'ordre
+CREATE INDEX IF NOT EXISTS messages_conversation_created_idx ON messages(conversation_id, created_at);
+"""
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def check_embedding_dimensions(dimensions: int, retrieval_backend: str = RETRIEVAL_BACKEND) -> None:
+    """
+    Refuse des dimensions réduites (EMBEDDING_DIMENSIONS) avec la recherche
+    Supabase : la colonne et les fonctions RPC attendent des vecteurs de
+    SUPABASE_VECTOR_DIM dimensions. L'index local accepte toute dimension.
+    """
+    if dimensions and dimensions != SUPABASE_VECTOR_DIM and retrieval_backend != "local":
+        raise ValueError(
+            f"EMBEDDING_DIMENSIONS={dimensions} incompatible avec Supabase (VECTOR({SUPABASE_VECTOR_DIM})) : "
+            f"utilise RETRIEVAL_BACKEND=local ou EMBEDDING_DIMENSIONS=0"
+        )
+
+
+class Storage(ABC):
+    """Opérations de l'app sur les conversations, les messages et les chunks."""
+
+    @abstractmethod
+    def list_conversations(self, user_id: str) -> list[dict]:
+        """Conversations d'un utilisateur, de la plus récemment mise à jour à la plus ancienne."""
+
+    @abstractmethod
+    def create_conversation(self, user_id: str, title: str) -> dict:
+        ...
+
+    @abstractmethod
+    def get_conversation(self, conversation_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def touch_conversation(self, conversation_id: str, title: str | None = None) -> str:
+        """Met à jour updated_at (et le titre s'il est donné), retourne la nouvelle valeur."""
+
+    @abstractmethod
+    def delete_conversation(self, conversation_id: str) -> None:
+        """Supprime une conversation et ses messages."""
+
+    @abstractmethod
+    def get_messages(self, conversation_id: str) -> list[dict]:
+        """Messages complets d'une conversation, dans l'ordre."""
+
+    @abstractmethod
+    def get_history(self, conversation_id: str) -> list[dict]:
+        """Historique (role, content) d'une conversation, dans l'ordre."""
+
+    @abstractmethod
+    def add_message(self, conversation_id: str, role: str, content: str, sources: list | None = None) -> dict:
+        ...
+
+    @abstractmethod
+    def search_chunks(self, query_embedding: list[float], num_results: int, match_threshold: float) -> list[dict]:
+        """Chunks les plus proches d'une question (similarité cosinus)."""
+
+    def search_chunks_batch(self, query_embeddings: list[list[float]], num_results: int,
+                            match_threshold: float) -> list[list[dict]]:
+        """Résultats de plusieurs questions, dans l'ordre des embeddings."""
+        return [self.search_chunks(e, num_results, match_threshold) for e in query_embeddings]
+
+
+class SupabaseStorage(Storage):
+    """Tables et fonctions RPC Supabase (voir scripts/migrations/)."""
+
+    def __init__(self, url: str, key: str):
+        self.url = url
+        self.key = key
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Client Supabase, créé au premier appel (le SDK est long à importer)."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from supabase import create_client
+                    self._client = create_client(self.url, self.key)
+        return self._client
+
+    def list_conversations(self, user_id: str) -> list[dict]:
+        return self.client.table("conversations").select("*").eq("user_id", user_id).order("updated_at", desc=True).execute().data
+
+    def create_conversation(self, user_id: str, title: str) -> dict:
+        return self.client.table("conversations").insert({"user_id": user_id, "title": title}).execute().data[0]
+
+    def get_conversation(self, conversation_id: str) -> dict | None:
+        result = self.client.table("conversations").select("*").eq("id", conversation_id).execute()
+        return result.data[0] if result.data else None
+
+    def touch_conversation(self, conversation_id: str, title: str | None = None) -> str:
+        values = {"updated_at": utc_now()}
+        if title is not None:
+            values["title"] = title
+        self.client.table("conversations").update(values).eq("id", conversation_id).execute()
+        return values["updated_at"]
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        self.client.table("conversations").delete().eq("id", conversation_id).execute()
+
+    def get_messages(self, conversation_id: str) -> list[dict]:
+        # sources est une colonne JSONB : déjà décodée par Supabase
+        return self.client.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at").execute().data
+
+    def get_history(self, conversation_id: str) -> list[dict]:
+        result = self.client.table("messages").select("role, content").eq("conversation_id", conversation_id).order("created_at").execute()
+        return result.data or []
+
+    def add_message(self, conversation_id: str, role: str, content: str, sources: list | None = None) -> dict:
+        row = {"conversation_id": conversation_id, "role": role, "content": content}
+        if sources is not None:
+            row["sources"] = sources
+        result = self.client.table("messages").insert(row).execute()
+        return result.data[0] if result.data else {}
+
+    @staticmethod
+    def _search_options() -> dict:
+        # Omis par défaut : les fonctions (migration 006) gardent alors le hnsw.ef_search de la base
+        return {"ef_search": HNSW_EF_SEARCH} if HNSW_EF_SEARCH else {}
+
+    def search_chunks(self, query_embedding: list[float], num_results: int, match_threshold: float) -> list[dict]:
+        return self.client.rpc("search_milarepa", {
+            "query_embedding": query_embedding,
+            "match_count": num_results,
+            "match_threshold": match_threshold,
+            **self._search_options(),
+        }).execute().data
+
+    def search_chunks_batch(self, query_embeddings: list[list[float]], num_results: int,
+                            match_threshold: float) -> list[list[dict]]:
+        """search_milarepa_batch traite BATCH_SEARCH_SIZE questions par appel RPC."""
+        results = [[] for _ in query_embeddings]
+
+        for start in range(0, len(query_embeddings), BATCH_SEARCH_SIZE):
+            batch = query_embeddings[start:start + BATCH_SEARCH_SIZE]
+            response = self.client.rpc("search_milarepa_batch", {
+                "query_embeddings": batch,
+                "match_count": num_results,
+                "match_threshold": match_threshold,
+                **self._search_options(),
+            }).execute()
+
+            for row in response.data:
+                results[start + row.pop("query_index")].append(row)
+
+        return results
+
+
+class SQLiteStorage(Storage):
+    """
+    Base SQLite embarquée, une connexion par thread (WAL : les lectures ne
+    bloquent pas l'écriture en cours, plusieurs workers peuvent partager le
+    fichier). La recherche de chunks passe par l'index local, fourni par
+    index_provider (une fonction qui renvoie le VectorIndex actif).
+    """
+
+    def __init__(self, path: Path, index_provider=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.index_provider = index_provider
+        self._local = threading.local()
+        self.connection().executescript(SQLITE_SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit : chaque requête est sa propre transaction
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")  # Durable à chaque checkpoint, suffisant en WAL
+            connection.execute("PRAGMA foreign_keys=ON")     # ON DELETE CASCADE des messages
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+        return connection
+
+    def _rows(self, sql: str, params: tuple = ()) -> list[dict]:
+        return [dict(row) for row in self.connection().execute(sql, params)]
+
+    @staticmethod
+    def _decode_message(message: dict) -> dict:
+        if message.get("sources") is not None:
+            message["sources"] = json.loads(message["sources"])
+        return message
+
+    def list_conversations(self, user_id: str) -> list[dict]:
+        return self._rows("SELECT * FROM conversations WHERE user_id = ? ORDER BY updated_at DESC", (user_id,))
+
+    def create_conversation(self, user_id: str, title: str) -> dict:
+        now = utc_now()
+        conversation = {"id": str(uuid.uuid4()), "title": title, "user_id": user_id, "created_at": now, "updated_at": now}
+        self.connection().execute(
+            "INSERT INTO conversations (id, title, user_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            tuple(conversation.values()),
+        )
+        return conversation
+
+    def get_conversation(self, conversation_id: str) -> dict | None:
+        rows = self._rows("SELECT * FROM conversations WHERE id = ?", (conversation_id,))
+        return rows[0] if rows else None
+
+    def touch_conversation(self, conversation_id: str, title: str | None = None) -> str:
+        now = utc_now()
+        if title is None:
+            self.connection().execute("UPDATE conversations SET updated_at = ? WHERE id = ?", (now, conversation_id))
+        else:
+            self.connection().execute("UPDATE conversations SET title = ?, updated_at = ? WHERE id = ?",
+                                      (title, now, conversation_id))
+        return now
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        self.connection().execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def get_messages(self, conversation_id: str) -> list[dict]:
+        # rowid départage deux messages insérés dans la même microseconde
+        rows = self._rows("SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at, rowid", (conversation_id,))
+        return [self._decode_message(row) for row in rows]
+
+    def get_history(self, conversation_id: str) -> list[dict]:
+        return self._rows("SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY created_at, rowid",
+                          (conversation_id,))
+
+    def add_message(self, conversation_id: str, role: str, content: str, sources: list | None = None) -> dict:
+        message = {
+            "id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "role": role,
+            "content": content,
+            "sources": sources,
+            "created_at": utc_now(),
+        }
+        self.connection().execute(
+            "INSERT INTO messages (id, conversation_id, role, content, sources, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (message["id"], conversation_id, role, content,
+             json.dumps(sources, ensure_ascii=False) if sources is not None else None, message["created_at"]),
+        )
+        return message
+
+    def search_chunks(self, query_embedding: list[float], num_results: int, match_threshold: float) -> list[dict]:
+        return self.index_provider().search(query_embedding, num_results, match_threshold)
+
+    def search_chunks_batch(self, query_embeddings: list[list[float]], num_results: int,
+                            match_threshold: float) -> list[list[dict]]:
+        return self.index_provider().search_batch(query_embeddings, num_results, match_threshold)
+
+
+def create_storage(backend: str = STORAGE_BACKEND, index_provider=None) -> Storage:
+    """Storage du backend demandé ("supabase" ou "sqlite")."""
+    if backend == "sqlite":
+        print(f"🗄️  Stockage SQLite : {SQLITE_PATH}")
+        return SQLiteStorage(SQLITE_PATH, index_provider=index_provider)
+    if backend == "supabase":
+        return SupabaseStorage(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    raise ValueError(f"STORAGE_BACKEND inconnu : {backend} (supabase ou sqlite)")
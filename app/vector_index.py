@@ -0,0 +1,441 @@
+"""
+MILARIPPA - Index vectoriel local (memory-mapped)
+=================================================
+Index de recherche servi directement depuis des fichiers binaires mappés
+en mémoire, en lecture seule. Tous les workers d'une même machine partagent
+les mêmes pages (cache du noyau) : la mémoire physique est payée une seule
+fois, et un nouveau worker est prêt en quelques millisecondes.
+
+Format d'un index (un dossier) :
+    vectors.npy       float32 (n, dim), vecteurs normalisés (norme L2 = 1)
+    meta.bin          enregistrements JSON UTF-8 concaténés (un par chunk, sans le texte)
+    meta_offsets.npy  int64 (n + 1), début de chaque enregistrement dans meta.bin
+    texts.zst         textes des chunks, une trame zstd par chunk
+    texts_offsets.npy int64 (n + 1), début de chaque trame dans texts.zst
+    texts.dict        dictionnaire zstd entraîné sur le corpus (si assez de chunks)
+    prefix.npy        float32 (n, prefix_dim), début de chaque vecteur renormalisé
+                      (recherche en deux temps, absent des anciens index)
+    index.json        description (nombre de chunks, dimension, modèle...)
+
+Les embeddings text-embedding-3 sont entraînés « Matryoshka » : leurs
+premières dimensions, renormalisées, forment déjà un bon embedding. La
+recherche score donc tous les chunks sur ce préfixe (prefix.npy, 6 fois plus
+petit en 256 dimensions sur 1536), puis re-score les meilleurs candidats avec
+les vecteurs complets pour retrouver l'ordre exact.
+
+Les textes restent compressés sur disque : une recherche renvoie des
+LazyChunk, dont le "texte" n'est décompressé qu'à la lecture (dans
+format_context), avec un petit LRU des textes les plus demandés. La mémoire
+du process est ainsi dominée par les vecteurs. Les index plus anciens
+(texte dans meta.bin) restent lisibles.
+
+Les index sont publiés en snapshots versionnés (INDEX_DIR/<version>/), le
+fichier INDEX_DIR/CURRENT désignant la version active. IndexManager surveille
+ce fichier, charge la nouvelle version en arrière-plan puis la substitue
+d'un coup : les requêtes en cours terminent sur l'ancien snapshot.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import zstandard
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.bin"
+OFFSETS_FILE = "meta_offsets.npy"
+INFO_FILE = "index.json"
+PREFIX_FILE = "prefix.npy"
+TEXTS_FILE = "texts.zst"
+TEXT_OFFSETS_FILE = "texts_offsets.npy"
+TEXT_DICT_FILE = "texts.dict"
+CURRENT_FILE = "CURRENT"
+
+# Recherche en deux temps
+PREFIX_DIM = 256       # Dimensions du préfixe (0 : pas de préfixe, recherche exacte)
+# Candidats re-scorés : max(num_results * RERANK_FACTOR, MIN_CANDIDATES), bornés par le
+# nombre de chunks. Le plancher ne sert qu'aux petits num_results (k=5 : 50 candidats)
+RERANK_FACTOR = 10
+MIN_CANDIDATES = 20
+
+# Textes compressés
+ZSTD_LEVEL = 19             # Compression à la construction (lente), décompression toujours rapide
+ZSTD_DICT_SIZE = 112_640    # Taille du dictionnaire entraîné (défaut de zstd)
+TEXT_CACHE_SIZE = int(os.getenv("TEXT_CACHE_SIZE", 256))  # Textes décompressés gardés en LRU
+
+# Préchauffage d'un snapshot : le préfixe (lu en entier à chaque recherche) seulement ;
+# INDEX_WARM_FULL=1 lit aussi tous les vecteurs complets (lecture séquentielle de tout le fichier)
+INDEX_WARM_FULL = os.getenv("INDEX_WARM_FULL", "0") == "1"
+
+# Champs conservés pour chaque chunk (mêmes colonnes que search_milarepa)
+META_FIELDS = ("id", "source", "langue", "section", "type", "texte", "tokens")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Normalise des vecteurs (ligne par ligne) pour que produit scalaire = cosinus."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _map_file(path: Path):
+    """Contenu d'un fichier mappé en lecture seule (b"" pour un fichier vide)."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+
+class LazyChunk(dict):
+    """
+    Métadonnées d'un chunk dont le "texte" est lu dans l'index au premier
+    accès (chunk["texte"] ou chunk.get("texte")), puis gardé dans le dict.
+    """
+
+    def __init__(self, fields: dict, index: "VectorIndex", row: int):
+        super().__init__(fields)
+        self._index = index
+        self._row = row
+
+    def __missing__(self, key):
+        if key != "texte":
+            raise KeyError(key)
+        text = self._index.text(self._row)
+        self["texte"] = text
+        return text
+
+    def get(self, key, default=None):
+        if key == "texte" or key in self:
+            return self[key]
+        return default
+
+
+class VectorIndex:
+    """Index en lecture seule, mappé en mémoire depuis un dossier."""
+
+    def __init__(self, path: Path, version: str = ""):
+        self.path = Path(path)
+        self.version = version
+        self.info = json.loads((self.path / INFO_FILE).read_text(encoding="utf-8"))
+        self.vectors = np.load(self.path / VECTORS_FILE, mmap_mode="r")
+        self.offsets = np.load(self.path / OFFSETS_FILE, mmap_mode="r")
+        prefix_path = self.path / PREFIX_FILE
+        self.prefix = np.load(prefix_path, mmap_mode="r") if prefix_path.exists() else None
+
+        self._meta = _map_file(self.path / META_FILE)
+
+        # Textes compressés (absents des index construits avant leur introduction)
+        self.compressed = (self.path / TEXTS_FILE).exists()
+        if self.compressed:
+            self._texts = _map_file(self.path / TEXTS_FILE)
+            self.text_offsets = np.load(self.path / TEXT_OFFSETS_FILE, mmap_mode="r")
+            dict_path = self.path / TEXT_DICT_FILE
+            dict_data = zstandard.ZstdCompressionDict(dict_path.read_bytes()) if dict_path.exists() else None
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        self._text_cache = OrderedDict()  # row -> texte décompressé
+        self._text_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def warm_up(self, full: bool = False, block_rows: int = 4096) -> None:
+        """
+        Amène le préfixe en mémoire avant de servir : chaque recherche le lit
+        en entier, alors que les vecteurs complets ne sont lus que pour les
+        candidats (pages chargées à la demande par le mmap). full=True lit
+        aussi tous les vecteurs complets.
+        """
+        for start in range(0, len(self), block_rows):
+            if self.prefix is not None:
+                float(np.sum(self.prefix[start:start + block_rows]))
+            if full:
+                float(np.sum(self.vectors[start:start + block_rows]))
+
+    def record(self, row: int) -> dict:
+        """Métadonnées d'un chunk (décodées à la demande), texte compris ou différé."""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        fields = json.loads(self._meta[start:end])
+        return LazyChunk(fields, self, row) if self.compressed else fields
+
+    def text(self, row: int) -> str:
+        """Texte d'un chunk, décompressé à la demande (LRU des TEXT_CACHE_SIZE derniers)."""
+        with self._text_lock:
+            text = self._text_cache.get(row)
+            if text is not None:
+                self._text_cache.move_to_end(row)
+                return text
+
+            # Le décompresseur n'est pas utilisable par deux threads à la fois
+            start, end = int(self.text_offsets[row]), int(self.text_offsets[row + 1])
+            text = self._decompressor.decompress(self._texts[start:end]).decode("utf-8")
+            if TEXT_CACHE_SIZE > 0:
+                self._text_cache[row] = text
+                if len(self._text_cache) > TEXT_CACHE_SIZE:
+                    self._text_cache.popitem(last=False)
+            return text
+
+    def search(self, query_embedding: list[float], num_results: int, match_threshold: float) -> list[dict]:
+        """Recherche exacte par similarité cosinus, comme search_milarepa."""
+        return self.search_batch([query_embedding], num_results, match_threshold)[0]
+
+    def search_batch(self, query_embeddings: list[list[float]], num_results: int, match_threshold: float) -> list[list[dict]]:
+        """
+        Recherche de plusieurs questions en un seul produit matriciel.
+        Avec un préfixe, les num_results * RERANK_FACTOR meilleurs chunks du
+        préfixe sont re-scorés avec les vecteurs complets : les similarités
+        renvoyées sont toujours les cosinus exacts.
+        """
+        if not query_embeddings:
+            return []
+        if len(self) == 0:
+            return [[] for _ in query_embeddings]
+
+        queries = normalize(query_embeddings)
+        candidates = self.shortlist(queries, num_results)
+        if candidates is None:
+            scores = queries @ self.vectors.T  # (questions, chunks)
+            candidates = [None] * len(queries)
+        else:
+            # Scores exacts des seuls candidats de chaque question
+            scores = [self.vectors[rows] @ query for query, rows in zip(queries, candidates)]
+
+        results = []
+        for row_scores, rows in zip(scores, candidates):
+            k = min(num_results, len(row_scores))
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            chunks = []
+            for row in top:
+                if row_scores[row] > match_threshold:
+                    chunk = self.record(int(row if rows is None else rows[row]))
+                    chunk["similarity"] = float(row_scores[row])
+                    chunks.append(chunk)
+            results.append(chunks)
+        return results
+
+    def shortlist(self, queries: np.ndarray, num_results: int) -> list[np.ndarray] | None:
+        """
+        Candidats de chaque question d'après le préfixe (lignes triées, pour
+        des lectures séquentielles dans vectors.npy), ou None quand il faut
+        tout scorer : pas de préfixe, ou moins de chunks que de candidats.
+        Nombre de candidats : max(num_results * RERANK_FACTOR, MIN_CANDIDATES).
+        """
+        count = max(num_results * RERANK_FACTOR, MIN_CANDIDATES)
+        if self.prefix is None or count >= len(self):
+            return None
+
+        prefix_queries = normalize(queries[:, :self.prefix.shape[1]])
+        scores = prefix_queries @ self.prefix.T  # (questions, chunks)
+        top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        return list(np.sort(top, axis=1))
+
+
+def _replace_atomically(path: Path, write) -> None:
+    """Écrit un fichier à côté puis le renomme : les lecteurs voient l'ancien ou le nouveau."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def build_index(chunks: list[dict], output_dir: Path, embedding_model: str = "",
+                vectors: np.ndarray | None = None, prefix_dim: int = PREFIX_DIM,
+                compress_texts: bool = True) -> dict:
+    """
+    Construit un index à partir de chunks et de leurs vecteurs (matrice
+    alignée sur les chunks, sinon champ "embedding" de chaque chunk).
+    prefix.npy n'est écrit que si prefix_dim est plus petit que la dimension.
+    Avec compress_texts, les textes vont dans texts.zst plutôt que dans meta.bin.
+    Retourne la description écrite dans index.json.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if vectors is None:
+        dim = len(chunks[0]["embedding"]) if chunks else 0
+        vectors = np.empty((len(chunks), dim), dtype=np.float32)
+        for row, chunk in enumerate(chunks):
+            vectors[row] = chunk["embedding"]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1] if vectors.ndim == 2 else 0
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    records = []
+    position = 0
+
+    fields = [f for f in META_FIELDS if f != "texte"] if compress_texts else META_FIELDS
+    for row, chunk in enumerate(chunks):
+        record = json.dumps({field: chunk.get(field) for field in fields}, ensure_ascii=False).encode("utf-8")
+        records.append(record)
+        position += len(record)
+        offsets[row + 1] = position
+
+    vectors = normalize(vectors) if len(chunks) else vectors
+    use_prefix = 0 < prefix_dim < dim
+
+    info = {
+        "count": len(chunks),
+        "dim": dim,
+        "prefix_dim": prefix_dim if use_prefix else None,
+        "compressed_texts": compress_texts,
+        "embedding_model": embedding_model,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+
+    _replace_atomically(output_dir / VECTORS_FILE, lambda f: np.save(f, vectors))
+    _replace_atomically(output_dir / OFFSETS_FILE, lambda f: np.save(f, offsets))
+    if use_prefix:
+        prefix = normalize(vectors[:, :prefix_dim])
+        _replace_atomically(output_dir / PREFIX_FILE, lambda f: np.save(f, prefix))
+    elif (output_dir / PREFIX_FILE).exists():
+        (output_dir / PREFIX_FILE).unlink()
+    if compress_texts:
+        info.update(write_texts(chunks, output_dir))
+    else:
+        for name in (TEXTS_FILE, TEXT_OFFSETS_FILE, TEXT_DICT_FILE):
+            if (output_dir / name).exists():
+                (output_dir / name).unlink()
+    _replace_atomically(output_dir / META_FILE, lambda f: f.writelines(records))
+    _replace_atomically(output_dir / INFO_FILE, lambda f: f.write(json.dumps(info, indent=2).encode("utf-8")))
+    return info
+
+
+def write_texts(chunks: list[dict], output_dir: Path) -> dict:
+    """
+    Compresse chaque texte dans sa propre trame zstd (accès direct par ligne),
+    avec un dictionnaire entraîné sur le corpus : des textes de ~1000
+    caractères compressés un par un n'ont sinon presque rien à partager.
+    Retourne les tailles brute et compressée, pour index.json.
+    """
+    texts = [(chunk.get("texte") or "").encode("utf-8") for chunk in chunks]
+    try:
+        dict_data = zstandard.train_dictionary(ZSTD_DICT_SIZE, texts, level=ZSTD_LEVEL)
+    except zstandard.ZstdError:
+        dict_data = None  # Trop peu de textes pour entraîner un dictionnaire
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    frames = []
+    for row, text in enumerate(texts):
+        frames.append(compressor.compress(text))
+        offsets[row + 1] = offsets[row] + len(frames[-1])
+
+    _replace_atomically(output_dir / TEXTS_FILE, lambda f: f.writelines(frames))
+    _replace_atomically(output_dir / TEXT_OFFSETS_FILE, lambda f: np.save(f, offsets))
+    if dict_data is not None:
+        _replace_atomically(output_dir / TEXT_DICT_FILE, lambda f: f.write(dict_data.as_bytes()))
+    elif (output_dir / TEXT_DICT_FILE).exists():
+        (output_dir / TEXT_DICT_FILE).unlink()
+    return {"text_bytes": sum(len(t) for t in texts), "compressed_text_bytes": int(offsets[-1])}
+
+
+def publish_snapshot(chunks: list[dict], root: Path, embedding_model: str = "", keep: int = 3,
+                     vectors: np.ndarray | None = None, prefix_dim: int = PREFIX_DIM) -> str:
+    """
+    Construit un nouveau snapshot dans root/<version>/, puis l'active en
+    remplaçant atomiquement root/CURRENT. Seuls les `keep` derniers snapshots
+    sont conservés (les workers qui mappent encore un ancien snapshot
+    gardent leurs fichiers ouverts jusqu'à la bascule).
+    Retourne le nom de la version publiée. Refuse de publier un index vide.
+    """
+    if not chunks:
+        raise ValueError("Aucun chunk : un snapshot vide ne remplace pas l'index actif")
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+
+    # Horodatage à la microseconde : l'ordre alphabétique suit l'ordre de publication
+    version = datetime.utcnow().strftime("v%Y%m%d-%H%M%S-%f")
+
+    build_index(chunks, root / version, embedding_model=embedding_model, vectors=vectors,
+                prefix_dim=prefix_dim)
+    _replace_atomically(root / CURRENT_FILE, lambda f: f.write(version.encode("utf-8")))
+
+    snapshots = sorted(p for p in root.iterdir() if p.is_dir() and (p / INFO_FILE).exists())
+    for old in snapshots[:-keep]:
+        if old.name != version:
+            shutil.rmtree(old, ignore_errors=True)
+    return version
+
+
+class IndexManager:
+    """
+    Snapshot actif de l'index + rechargement à chaud.
+    Un thread de surveillance relit root/CURRENT toutes les `poll_interval`
+    secondes ; une nouvelle version est chargée et préchauffée à côté de
+    l'ancienne, puis substituée en une seule affectation.
+    """
+
+    def __init__(self, root: Path, poll_interval: float = 30.0, warm_full: bool = INDEX_WARM_FULL):
+        self.root = Path(root)
+        self.poll_interval = poll_interval
+        self.warm_full = warm_full
+        self._snapshot = None
+        self._loaded_at = None
+        self._load_seconds = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def active_version(self) -> str:
+        """Version désignée par CURRENT ("" pour un index non versionné)."""
+        current = self.root / CURRENT_FILE
+        if current.exists():
+            return current.read_text(encoding="utf-8").strip()
+        return ""
+
+    @property
+    def current(self) -> VectorIndex:
+        """Snapshot à utiliser pour une requête (chargé au premier appel)."""
+        if self._snapshot is None:
+            self.reload()
+        return self._snapshot
+
+    def reload(self) -> bool:
+        """Charge la version active si elle diffère du snapshot servi."""
+        with self._lock:
+            version = self.active_version()
+            if self._snapshot is not None and self._snapshot.version == version:
+                return False
+
+            start = time.perf_counter()
+            snapshot = VectorIndex(self.root / version if version else self.root, version=version)
+            snapshot.warm_up(full=self.warm_full)
+            self._load_seconds = time.perf_counter() - start
+            self._loaded_at = datetime.utcnow().isoformat()
+            self._snapshot = snapshot  # Bascule atomique
+            print(f"📂 Index {version or '(non versionné)'} chargé : {len(snapshot)} chunks en {self._load_seconds:.2f}s")
+            return True
+
+    def start_watching(self) -> None:
+        """Démarre le thread de surveillance (une seule fois)."""
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"⚠️  Rechargement de l'index impossible : {e}")
+
+    def status(self) -> dict:
+        """État de l'index servi (pour /admin/index)."""
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "available_version": self.active_version(),
+            "chunks": len(snapshot) if snapshot else 0,
+            "dim": snapshot.info.get("dim") if snapshot else None,
+            "prefix_dim": snapshot.info.get("prefix_dim") if snapshot else None,
+            "built_at": snapshot.info.get("created_at") if snapshot else None,
+            "loaded_at": self._loaded_at,
+            "load_seconds": round(self._load_seconds, 3) if self._load_seconds is not None else None,
+        }
@@ -0,0 +1,304 @@
+"""
+MILARIPPA - Évaluation de la recherche (qualité / latence)
+==========================================================
+Vérifie qu'une optimisation de la recherche (index local, préfixe des
+vecteurs, dimensions réduites...) ramène toujours les mêmes passages.
+
+Pour chaque réglage, les questions passent par rag.search_similar_chunks()
+et on mesure :
+    recall@k   part des passages de référence retrouvés
+    nDCG@k     même chose en tenant compte du rang
+    latence    par question (moyenne, p50, p95) et en lot (search_similar_chunks_batch)
+    mémoire    pic Python (tracemalloc) et taille des fichiers de l'index lus
+
+Référence : les ids annotés dans le fichier de questions ("relevant"), sinon
+la recherche exacte en pleine précision sur l'index local.
+
+Questions : un fichier JSONL ({"question": ..., "relevant": [ids]}) ou texte
+(une question par ligne), vectorisées avec get_query_embeddings(). Sans
+fichier, --sample N prend N chunks de l'index, bruités, comme questions
+(aucun appel API).
+
+    python benchmarks/eval_retrieval.py --questions questions.jsonl
+    python benchmarks/eval_retrieval.py --sample 500 --settings exact,prefix=256:factor=10
+    python benchmarks/eval_retrieval.py --compare results/retrieval-abc.json results/retrieval-def.json
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+sys.path.insert(0, str(ROOT / "app"))
+
+import rag
+import vector_index
+from vector_index import PREFIX_FILE, VECTORS_FILE, normalize
+
+# Config par défaut
+DEFAULT_SETTINGS = "exact,prefix=128:factor=10,prefix=256:factor=5,prefix=256:factor=10,prefix=512:factor=10"
+SAMPLE_NOISE = 0.5     # Bruit relatif ajouté aux chunks tirés comme questions (--sample)
+EMBED_BATCH_SIZE = 100  # Questions par requête d'embeddings
+SEED = 0
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_questions(path: Path) -> list[dict]:
+    """Questions d'un fichier JSONL ({"question", "relevant"}) ou texte (une par ligne)."""
+    questions = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            item = json.loads(line)
+            questions.append({"question": item["question"], "relevant": item.get("relevant")})
+        else:
+            questions.append({"question": line, "relevant": None})
+    return questions
+
+
+def embed_questions(questions: list[dict]) -> np.ndarray:
+    embeddings = []
+    for start in range(0, len(questions), EMBED_BATCH_SIZE):
+        batch = questions[start:start + EMBED_BATCH_SIZE]
+        embeddings.extend(rag.get_query_embeddings([q["question"] for q in batch]))
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def sample_questions(index, count: int, noise: float) -> tuple[list[dict], np.ndarray]:
+    """Chunks de l'index tirés au hasard et bruités, en guise de questions."""
+    rng = np.random.default_rng(SEED)
+    rows = rng.choice(len(index), size=min(count, len(index)), replace=False)
+    vectors = np.asarray(index.vectors[np.sort(rows)], dtype=np.float32)
+    vectors = normalize(vectors + rng.standard_normal(vectors.shape, dtype=np.float32) * noise / math.sqrt(vectors.shape[1]))
+    return [{"question": f"(chunk {index.record(int(row))['id']})", "relevant": None} for row in np.sort(rows)], vectors
+
+
+def exact_reference(index, embeddings: np.ndarray, k: int, threshold: float) -> list[list[str]]:
+    """Ids des k meilleurs chunks par recherche exacte (tous les vecteurs, pleine précision)."""
+    vectors = np.asarray(index.vectors, dtype=np.float32)
+    reference = []
+    for query in normalize(embeddings):
+        scores = vectors @ query
+        top = np.argsort(-scores, kind="stable")[:k]
+        reference.append([index.record(int(row))["id"] for row in top if scores[row] > threshold])
+    return reference
+
+
+def recall_at_k(retrieved: list[str], relevant: list[str], k: int) -> float:
+    if not relevant:
+        return 1.0
+    return len(set(retrieved[:k]) & set(relevant)) / min(k, len(relevant))
+
+
+def ndcg_at_k(retrieved: list[str], relevant: list[str], k: int) -> float:
+    """nDCG binaire : un passage de référence vaut 1, quel que soit son rang de référence."""
+    if not relevant:
+        return 1.0
+    relevant = set(relevant)
+    dcg = sum(1 / math.log2(rank + 2) for rank, chunk_id in enumerate(retrieved[:k]) if chunk_id in relevant)
+    ideal = sum(1 / math.log2(rank + 2) for rank in range(min(k, len(relevant))))
+    return dcg / ideal
+
+
+def parse_setting(spec: str) -> dict:
+    """"exact", "supabase" ou "prefix=256:factor=10[:min=20]" (index local en deux temps)."""
+    if spec in ("exact", "supabase"):
+        return {"name": spec, "backend": "supabase" if spec == "supabase" else "local", "prefix": 0}
+    setting = {"name": spec, "backend": "local", "prefix": 0,
+               "factor": vector_index.RERANK_FACTOR, "min": vector_index.MIN_CANDIDATES}
+    for part in spec.split(":"):
+        key, _, value = part.partition("=")
+        if key not in ("prefix", "factor", "min") or not value.isdigit():
+            raise ValueError(f"Réglage invalide : {spec}")
+        setting[key] = int(value)
+    return setting
+
+
+def apply_setting(index, setting: dict, prefixes: dict) -> None:
+    """Règle le backend de rag et le préfixe de l'index local (préfixes calculés une fois)."""
+    rag.RETRIEVAL_BACKEND = setting["backend"]
+    if setting["backend"] != "local":
+        return
+    dim = setting["prefix"]
+    if dim and dim not in prefixes:
+        prefixes[dim] = normalize(np.asarray(index.vectors[:, :dim], dtype=np.float32))
+    index.prefix = prefixes.get(dim) if dim else None
+    vector_index.RERANK_FACTOR = setting.get("factor", vector_index.RERANK_FACTOR)
+    vector_index.MIN_CANDIDATES = setting.get("min", vector_index.MIN_CANDIDATES)
+
+
+def evaluate(setting: dict, index, embeddings: np.ndarray, reference: list[list[str]], k: int) -> dict:
+    queries = embeddings.tolist()
+    latencies = []
+    retrieved = []
+    gc.collect()
+    tracemalloc.start()
+    for query in queries:
+        start = time.perf_counter()
+        chunks = rag.search_similar_chunks(query, k)
+        latencies.append(time.perf_counter() - start)
+        retrieved.append([chunk["id"] for chunk in chunks])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    rag.search_similar_chunks_batch(queries, k)
+    batch_seconds = time.perf_counter() - start
+
+    recalls = [recall_at_k(r, ref, k) for r, ref in zip(retrieved, reference)]
+    ndcgs = [ndcg_at_k(r, ref, k) for r, ref in zip(retrieved, reference)]
+    latencies_ms = np.array(latencies) * 1000
+
+    index_bytes = 0
+    if setting["backend"] == "local":
+        # Fichiers effectivement parcourus : préfixe + vecteurs (re-scoring), ou vecteurs seuls
+        index_bytes = index.vectors.nbytes + (index.prefix.nbytes if index.prefix is not None else 0)
+
+    return {
+        "setting": setting,
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        f"ndcg@{k}": round(float(np.mean(ndcgs)), 4),
+        "min_recall": round(float(np.min(recalls)), 4),
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "batch_per_query": round(batch_seconds * 1000 / len(queries), 3),
+        },
+        "peak_mb": round(peak / 1_000_000, 2),
+        "index_mb": round(index_bytes / 1_000_000, 2),
+    }
+
+
+def run(args) -> dict:
+    rag.INDEX_DIR = args.index
+    rag.RETRIEVAL_BACKEND = "local"
+    index = rag.get_local_index()
+    threshold = rag.MATCH_THRESHOLD if args.threshold is None else args.threshold
+    rag.MATCH_THRESHOLD = threshold
+    print(f"📂 Index {index.version or args.index} : {len(index)} chunks, dimension {index.info.get('dim')}")
+
+    if args.questions:
+        questions = load_questions(args.questions)
+        print(f"❓ {len(questions)} questions ({args.questions}), vectorisation...")
+        embeddings = embed_questions(questions)
+    else:
+        questions, embeddings = sample_questions(index, args.sample, args.noise)
+        print(f"❓ {len(questions)} chunks tirés au hasard comme questions (bruit {args.noise})")
+
+    labeled = all(q["relevant"] for q in questions)
+    reference = [q["relevant"] for q in questions] if labeled else exact_reference(index, embeddings, args.k, threshold)
+    print(f"🎯 Référence : {'ids annotés' if labeled else 'recherche exacte'}\n")
+
+    results = []
+    prefixes = {}
+    built_prefix = index.prefix
+    print(f"   {'réglage':<32} {'recall@' + str(args.k):>10} {'nDCG':>8} {'p50':>9} {'p95':>9} {'lot':>9} {'index':>9}")
+    for setting in args.settings:
+        apply_setting(index, setting, prefixes)
+        result = evaluate(setting, index, embeddings, reference, args.k)
+        results.append(result)
+        latency = result["latency_ms"]
+        print(f"   {setting['name']:<32} {result[f'recall@{args.k}']:>10.3f} {result[f'ndcg@{args.k}']:>8.3f} "
+              f"{latency['p50']:>7.2f}ms {latency['p95']:>7.2f}ms {latency['batch_per_query']:>7.2f}ms "
+              f"{result['index_mb']:>6.1f} Mo")
+    index.prefix = built_prefix
+
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "index": {"version": index.version, "chunks": len(index), "dim": index.info.get("dim"),
+                  "prefix_dim": index.info.get("prefix_dim"),
+                  "files_mb": round(sum((index.path / name).stat().st_size for name in (VECTORS_FILE, PREFIX_FILE)
+                                        if (index.path / name).exists()) / 1_000_000, 2)},
+        "config": {
+            "questions": str(args.questions) if args.questions else None,
+            "sample": None if args.questions else len(questions),
+            "noise": None if args.questions else args.noise,
+            "reference": "labeled" if labeled else "exact",
+            "k": args.k,
+            "threshold": threshold,
+            "embedding_model": rag.EMBEDDING_MODEL,
+            "embedding_dimensions": rag.EMBEDDING_DIMENSIONS,
+        },
+        "results": results,
+    }
+
+
+def compare(old_path: Path, new_path: Path) -> None:
+    """Affiche l'évolution du recall et de la latence des réglages communs à deux rapports."""
+    old = json.loads(Path(old_path).read_text(encoding="utf-8"))
+    new = json.loads(Path(new_path).read_text(encoding="utf-8"))
+    k = new["config"]["k"]
+    before_by_name = {r["setting"]["name"]: r for r in old["results"]}
+    print(f"⚖️  {old['commit']} → {new['commit']}\n")
+    print(f"   {'réglage':<32} {'recall@' + str(k):>18} {'p50':>24}")
+    for after in new["results"]:
+        name = after["setting"]["name"]
+        before = before_by_name.get(name)
+        if before is None:
+            print(f"   {name:<32} {'(nouveau réglage)':>18}")
+            continue
+        recall_before, recall_after = before.get(f"recall@{k}", 0), after[f"recall@{k}"]
+        flag = "⚠️ " if recall_after < recall_before - 0.01 else "  "
+        print(f"   {name:<32} {recall_before:7.3f} → {recall_after:7.3f} {flag}"
+              f"{before['latency_ms']['p50']:8.2f} → {after['latency_ms']['p50']:8.2f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Qualité et latence de la recherche, par réglage")
+    parser.add_argument("--questions", type=Path, help="questions (JSONL avec \"relevant\" optionnel, ou texte)")
+    parser.add_argument("--sample", type=int, default=200, help="sans --questions : chunks tirés comme questions")
+    parser.add_argument("--noise", type=float, default=SAMPLE_NOISE, help="bruit ajouté aux chunks tirés")
+    parser.add_argument("--index", type=Path, default=rag.INDEX_DIR, help="dossier de l'index local")
+    parser.add_argument("--settings", default=DEFAULT_SETTINGS,
+                        help="réglages séparés par des virgules : exact, supabase, prefix=256:factor=10[:min=20]")
+    parser.add_argument("-k", type=int, default=rag.NUM_RESULTS, help="passages par question")
+    parser.add_argument("--threshold", type=float, help=f"seuil de similarité (défaut : {rag.MATCH_THRESHOLD})")
+    parser.add_argument("--output", type=Path, help="rapport JSON (défaut : benchmarks/results/retrieval-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("AVANT", "APRÈS"),
+                        help="compare deux rapports au lieu de lancer l'évaluation")
+    args = parser.parse_args()
+    if not args.compare:
+        args.settings = [parse_setting(spec.strip()) for spec in args.settings.split(",") if spec.strip()]
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    output = args.output or RESULTS_DIR / f"retrieval-{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n📝 Rapport : {output}")
+
+
+if __name__ == "__main__":
+    main()
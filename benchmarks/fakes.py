@@ -0,0 +1,85 @@
+"""
+MILARIPPA - Faux backends pour les benchmarks
+=============================================
+Remplacent le client OpenAI (embeddings) et le client Supabase (upload)
+des scripts 03 et 04 : mêmes appels, réponses locales, latence réseau
+simulée. On mesure ainsi le coût propre du pipeline (batching,
+sérialisation, threads), sans réseau ni clé d'API.
+"""
+
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+
+def fake_vector(text: str, dim: int) -> list[float]:
+    """Vecteur déterministe (dépend seulement du texte)."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dim, dtype=np.float32).tolist()
+
+
+class _RawEmbeddings:
+    """Équivalent de client.embeddings.with_raw_response."""
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model: str, input: list[str], **kwargs):
+        owner = self.owner
+        time.sleep(owner.latency)
+        with owner.lock:
+            owner.requests += 1
+            owner.inputs += len(input)
+        data = [SimpleNamespace(index=i, embedding=fake_vector(text, owner.dim)) for i, text in enumerate(input)]
+        return SimpleNamespace(
+            headers={"x-ratelimit-remaining-requests": "10000", "x-ratelimit-remaining-tokens": "10000000"},
+            parse=lambda: SimpleNamespace(data=data),
+        )
+
+
+class FakeOpenAI:
+    """Client d'embeddings local (latence en secondes par requête)."""
+
+    def __init__(self, dim: int = 1536, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.inputs = 0
+        self.embeddings = SimpleNamespace(with_raw_response=_RawEmbeddings(self))
+
+
+class _Query:
+    def __init__(self, owner, table: str):
+        self.owner = owner
+        self.table = table
+        self.rows = None
+
+    def upsert(self, rows: list[dict]):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        owner = self.owner
+        time.sleep(owner.latency)
+        with owner.lock:
+            owner.requests += 1
+            for row in self.rows or []:
+                owner.tables.setdefault(self.table, {})[row["id"]] = row
+        return SimpleNamespace(data=[], count=len(owner.tables.get(self.table, {})))
+
+
+class FakeSupabase:
+    """Client Supabase local limité aux upserts (latence en secondes par requête)."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.tables = {}
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
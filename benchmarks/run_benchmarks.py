@@ -0,0 +1,255 @@
+"""
+MILARIPPA - Benchmarks du pipeline
+==================================
+Mesure chaque étape sur des corpus synthétiques (voir synthetic.py) :
+extract_pdf, clean_text, split_by_sections, subdivide_chunk,
+detect_chunk_type, puis embeddings et upload avec de faux backends
+(voir fakes.py). Pour chaque mesure : temps (meilleur de N essais),
+débit et pic mémoire Python (tracemalloc, sur un essai séparé).
+
+Le rapport JSON (benchmarks/results/<commit>.json par défaut) se compare
+d'un commit à l'autre :
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --compare results/abc123.json results/def456.json
+"""
+
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = ROOT / "scripts"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from fakes import FakeOpenAI, FakeSupabase
+from synthetic import STRUCTURES, add_extraction_noise, generate_pdf, generate_text
+
+# Les scripts créent leurs clients à l'import : valeurs factices, remplacées par les faux backends
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_URL", "https://benchmark.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")
+
+# Config par défaut
+SIZES_KB = [100, 1000]     # Tailles des textes synthétiques
+PDF_PAGES = [50, 200]      # Tailles des PDFs synthétiques
+VERSE_RATIO = 0.4          # Part de paragraphes en vers
+REPEAT = 3                 # Essais par mesure (on garde le meilleur)
+EMBED_LATENCY_MS = 50      # Latence simulée d'une requête d'embeddings
+UPLOAD_LATENCY_MS = 30     # Latence simulée d'un upsert
+
+
+def load_script(name: str):
+    """Importe un script numéroté (01_extract_text.py...) comme module."""
+    spec = importlib.util.spec_from_file_location(name.split("_", 1)[1], SCRIPTS_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, repeat: int) -> dict:
+    """Meilleur temps sur `repeat` essais, puis un essai sous tracemalloc pour le pic mémoire."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"wall_s": min(times), "wall_s_all": times, "peak_mb": peak / 1_000_000, "result": result}
+
+
+def record(results: dict, name: str, measurement: dict, units: float, unit: str) -> None:
+    results[name] = {
+        "wall_s": round(measurement["wall_s"], 6),
+        "wall_s_all": [round(t, 6) for t in measurement["wall_s_all"]],
+        "units": units,
+        "unit": unit,
+        "throughput": round(units / max(measurement["wall_s"], 1e-9), 2),
+        "peak_mb": round(measurement["peak_mb"], 2),
+    }
+    print(f"   {name:<40} {measurement['wall_s'] * 1000:10.1f} ms  "
+          f"{results[name]['throughput']:>14,.1f} {unit}/s  {measurement['peak_mb']:8.1f} Mo")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args) -> dict:
+    extract = load_script("01_extract_text")
+    chunking = load_script("02_chunk_texts")
+    embedding = load_script("03_generate_embeddings")
+    upload = load_script("04_upload_to_supabase")
+
+    fake_openai = FakeOpenAI(latency=args.embed_latency_ms / 1000)
+    fake_supabase = FakeSupabase(latency=args.upload_latency_ms / 1000)
+    embedding.client = fake_openai
+    upload.supabase = fake_supabase
+
+    results = {}
+
+    # --- Extraction PDF ---
+    print("📄 Extraction PDF")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pdf_pages:
+            pdf_path = generate_pdf(Path(tmp) / f"bench_{pages}.pdf", pages, verse_ratio=args.verse_ratio)
+            m = measure(lambda: extract.extract_pdf(pdf_path), args.repeat)
+            record(results, f"extract_pdf[{pages}p]", m, pages, "pages")
+
+    # --- Textes : nettoyage, sections, subdivision, type ---
+    largest = None
+    for structure in args.structures:
+        print(f"\n📚 Textes « {structure} »")
+        for size_kb in args.sizes_kb:
+            label = f"{structure},{size_kb}k"
+            text = generate_text(size_kb * 1000, structure, args.verse_ratio)
+            chars = len(text)
+            noisy = add_extraction_noise(text)
+
+            m = measure(lambda: extract.clean_text(noisy), args.repeat)
+            record(results, f"clean_text[{label}]", m, len(noisy) / 1e6, "Mchars")
+
+            m = measure(lambda: chunking.split_by_sections(text), args.repeat)
+            record(results, f"split_by_sections[{label}]", m, chars / 1e6, "Mchars")
+            sections = m["result"]
+
+            def subdivide_all():
+                return [piece for _, content in sections for piece in chunking.subdivide_chunk(content)]
+            m = measure(subdivide_all, args.repeat)
+            record(results, f"subdivide_chunk[{label}]", m, chars / 1e6, "Mchars")
+            pieces = m["result"]
+
+            m = measure(lambda: [chunking.detect_chunk_type(p, "Hundred Thousand Songs") for p in pieces],
+                        args.repeat)
+            record(results, f"detect_chunk_type[{label}]", m, len(pieces), "chunks")
+
+            if largest is None or chars > largest[0]:
+                largest = (chars, [
+                    {"id": f"bench_{i:04d}", "source": "bench", "langue": "fr", "section": "",
+                     "type": "enseignement", "texte": p, "tokens": len(chunking.enc.encode(p))}
+                    for i, p in enumerate(pieces)
+                ])
+
+    # --- Embeddings et upload (faux backends) ---
+    chunks = largest[1][:args.max_chunks]
+    print(f"\n🌐 Embeddings et upload ({len(chunks)} chunks, latences simulées "
+          f"{args.embed_latency_ms} ms / {args.upload_latency_ms} ms)")
+
+    def embed_all():
+        batches = embedding.pack_batches(chunks)
+        with ThreadPoolExecutor(max_workers=embedding.EMBED_CONCURRENCY) as executor:
+            return [chunk for results in executor.map(embedding.embed_batch, batches) for chunk in results]
+    m = measure(embed_all, args.repeat)
+    record(results, "embed[fake]", m, len(chunks), "chunks")
+    embedded = m["result"]
+
+    def upload_all():
+        rows = [upload.upload_row(chunk, chunk["embedding"]) for chunk in embedded]
+        batches = upload.pack_batches(rows)
+        with ThreadPoolExecutor(max_workers=upload.UPLOAD_CONCURRENCY) as executor:
+            return sum(len(rows) for rows in executor.map(upload.upload_batch, batches))
+    m = measure(upload_all, args.repeat)
+    record(results, "upload[fake]", m, len(embedded), "chunks")
+
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "sizes_kb": args.sizes_kb,
+            "pdf_pages": args.pdf_pages,
+            "structures": args.structures,
+            "verse_ratio": args.verse_ratio,
+            "repeat": args.repeat,
+            "embed_latency_ms": args.embed_latency_ms,
+            "upload_latency_ms": args.upload_latency_ms,
+            "embed_concurrency": embedding.EMBED_CONCURRENCY,
+            "upload_concurrency": upload.UPLOAD_CONCURRENCY,
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": results,
+    }
+
+
+def compare(old_path: Path, new_path: Path) -> None:
+    """Affiche l'évolution du temps et du pic mémoire entre deux rapports."""
+    old = json.loads(Path(old_path).read_text(encoding="utf-8"))
+    new = json.loads(Path(new_path).read_text(encoding="utf-8"))
+    print(f"⚖️  {old['commit']} → {new['commit']}\n")
+    print(f"   {'mesure':<40} {'temps':>20} {'écart':>8} {'mémoire':>18}")
+    for name, after in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            print(f"   {name:<40} {'(nouvelle mesure)':>20}")
+            continue
+        ratio = after["wall_s"] / max(before["wall_s"], 1e-9)
+        flag = "🐢" if ratio > 1.1 else "🚀" if ratio < 0.9 else "  "
+        print(f"   {name:<40} {before['wall_s'] * 1000:8.1f} → {after['wall_s'] * 1000:8.1f} ms "
+              f"{ratio:6.2f}x {flag} {before['peak_mb']:7.1f} → {after['peak_mb']:7.1f} Mo")
+    for name in old["results"].keys() - new["results"].keys():
+        print(f"   {name:<40} {'(disparue)':>20}")
+
+
+def parse_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks du pipeline sur corpus synthétiques")
+    parser.add_argument("--sizes-kb", type=parse_list, default=SIZES_KB, help="tailles des textes (ex. 100,1000)")
+    parser.add_argument("--pdf-pages", type=parse_list, default=PDF_PAGES, help="tailles des PDFs (ex. 50,200)")
+    parser.add_argument("--structures", type=lambda v: v.split(","), default=list(STRUCTURES),
+                        help=f"structures des textes ({','.join(STRUCTURES)})")
+    parser.add_argument("--verse-ratio", type=float, default=VERSE_RATIO, help="part de paragraphes en vers")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="essais par mesure")
+    parser.add_argument("--max-chunks", type=int, default=2000, help="chunks envoyés aux faux backends")
+    parser.add_argument("--embed-latency-ms", type=float, default=EMBED_LATENCY_MS)
+    parser.add_argument("--upload-latency-ms", type=float, default=UPLOAD_LATENCY_MS)
+    parser.add_argument("--output", type=Path, help="rapport JSON (défaut : benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("AVANT", "APRÈS"),
+                        help="compare deux rapports au lieu de lancer les mesures")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    output = args.output or RESULTS_DIR / f"{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n📝 Rapport : {output} (pic RSS {report['peak_rss_mb']} Mo)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+MILARIPPA - Temps de démarrage de l'app
+=======================================
+Sur l'offre gratuite de Render, le conteneur s'endort et redémarre souvent :
+le temps entre le lancement et le port ouvert compte pour chaque visiteur.
+Chaque mesure tourne dans un process neuf (meilleur de N essais) :
+
+    import   `import main` (python -X importtime), sans aucun appel réseau
+    bind     `python app/main.py` jusqu'à ce que le port accepte une connexion
+
+Le rapport liste les modules les plus lents à importer et échoue (code de
+sortie 1) si l'import dépasse le budget ou si un SDK lourd (openai,
+anthropic, supabase, numpy) est de nouveau importé au démarrage :
+ils doivent rester chargés au premier usage / par le préchauffage.
+
+    python benchmarks/startup.py                   # → benchmarks/results/startup-<commit>.json
+    python benchmarks/startup.py --budget-ms 300
+    python benchmarks/startup.py --compare results/startup-AVANT.json results/startup-APRÈS.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_DIR = ROOT / "app"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Config par défaut
+REPEAT = 5
+IMPORT_BUDGET_MS = 400     # Budget de `import main` (sans l'interpréteur)
+TOP_MODULES = 15           # Modules listés dans le rapport
+BIND_TIMEOUT_S = 30
+LAZY_MODULES = ["openai", "anthropic", "supabase", "numpy"]  # Interdits à l'import de main
+
+# Aucun appel réseau à l'import : valeurs factices, comme en production (Supabase par défaut)
+APP_ENV = {
+    "OPENAI_API_KEY": "startup",
+    "ANTHROPIC_API_KEY": "startup",
+    "SUPABASE_URL": "https://startup.supabase.co",
+    "SUPABASE_KEY": "startup.startup.startup",
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def app_env(**extra) -> dict:
+    env = {**APP_ENV, **os.environ, **extra}
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    return env
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """Lignes de -X importtime : module, profondeur, temps propre et cumulé (ms)."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append({"module": name.strip(), "depth": depth,
+                        "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return modules
+
+
+def measure_import() -> dict:
+    """Un `import main` dans un interpréteur neuf."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=APP_DIR,
+                            env=app_env(), capture_output=True, text=True)
+    process_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"import main a échoué :\n{result.stderr[-2000:]}")
+
+    # -X importtime affiche les dépendances avant le module : le sous-arbre de main
+    # est entre l'entrée de premier niveau précédente et main (démarrage de l'interpréteur exclu)
+    modules = parse_importtime(result.stderr)
+    end = next(i for i, m in enumerate(modules) if m["module"] == "main" and m["depth"] == 0)
+    begin = max((i for i in range(end) if modules[i]["depth"] == 0), default=-1) + 1
+    return {"import_ms": modules[end]["cumulative_ms"], "process_ms": process_ms, "modules": modules[begin:end]}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_bind() -> float:
+    """Millisecondes entre le lancement de app/main.py et le port ouvert."""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, str(APP_DIR / "main.py")], cwd=ROOT, env=app_env(PORT=str(port)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < BIND_TIMEOUT_S:
+            if process.poll() is not None:
+                raise RuntimeError(f"app/main.py s'est arrêté (code {process.returncode})")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.05).close()
+                return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError(f"port {port} toujours fermé après {BIND_TIMEOUT_S}s")
+    finally:
+        process.kill()
+        process.wait()
+
+
+def run(args) -> dict:
+    print(f"🚀 Démarrage de l'app ({args.repeat} essais, meilleur gardé)")
+    imports = [measure_import() for _ in range(args.repeat)]
+    best = min(imports, key=lambda m: m["import_ms"])
+    binds = [measure_bind() for _ in range(args.repeat)]
+
+    # Temps cumulé de chaque module importé directement par main
+    slowest = sorted((m for m in best["modules"] if m["depth"] == 1), key=lambda m: -m["cumulative_ms"])
+    lazy_loaded = sorted({m["module"].split(".")[0] for m in best["modules"]} & set(LAZY_MODULES))
+
+    print(f"   {'import main':<28} {best['import_ms']:8.1f} ms  (budget {args.budget_ms} ms)")
+    print(f"   {'process (interpréteur inclus)':<28} {min(m['process_ms'] for m in imports):8.1f} ms")
+    print(f"   {'port ouvert':<28} {min(binds):8.1f} ms")
+    print("\n   Modules importés par main (cumulé) :")
+    for m in slowest[:args.top]:
+        print(f"   {m['module']:<28} {m['cumulative_ms']:8.1f} ms")
+
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"repeat": args.repeat, "budget_ms": args.budget_ms},
+        "import_ms": round(best["import_ms"], 2),
+        "import_ms_all": [round(m["import_ms"], 2) for m in imports],
+        "process_ms": round(min(m["process_ms"] for m in imports), 2),
+        "bind_ms": round(min(binds), 2),
+        "bind_ms_all": [round(b, 2) for b in binds],
+        "lazy_modules_loaded": lazy_loaded,
+        "modules": {m["module"]: round(m["cumulative_ms"], 2) for m in slowest},
+        "slowest_self": [
+            {"module": m["module"], "self_ms": round(m["self_ms"], 2)}
+            for m in sorted(best["modules"], key=lambda m: -m["self_ms"])[:args.top]
+        ],
+    }
+
+
+def check(report: dict, budget_ms: float) -> bool:
+    """Budget d'import et modules qui doivent rester chargés à la demande."""
+    ok = True
+    if report["import_ms"] > budget_ms:
+        print(f"\n🐢 import main : {report['import_ms']:.1f} ms > budget {budget_ms} ms")
+        ok = False
+    if report["lazy_modules_loaded"]:
+        print(f"\n🐢 Importés au démarrage au lieu du premier usage : {', '.join(report['lazy_modules_loaded'])}")
+        ok = False
+    return ok
+
+
+def compare(old_path: Path, new_path: Path) -> None:
+    """Évolution des temps de démarrage et des modules entre deux rapports."""
+    old = json.loads(Path(old_path).read_text(encoding="utf-8"))
+    new = json.loads(Path(new_path).read_text(encoding="utf-8"))
+    print(f"⚖️  {old['commit']} → {new['commit']}\n")
+    for name in ("import_ms", "process_ms", "bind_ms"):
+        ratio = new[name] / max(old[name], 1e-9)
+        flag = "🐢" if ratio > 1.1 else "🚀" if ratio < 0.9 else "  "
+        print(f"   {name:<28} {old[name]:8.1f} → {new[name]:8.1f} ms {ratio:6.2f}x {flag}")
+    print()
+    for module in sorted(old["modules"].keys() | new["modules"].keys(),
+                         key=lambda m: -max(old["modules"].get(m, 0), new["modules"].get(m, 0)))[:TOP_MODULES]:
+        before, after = old["modules"].get(module), new["modules"].get(module)
+        before_text = f"{before:8.1f}" if before is not None else "       —"
+        after_text = f"{after:8.1f}" if after is not None else "       —"
+        print(f"   {module:<28} {before_text} → {after_text} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Temps d'import et d'ouverture du port de l'app")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="essais par mesure")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="budget de `import main`")
+    parser.add_argument("--top", type=int, default=TOP_MODULES, help="modules listés")
+    parser.add_argument("--output", type=Path, help="rapport JSON (défaut : benchmarks/results/startup-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("AVANT", "APRÈS"),
+                        help="compare deux rapports au lieu de lancer les mesures")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    output = args.output or RESULTS_DIR / f"startup-{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n📝 Rapport : {output}")
+
+    if not check(report, args.budget_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
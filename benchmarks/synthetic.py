@@ -0,0 +1,126 @@
+"""
+MILARIPPA - Corpus synthétiques pour les benchmarks
+===================================================
+Génère des textes et des PDFs de taille et de structure contrôlées, proches
+des livres du corpus : chapitres, chants numérotés, marqueurs de page ou
+texte sans structure, avec une part réglable de vers (lignes courtes) et
+de prose, et le bruit typique d'une extraction PDF (numéros de page,
+césures, espaces multiples). Tout est déterministe (graine fixe).
+"""
+
+import random
+import textwrap
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+STRUCTURES = ("chapters", "songs", "pages", "flat")
+
+WORDS = (
+    "Milarepa Marpa disciple maître montagne grotte neige méditation esprit "
+    "vacuité compassion souffrance karma libération chant enseignement lama "
+    "yogi vallée village offrande dévotion nature claire lumière réalisation "
+    "the master sang to his disciples in the cave of white rock mind nature "
+    "emptiness bliss clarity devotion teaching renunciation impermanence"
+).split()
+
+ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII"]
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _prose(rng: random.Random) -> str:
+    return " ".join(_sentence(rng, rng.randint(8, 25)) for _ in range(rng.randint(3, 8)))
+
+
+def _verse(rng: random.Random) -> str:
+    return "\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 7))) for _ in range(rng.randint(4, 12)))
+
+
+def _header(structure: str, number: int, rng: random.Random) -> str:
+    title = " ".join(rng.choice(WORDS) for _ in range(3)).title()
+    if structure == "chapters":
+        return f"CHAPTER {ROMAN[(number - 1) % len(ROMAN)]}: {title}"
+    if structure == "songs":
+        return f"SONG {number}: {title}"
+    return ""
+
+
+def generate_text(size_chars: int, structure: str = "chapters", verse_ratio: float = 0.4,
+                  sections: int = 20, seed: int = 0) -> str:
+    """
+    Texte propre (déjà nettoyé) d'environ size_chars caractères.
+    structure : chapters | songs | pages | flat.
+    """
+    if structure not in STRUCTURES:
+        raise ValueError(f"Structure inconnue : {structure} ({', '.join(STRUCTURES)})")
+    rng = random.Random(seed)
+    section_size = max(size_chars // max(sections, 1), 1)
+    parts = []
+    length = 0
+    number = 0
+
+    while length < size_chars:
+        number += 1
+        if structure == "pages":
+            parts.append(f"--- PAGE {number} ---")
+        elif structure != "flat":
+            parts.append(_header(structure, number, rng))
+
+        section_length = 0
+        while section_length < section_size and length + section_length < size_chars:
+            paragraph = _verse(rng) if rng.random() < verse_ratio else _prose(rng)
+            parts.append(paragraph)
+            section_length += len(paragraph) + 2
+        length += section_length
+
+    return "\n\n".join(parts)
+
+
+def add_extraction_noise(text: str, seed: int = 0) -> str:
+    """Ajoute le bruit d'une extraction PDF brute (ce que clean_text doit retirer)."""
+    rng = random.Random(seed)
+    noisy = []
+    for number, paragraph in enumerate(text.split("\n\n"), start=1):
+        if rng.random() < 0.2:
+            paragraph = paragraph.replace(" ", "   ", 3)
+        if rng.random() < 0.1:
+            words = paragraph.split(" ")
+            if len(words) > 3 and len(words[1]) > 4:
+                words[1] = words[1][:2] + "-\n" + words[1][2:]
+                paragraph = " ".join(words)
+        noisy.append(paragraph)
+        if rng.random() < 0.1:
+            noisy.append(f"\n{number % 999}\n")
+        if rng.random() < 0.05:
+            noisy.append("The Hundred Thousand Songs of Milarepa\n\n\n")
+    return "\n\n".join(noisy)
+
+
+def generate_pdf(path: Path, pages: int, structure: str = "chapters", verse_ratio: float = 0.4,
+                 seed: int = 0, chars_per_page: int = 3000) -> Path:
+    """PDF de `pages` pages pleines (environ chars_per_page caractères chacune)."""
+    # Un peu plus de texte que nécessaire : les pages sont remplies ligne à ligne
+    text = generate_text(int(pages * chars_per_page * 1.5), structure, verse_ratio, sections=max(pages // 10, 1), seed=seed)
+    lines = []
+    for paragraph in text.split("\n\n"):
+        for line in paragraph.split("\n"):
+            lines.extend(textwrap.wrap(line, 100) or [""])
+        lines.append("")
+
+    doc = fitz.open()
+    lines_per_page = 60
+    for start in range(0, len(lines), lines_per_page):
+        if doc.page_count >= pages:
+            break
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(40, 40, 560, 800), "\n".join(lines[start:start + lines_per_page]), fontsize=9)
+    while doc.page_count < pages:
+        doc.new_page()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(path)
+    doc.close()
+    return path
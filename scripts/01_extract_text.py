@@ -2,21 +2,43 @@
 MILAREPA - Étape 1 : Extraction du texte des PDFs
 ===================================================
 Lit chaque PDF dans data/raw/ et produit un fichier .txt propre dans data/processed/
+
+Les PDFs sont découpés en plages de pages extraites en parallèle par un pool
+de processus (--workers), et chaque page nettoyée est écrite aussitôt dans le
+fichier de sortie : la mémoire reste stable quelle que soit la taille du livre.
+Le résultat est identique à extract_pdf() (nettoyage du livre entier) : aucune
+règle de clean_text() ne peut traverser un marqueur "--- PAGE n ---", on peut
+donc nettoyer le texte morceau par morceau en coupant juste avant chaque marqueur.
 """
 
+import argparse
 import os
 import re
+import resource
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # pymupdf
 from pathlib import Path
 
+from manifest import Manifest, fingerprint
+
 # Chemins
 RAW_DIR = Path("data/raw")
 PROCESSED_DIR = Path("data/processed")
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
+# Parallélisme
+WORKERS = os.cpu_count() or 1  # Processus d'extraction
+PAGES_PER_TASK = 50            # Taille d'une plage de pages confiée à un processus
 
-def clean_text(text: str) -> str:
-    """Nettoie le texte extrait d'un PDF."""
+# Paramètres de l'étape (incrémenter la version quand clean_text() change)
+EXTRACT_PARAMS = {"version": 1}
+
+
+def clean_fragment(text: str) -> str:
+    """Applique les règles de nettoyage sans retirer les blancs aux extrémités."""
     # Supprime les multiples espaces
     text = re.sub(r' {2,}', ' ', text)
     # Supprime les multiples sauts de ligne (garde max 2)
@@ -27,7 +49,12 @@ def clean_text(text: str) -> str:
     text = re.sub(r'(?i)the hundred thousand songs of milarepa\s*\n', '', text)
     # Nettoie les tirets de césure en fin de ligne
     text = re.sub(r'(\w)-\n(\w)', r'\1\2', text)
-    return text.strip()
+    return text
+
+
+def clean_text(text: str) -> str:
+    """Nettoie le texte extrait d'un PDF."""
+    return clean_fragment(text).strip()
 
 
 def extract_pdf(pdf_path: Path) -> str:
@@ -44,7 +71,145 @@ def extract_pdf(pdf_path: Path) -> str:
     return clean_text("\n".join(full_text))
 
 
+def page_piece(page_num: int, text: str, last: bool = False) -> str:
+    """
+    Morceau nettoyé du texte final pour une page : son marqueur, son texte et
+    les sauts de ligne qui la séparent du marqueur suivant (comme dans
+    extract_pdf). La dernière page du livre n'a pas de séparateur final.
+    """
+    piece = f"--- PAGE {page_num} ---\n{text}"
+    if last:
+        return clean_fragment(piece).rstrip()
+    return clean_fragment(piece + "\n\n")
+
+
+def extract_pages(pdf_path: Path, start: int, end: int, last: bool = False) -> list[tuple[int, str]]:
+    """
+    Extrait et nettoie les pages [start, end) d'un PDF.
+    Retourne (numéro de page, morceau nettoyé) pour chaque page non vide ;
+    avec last=True, la dernière est nettoyée comme fin de livre.
+    """
+    doc = fitz.open(pdf_path)
+    pages = []
+
+    for page_num in range(start, end):
+        text = doc[page_num].get_text()
+        if text.strip():
+            pages.append((page_num + 1, text))
+
+    doc.close()
+    return [
+        (page_num, page_piece(page_num, text, last=last and i == len(pages) - 1))
+        for i, (page_num, text) in enumerate(pages)
+    ]
+
+
+def ordered_results(tasks: list[tuple], workers: int, executor: ProcessPoolExecutor | None = None):
+    """
+    Exécute extract_pages sur chaque tâche et rend les résultats dans l'ordre.
+    Au plus 2 × workers plages sont en vol, pour borner la mémoire. Sans
+    executor (pool fourni par run_pipeline.py), un pool est créé ici.
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield task, extract_pages(*task)
+        return
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from ordered_results(tasks, workers, executor)
+        return
+
+    pending = deque()
+    for task in tasks:
+        pending.append((task, executor.submit(extract_pages, *task)))
+        if len(pending) >= workers * 2:
+            done_task, future = pending.popleft()
+            yield done_task, future.result()
+    while pending:
+        done_task, future = pending.popleft()
+        yield done_task, future.result()
+
+
+def extract_files(pdf_files: list[Path], workers: int = WORKERS, pages_per_task: int = PAGES_PER_TASK,
+                  executor: ProcessPoolExecutor | None = None):
+    """
+    Extrait des PDFs vers PROCESSED_DIR/<nom>.txt avec un pool de processus
+    (executor s'il est fourni). Produit (pdf, fichier texte, pages, mots) à
+    mesure que chaque fichier est terminé et mis en place (écriture
+    temporaire puis renommage).
+    """
+    # Découper chaque PDF en plages de pages (dans l'ordre des fichiers)
+    tasks = []
+    for pdf_path in pdf_files:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+        for start in range(0, page_count, pages_per_task):
+            tasks.append((pdf_path, start, min(start + pages_per_task, page_count)))
+
+    current_pdf = None
+    out = None
+    held_page = None  # Dernière page reçue, écrite quand on sait qu'elle n'est pas la dernière
+    page_count = 0
+    word_count = 0
+
+    def write(piece):
+        nonlocal word_count
+        out.write(piece)
+        word_count += len(piece.split())
+
+    def finish(pdf_path):
+        """Écrit la dernière page comme fin de livre, puis met le fichier en place."""
+        if held_page is not None:
+            page_num = held_page[0]
+            write(extract_pages(pdf_path, page_num - 1, page_num, last=True)[0][1])
+        out.close()
+        output_path = PROCESSED_DIR / f"{pdf_path.stem}.txt"
+        os.replace(output_path.with_suffix(".txt.tmp"), output_path)
+        return pdf_path, output_path, page_count, word_count
+
+    # Les pages arrivent dans l'ordre : chacune est écrite dès que la suivante est prête
+    for (pdf_path, start, end), pages in ordered_results(tasks, workers, executor):
+        if pdf_path != current_pdf:
+            if current_pdf is not None:
+                yield finish(current_pdf)
+            print(f"📖 Extraction de {pdf_path.name}...")
+            out = open(PROCESSED_DIR / f"{pdf_path.stem}.txt.tmp", "w", encoding="utf-8")
+            current_pdf = pdf_path
+            held_page = None
+            page_count = 0
+            word_count = 0
+
+        for page in pages:
+            if held_page is not None:
+                write(held_page[1])
+            held_page = page
+        page_count += end - start
+
+    if current_pdf is not None:
+        yield finish(current_pdf)
+
+
+def peak_rss_mb() -> tuple[float, float]:
+    """Pic de mémoire résidente (process principal, plus gros processus enfant) en Mo."""
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return own / 1_000_000, children / 1_000_000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extraction du texte des PDFs")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help=f"processus d'extraction (1 = séquentiel, défaut {WORKERS})")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK,
+                        help=f"pages par tâche (défaut {PAGES_PER_TASK})")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     pdf_files = list(RAW_DIR.glob("*.pdf"))
 
     if not pdf_files:
@@ -52,33 +217,42 @@ def main():
         print(f"   Copie tes PDFs dans le dossier {RAW_DIR}/ d'abord !")
         return
 
-    # Filtrer pour ne traiter que les nouveaux PDFs
-    new_pdf_files = []
-    for pdf_path in pdf_files:
-        output_path = PROCESSED_DIR / f"{pdf_path.stem}.txt"
-        if not output_path.exists():
-            new_pdf_files.append(pdf_path)
+    # Ne traiter que les PDFs nouveaux ou modifiés (empreinte du manifest)
+    manifest = Manifest()
+    fingerprints = {p.name: fingerprint(manifest.file_hash(p), EXTRACT_PARAMS) for p in pdf_files}
+    new_pdf_files = [
+        p for p in pdf_files
+        if not manifest.is_fresh("extract", p.name, fingerprints[p.name])
+        or not (PROCESSED_DIR / f"{p.stem}.txt").exists()
+    ]
+
+    # Oublier les PDFs retirés de data/raw/
+    for name in set(manifest.entries("extract")) - set(fingerprints):
+        manifest.forget("extract", name)
 
     if not new_pdf_files:
+        manifest.save()
         print(f"✅ Tous les PDFs ont déjà été extraits ({len(pdf_files)} fichiers)")
         print(f"   Aucun nouveau fichier à traiter.")
         return
 
     print(f"📚 {len(pdf_files)} PDF(s) trouvé(s)")
-    print(f"📚 {len(new_pdf_files)} nouveau(x) PDF(s) à traiter\n")
-
-    for pdf_path in new_pdf_files:
-        print(f"📖 Extraction de {pdf_path.name}...")
-        text = extract_pdf(pdf_path)
-
-        output_path = PROCESSED_DIR / f"{pdf_path.stem}.txt"
-        output_path.write_text(text, encoding="utf-8")
+    print(f"📚 {len(new_pdf_files)} PDF(s) nouveau(x) ou modifié(s) à traiter")
+    print(f"⚙️  {args.workers} processus, {args.pages_per_task} pages par tâche\n")
 
-        # Stats
-        word_count = len(text.split())
-        print(f"   ✅ {word_count:,} mots → {output_path}\n")
+    start_time = time.perf_counter()
+    total_pages = 0
+    for pdf_path, output_path, pages, words in extract_files(new_pdf_files, args.workers, args.pages_per_task):
+        manifest.record("extract", pdf_path.name, fingerprints[pdf_path.name], output=str(output_path))
+        manifest.save()
+        total_pages += pages
+        print(f"   ✅ {words:,} mots → {output_path}\n")
 
+    elapsed = time.perf_counter() - start_time
+    own_rss, child_rss = peak_rss_mb()
     print("🎉 Extraction terminée !")
+    print(f"   Pages     : {total_pages:,} en {elapsed:.1f}s ({total_pages / max(elapsed, 1e-9):.1f} pages/s)")
+    print(f"   Pic RSS   : {own_rss:.0f} Mo (principal), {child_rss:.0f} Mo (plus gros worker)")
 
 
 if __name__ == "__main__":
@@ -4,17 +4,45 @@ MILARIPPA - Étape 2 : Découpage intelligent (Chunking)
 Découpe les textes extraits en chunks sémantiquement cohérents.
 Stratégie : on découpe par sections/chapitres d'abord, puis on subdivise
 les sections trop longues avec un overlap pour garder le contexte.
+
+Chaque section n'est encodée qu'une fois (TokenIndex), et toutes les
+sections d'un fichier partent en un seul appel groupé (encode_batch) :
+paragraphes et chunks sont manipulés comme des intervalles de caractères,
+et leur nombre de tokens se lit dans l'encodage de la section. Quand des
+blancs irréguliers entourent une frontière de paragraphe, un token de blancs
+peut être à cheval dessus et n'est compté que d'un côté : le champ `tokens`
+peut alors différer de quelques unités d'un encodage séparé du chunk.
+
+Les fichiers sont découpés en parallèle (--workers, un processus par
+fichier ; les gros fichiers sont répartis par lots de sections). Les
+résultats sont fusionnés dans l'ordre du texte : chunks et ids sont
+identiques au mode séquentiel (--workers 1). --compare mesure le débit des
+deux modes sans rien écrire.
+
+Les chunks quasi identiques, toutes sources confondues (traductions reprises
+d'un livre à l'autre, extraits de Wikiquote, chevauchements), sont repérés
+par MinHash + LSH puis regroupés (union-find). Le chunk d'un groupe au plus
+petit hash de texte (quel que soit l'ordre des fichiers) est canonique et
+liste les autres dans "doublons" ; les autres restent dans le fichier avec
+"doublon_de" et ne sont ni vectorisés ni indexés.
 """
 
+import argparse
 import json
 import re
 import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass, asdict
 from typing import Optional
 
+import numpy as np
 import tiktoken
 
+from manifest import Manifest, fingerprint, hash_text
+
 # Config
 PROCESSED_DIR = Path("data/processed")
 CHUNKS_DIR = Path("data/chunks")
@@ -24,6 +52,34 @@ MAX_TOKENS = 800      # Taille max d'un chunk en tokens
 OVERLAP_TOKENS = 100   # Chevauchement entre chunks
 MIN_TOKENS = 50        # Taille min (éviter les micro-chunks)
 
+# Parallélisme
+WORKERS = os.cpu_count() or 1      # Processus de découpage
+ENCODE_THREADS = 8                 # Threads de tiktoken.encode_batch en mode séquentiel
+SECTION_BATCH_CHARS = 500_000      # Au-delà, un fichier est réparti par lots de sections
+
+# Doublons : MinHash sur des n-grammes de mots, LSH par bandes
+DEDUP_THRESHOLD = 0.8          # Similarité de Jaccard (estimée) à partir de laquelle deux chunks sont doublons
+SHINGLE_WORDS = 5              # Taille des n-grammes de mots comparés
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16                 # 16 bandes de 8 valeurs : candidats dès ~0.7 de similarité
+MINHASH_PRIME = (1 << 31) - 1
+DEDUP_PARAMS = {
+    "threshold": DEDUP_THRESHOLD,
+    "shingle_words": SHINGLE_WORDS,
+    "permutations": MINHASH_PERMUTATIONS,
+    "bands": LSH_BANDS,
+    "version": 2,  # Canonique : plus petit hash du texte (et non plus le premier ajouté)
+}
+
+# Paramètres de l'étape : en changer un re-découpe tous les fichiers
+# (incrémenter la version quand l'algorithme de découpage change)
+CHUNK_PARAMS = {
+    "max_tokens": MAX_TOKENS,
+    "overlap_tokens": OVERLAP_TOKENS,
+    "min_tokens": MIN_TOKENS,
+    "version": 3,
+}
+
 # Tokenizer pour compter les tokens
 enc = tiktoken.get_encoding("cl100k_base")
 
@@ -38,6 +94,8 @@ class Chunk:
     texte: str           # Le contenu
     tokens: int          # Nombre de tokens
     page_debut: Optional[int] = None
+    doublons: Optional[list] = None     # Canonique : doublons regroupés ({id, source, section})
+    doublon_de: Optional[str] = None    # Doublon : id du chunk canonique
 
 
 # === DÉTECTION DES SOURCES ===
@@ -67,54 +125,137 @@ def count_tokens(text: str) -> int:
     return len(enc.encode(text))
 
 
+_token_byte_lengths = None
+
+
+def token_byte_lengths() -> np.ndarray:
+    """Longueur en octets de chaque token du vocabulaire (table construite une fois)."""
+    global _token_byte_lengths
+    if _token_byte_lengths is None:
+        lengths = np.zeros(enc.n_vocab, dtype=np.int64)
+        for token in range(enc.n_vocab):
+            try:
+                lengths[token] = len(enc.decode_single_token_bytes(token))
+            except KeyError:
+                pass  # Identifiant inutilisé du vocabulaire
+        _token_byte_lengths = lengths
+    return _token_byte_lengths
+
+
+def token_char_starts(text: str, tokens: list[int]) -> np.ndarray:
+    """
+    Position (en caractères) du début de chaque token dans le texte, comme
+    enc.decode_with_offsets mais vectorisé : un token qui commence au milieu
+    d'un caractère multi-octets est rattaché à ce caractère.
+    """
+    lengths = token_byte_lengths()[np.asarray(tokens, dtype=np.int64)]
+    byte_starts = np.cumsum(lengths) - lengths
+    raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    # Nombre de caractères commencés jusqu'à chaque octet (inclus)
+    chars_through = np.cumsum((raw & 0xC0) != 0x80)
+    return chars_through[byte_starts] - 1
+
+
+class TokenIndex:
+    """
+    Un texte encodé une seule fois. Le nombre de tokens de n'importe quel
+    intervalle de caractères [start, end) se lit par recherche dichotomique
+    dans les positions de début des tokens.
+    """
+
+    def __init__(self, text: str, tokens: Optional[list[int]] = None):
+        if tokens is None:
+            tokens = enc.encode(text)
+        self.total = len(tokens)
+        self.starts = token_char_starts(text, tokens)
+
+    def count(self, start: int, end: int) -> int:
+        """Nombre de tokens qui commencent dans [start, end)."""
+        return int(np.searchsorted(self.starts, end) - np.searchsorted(self.starts, start))
+
+
+def paragraph_spans(text: str, start: int, end: int) -> list[tuple[int, int]]:
+    """Intervalles des paragraphes de text[start:end] (équivalent de .split('\\n\\n'))."""
+    spans = []
+    pos = start
+    while True:
+        sep = text.find('\n\n', pos, end)
+        if sep == -1:
+            spans.append((pos, end))
+            return spans
+        spans.append((pos, sep))
+        pos = sep + 2
+
+
+def strip_span(text: str, start: int, end: int) -> tuple[int, int]:
+    """Intervalle de text[start:end].strip()."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
 # === DÉCOUPAGE PAR SECTIONS ===
 
-def split_by_sections(text: str) -> list[tuple[str, str]]:
+SECTION_PATTERNS = [
+    r'\n(?:CHAPTER|Chapter|STORY|Story|PART|Part)\s+[\dIVXLCDM]+[.\s:].*?\n',
+    r'\n(?:CHANT|Song|SONG)\s+[\dIVXLCDM]+[.\s:].*?\n',
+    r'\n--- PAGE \d+ ---\n',
+]
+
+
+def section_spans(text: str, index: Optional[TokenIndex] = None) -> list[tuple[str, int, int]]:
     """
     Découpe un texte en sections basées sur les marqueurs structurels.
-    Retourne une liste de (titre_section, contenu).
+    Retourne une liste de (titre_section, début, fin) dans le texte.
+    L'index n'est utilisé (ou construit) que pour le découpage de repli.
     """
-    # Patterns de découpage (chapitres, stories, chants, pages)
-    section_patterns = [
-        r'\n(?:CHAPTER|Chapter|STORY|Story|PART|Part)\s+[\dIVXLCDM]+[.\s:].*?\n',
-        r'\n(?:CHANT|Song|SONG)\s+[\dIVXLCDM]+[.\s:].*?\n',
-        r'\n--- PAGE \d+ ---\n',
-    ]
+    # Essayer chaque pattern (chapitres, stories, chants, pages), du plus structuré au moins
+    for pattern in SECTION_PATTERNS:
+        matches = list(re.finditer(pattern, text))
 
-    # Essayer chaque pattern, du plus structuré au moins
-    for pattern in section_patterns:
-        splits = re.split(pattern, text)
-        headers = re.findall(pattern, text)
-
-        if len(splits) > 3:  # Au moins quelques sections trouvées
+        if len(matches) >= 3:  # Au moins quelques sections trouvées
             sections = []
-            for i, content in enumerate(splits):
-                if content.strip():
-                    header = headers[i - 1].strip() if i > 0 and i - 1 < len(headers) else "Introduction"
-                    sections.append((header, content.strip()))
+            bounds = [0] + [m.end() for m in matches]
+            ends = [m.start() for m in matches] + [len(text)]
+            for i, (start, end) in enumerate(zip(bounds, ends)):
+                start, end = strip_span(text, start, end)
+                if start < end:
+                    header = matches[i - 1].group().strip() if i > 0 else "Introduction"
+                    sections.append((header, start, end))
             return sections
 
-    # Fallback : découper par doubles sauts de ligne (paragraphes)
-    paragraphs = text.split('\n\n')
+    # Fallback : regrouper les paragraphes jusqu'à MAX_TOKENS
+    if index is None:
+        index = TokenIndex(text)
+    paragraphs = paragraph_spans(text, 0, len(text))
     sections = []
-    current = []
+    first = 0
     current_title = "Section 1"
     section_num = 1
 
-    for para in paragraphs:
-        current.append(para)
-        if count_tokens('\n\n'.join(current)) > MAX_TOKENS:
-            sections.append((current_title, '\n\n'.join(current[:-1])))
-            current = [para]
+    for i in range(len(paragraphs)):
+        if index.count(paragraphs[first][0], paragraphs[i][1]) > MAX_TOKENS:
+            # Le paragraphe i ne rentre plus : fermer la section avant lui
+            start = paragraphs[first][0]
+            sections.append((current_title, start, paragraphs[i - 1][1] if i > first else start))
+            first = i
             section_num += 1
             current_title = f"Section {section_num}"
 
-    if current:
-        sections.append((current_title, '\n\n'.join(current)))
-
+    sections.append((current_title, paragraphs[first][0], paragraphs[-1][1]))
     return sections
 
 
+def split_by_sections(text: str) -> list[tuple[str, str]]:
+    """
+    Découpe un texte en sections basées sur les marqueurs structurels.
+    Retourne une liste de (titre_section, contenu).
+    """
+    return [(title, text[start:end]) for title, start, end in section_spans(text)]
+
+
 def detect_chunk_type(text: str, source_name: str) -> str:
     """Détecte le type de contenu d'un chunk."""
     text_lower = text.lower()
@@ -139,128 +280,445 @@ def detect_chunk_type(text: str, source_name: str) -> str:
 
 # === SUBDIVISION DES CHUNKS TROP LONGS ===
 
-def subdivide_chunk(text: str, max_tokens: int = MAX_TOKENS, overlap: int = OVERLAP_TOKENS) -> list[str]:
-    """Subdivise un texte trop long en chunks avec overlap (simple version)."""
-    text_tokens = enc.encode(text)
-    
-    if len(text_tokens) <= max_tokens:
-        return [text]
+def subdivide_spans(text: str, index: TokenIndex, start: int, end: int,
+                    max_tokens: int = MAX_TOKENS) -> list[tuple[int, int]]:
+    """
+    Subdivise text[start:end] en chunks avec overlap (le dernier paragraphe
+    d'un chunk ouvre le suivant). Retourne les intervalles des chunks.
+    """
+    if index.count(start, end) <= max_tokens:
+        return [(start, end)]
 
     chunks = []
-    
-    # Découper par paragraphes d'abord
-    paragraphs = text.split('\n\n')
-    current_chunk = []
+
+    # Découper par paragraphes d'abord (contigus : un chunk = un intervalle)
+    paragraphs = paragraph_spans(text, start, end)
+    first = None  # Premier paragraphe du chunk en cours
+    last = None   # Dernier paragraphe du chunk en cours
     current_tokens = 0
-    
-    for para in paragraphs:
-        para_tokens = len(enc.encode(para))
-        
-        if current_tokens + para_tokens > max_tokens and current_chunk:
+
+    for para_start, para_end in paragraphs:
+        para_tokens = index.count(para_start, para_end)
+
+        if current_tokens + para_tokens > max_tokens and first is not None:
             # Sauvegarder le chunk actuel
-            chunk_text = '\n\n'.join(current_chunk).strip()
-            if chunk_text:
-                chunks.append(chunk_text)
+            chunk_start, chunk_end = strip_span(text, first[0], last[1])
+            if chunk_start < chunk_end:
+                chunks.append((chunk_start, chunk_end))
             # Réinitialiser avec overlap (prendre dernier para)
-            current_chunk = [current_chunk[-1] if current_chunk else '', para]
-            current_tokens = para_tokens + len(enc.encode(current_chunk[0]))
+            current_tokens = para_tokens + index.count(*last)
+            first = last
         else:
-            current_chunk.append(para)
+            if first is None:
+                first = (para_start, para_end)
             current_tokens += para_tokens
-    
+        last = (para_start, para_end)
+
     # Ajouter le dernier chunk
-    if current_chunk:
-        chunk_text = '\n\n'.join(current_chunk).strip()
-        if chunk_text:
-            chunks.append(chunk_text)
-    
+    if first is not None:
+        chunk_start, chunk_end = strip_span(text, first[0], last[1])
+        if chunk_start < chunk_end:
+            chunks.append((chunk_start, chunk_end))
+
     return chunks
 
 
+def subdivide_chunk(text: str, max_tokens: int = MAX_TOKENS, overlap: int = OVERLAP_TOKENS) -> list[str]:
+    """Subdivise un texte trop long en chunks avec overlap (simple version)."""
+    index = TokenIndex(text)
+    return [text[start:end] for start, end in subdivide_spans(text, index, 0, len(text), max_tokens)]
+
+
 # === PIPELINE PRINCIPAL ===
 
+def chunk_sections(sections: list[tuple[str, str]], source_name: str,
+                   num_threads: int = ENCODE_THREADS) -> tuple[list[dict], int]:
+    """
+    Découpe un lot de sections (titre, contenu) en chunks sans id.
+    Les sections sont tokenisées en un seul appel groupé (encode_batch),
+    puis chacune est découpée sur ses offsets de tokens.
+    Retourne (chunks, nombre de tokens encodés).
+    """
+    token_lists = enc.encode_batch([content for _, content in sections], num_threads=num_threads)
+    drafts = []
+
+    for (section_title, section_content), tokens in zip(sections, token_lists):
+        index = TokenIndex(section_content, tokens)
+        if index.total < MIN_TOKENS:
+            continue
+
+        # Subdiviser si trop long
+        for sub_start, sub_end in subdivide_spans(section_content, index, 0, len(section_content)):
+            sub_tokens = index.count(sub_start, sub_end)
+            if sub_tokens < MIN_TOKENS:
+                continue
+
+            sub_text = section_content[sub_start:sub_end]
+            drafts.append({
+                "section": section_title[:100],
+                "type": detect_chunk_type(sub_text, source_name),
+                "texte": sub_text,
+                "tokens": sub_tokens,
+            })
+
+    return drafts, sum(len(tokens) for tokens in token_lists)
+
+
+def make_chunks(stem: str, drafts: list[dict]) -> list[Chunk]:
+    """Numérote les chunks d'un fichier dans l'ordre du texte (ids stables)."""
+    config = get_source_config(stem)
+    return [
+        Chunk(
+            id=f"{stem}_{chunk_id:04d}",
+            source=config["nom"],
+            langue=config["langue"],
+            **draft,
+        )
+        for chunk_id, draft in enumerate(drafts)
+    ]
+
+
 def process_file(txt_path: Path) -> list[Chunk]:
     """Traite un fichier texte complet et retourne des chunks."""
     config = get_source_config(txt_path.stem)
     text = txt_path.read_text(encoding="utf-8")
-    chunks = []
-    chunk_id = 0
 
     print(f"  📐 Découpage en sections...")
     sections = split_by_sections(text)
     print(f"  📄 {len(sections)} sections trouvées")
 
-    for section_title, section_content in sections:
-        if count_tokens(section_content) < MIN_TOKENS:
+    drafts, _ = chunk_sections(sections, config["nom"])
+    return make_chunks(txt_path.stem, drafts)
+
+
+# === MODE PARALLÈLE ===
+
+def _chunk_task(task: tuple) -> tuple[list[dict], int]:
+    """
+    Tâche d'un worker : soit un fichier entier (sections=None), soit un lot
+    de sections consécutives d'un gros fichier.
+    """
+    txt_path, sections = task
+    config = get_source_config(txt_path.stem)
+    if sections is None:
+        sections = split_by_sections(txt_path.read_text(encoding="utf-8"))
+    # Un thread d'encodage par worker : le parallélisme vient des processus
+    return chunk_sections(sections, config["nom"], num_threads=1)
+
+
+def plan_tasks(txt_files: list[Path]) -> list[tuple]:
+    """
+    Répartit le travail : un fichier par tâche, sauf les gros fichiers dont
+    les sections sont regroupées en lots d'environ SECTION_BATCH_CHARS.
+    """
+    tasks = []
+    for txt_path in txt_files:
+        if txt_path.stat().st_size <= SECTION_BATCH_CHARS:
+            tasks.append((txt_path, None))
             continue
 
-        # Subdiviser si trop long
-        sub_texts = subdivide_chunk(section_content)
+        batch, batch_chars = [], 0
+        for section in split_by_sections(txt_path.read_text(encoding="utf-8")):
+            batch.append(section)
+            batch_chars += len(section[1])
+            if batch_chars >= SECTION_BATCH_CHARS:
+                tasks.append((txt_path, batch))
+                batch, batch_chars = [], 0
+        if batch or not tasks or tasks[-1][0] != txt_path:
+            tasks.append((txt_path, batch))
+    return tasks
 
-        for sub_text in sub_texts:
-            if count_tokens(sub_text) < MIN_TOKENS:
-                continue
 
-            chunk = Chunk(
-                id=f"{txt_path.stem}_{chunk_id:04d}",
-                source=config["nom"],
-                langue=config["langue"],
-                section=section_title[:100],
-                type=detect_chunk_type(sub_text, config["nom"]),
-                texte=sub_text,
-                tokens=count_tokens(sub_text),
-            )
-            chunks.append(chunk)
-            chunk_id += 1
+def process_files_parallel(txt_files: list[Path], workers: int) -> tuple[dict[str, list[Chunk]], int]:
+    """
+    Découpe plusieurs fichiers avec un pool de processus.
+    Les résultats sont fusionnés dans l'ordre des tâches puis numérotés par
+    fichier : mêmes chunks et mêmes ids qu'en mode séquentiel.
+    Retourne ({nom du fichier: chunks}, tokens encodés).
+    """
+    tasks = plan_tasks(txt_files)
+    drafts_by_stem = {txt_path.stem: [] for txt_path in txt_files}
+    encoded_tokens = 0
 
-    return chunks
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for (txt_path, _), (drafts, tokens) in zip(tasks, executor.map(_chunk_task, tasks)):
+            drafts_by_stem[txt_path.stem].extend(drafts)
+            encoded_tokens += tokens
+
+    return {stem: make_chunks(stem, drafts) for stem, drafts in drafts_by_stem.items()}, encoded_tokens
+
+
+def process_files_serial(txt_files: list[Path]) -> tuple[dict[str, list[Chunk]], int]:
+    """Équivalent séquentiel de process_files_parallel (référence de comparaison)."""
+    chunks_by_stem = {}
+    encoded_tokens = 0
+    for txt_path in txt_files:
+        config = get_source_config(txt_path.stem)
+        sections = split_by_sections(txt_path.read_text(encoding="utf-8"))
+        drafts, tokens = chunk_sections(sections, config["nom"])
+        chunks_by_stem[txt_path.stem] = make_chunks(txt_path.stem, drafts)
+        encoded_tokens += tokens
+    return chunks_by_stem, encoded_tokens
+
+
+def compare_modes(txt_files: list[Path], workers: int) -> None:
+    """Mesure le débit (tokens/s) des modes séquentiel et parallèle et vérifie qu'ils concordent."""
+    print(f"⏱️  Comparaison sur {len(txt_files)} fichier(s), {workers} processus\n")
+    results = {}
+    for name, run in [("séquentiel", lambda: process_files_serial(txt_files)),
+                      ("parallèle", lambda: process_files_parallel(txt_files, workers))]:
+        start = time.perf_counter()
+        chunks_by_stem, tokens = run()
+        elapsed = time.perf_counter() - start
+        results[name] = chunks_by_stem
+        count = sum(len(chunks) for chunks in chunks_by_stem.values())
+        print(f"   {name:<11}: {elapsed:6.2f}s  {tokens / max(elapsed, 1e-9):>12,.0f} tokens/s  ({count} chunks)")
+
+    identical = results["séquentiel"] == results["parallèle"]
+    print(f"\n   Résultats identiques : {'✅ oui' if identical else '❌ NON'}")
+
+
+# === DOUBLONS (MinHash + LSH) ===
+
+_rng = np.random.default_rng(42)
+_MINHASH_A = _rng.integers(1, MINHASH_PRIME, size=(MINHASH_PERMUTATIONS, 1), dtype=np.uint64)
+_MINHASH_B = _rng.integers(0, MINHASH_PRIME, size=(MINHASH_PERMUTATIONS, 1), dtype=np.uint64)
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Hashes (distincts) des n-grammes de SHINGLE_WORDS mots, sans casse ni ponctuation."""
+    words = re.findall(r"\w+", text.lower())
+    grams = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def minhash(text: str) -> np.ndarray:
+    """Signature MinHash : minimum de chaque permutation (a * x + b) mod p sur les n-grammes."""
+    hashes = shingle_hashes(text) % MINHASH_PRIME
+    return ((_MINHASH_A * hashes + _MINHASH_B) % MINHASH_PRIME).min(axis=1).astype(np.uint32)
+
+
+def canonical_key(chunk: dict) -> tuple[str, str]:
+    """
+    Clé du canonique d'un groupe de doublons : plus petit hash du texte, puis
+    plus petit id (doublons exacts). Ne dépend pas de l'ordre des chunks.
+    """
+    return hash_text(chunk["texte"]), chunk["id"]
+
+
+class NearDuplicateIndex:
+    """
+    Index LSH incrémental. Les signatures sont coupées en LSH_BANDS bandes :
+    deux textes qui partagent une bande sont candidats, et doublons si leurs
+    signatures concordent sur au moins DEDUP_THRESHOLD des permutations.
+    Les doublons sont regroupés par union-find ; la racine d'un groupe est
+    son texte de plus petite clé (voir canonical_key).
+    """
+
+    def __init__(self):
+        self.signatures = []
+        self.keys = []
+        self.parent = []
+        self._buckets = {}  # (bande, valeurs) -> positions
+
+    def add(self, text: str, key) -> int:
+        """Ajoute un texte avec sa clé de canonique ; retourne sa position."""
+        signature = minhash(text)
+        position = len(self.signatures)
+        self.signatures.append(signature)
+        self.keys.append(key)
+        self.parent.append(position)
+
+        checked = set()
+        matches = []
+        for band, values in enumerate(signature.reshape(LSH_BANDS, -1)):
+            bucket = self._buckets.setdefault((band, values.tobytes()), [])
+            for other in bucket:
+                if other not in checked:
+                    checked.add(other)
+                    if np.mean(self.signatures[other] == signature) >= DEDUP_THRESHOLD:
+                        matches.append(other)
+            bucket.append(position)
+
+        for other in matches:
+            self.union(position, other)
+        return position
+
+    def find(self, position: int) -> int:
+        root = position
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[position] != root:
+            self.parent[position], position = root, self.parent[position]
+        return root
+
+    def union(self, a: int, b: int) -> None:
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            if self.keys[b] < self.keys[a]:
+                a, b = b, a
+            self.parent[b] = a
+
+    def is_canonical(self, position: int) -> bool:
+        """Le texte est-il (pour l'instant) le canonique de son groupe ?"""
+        return self.find(position) == position
+
+    def groups(self) -> list[list[int]]:
+        """Groupes de plus d'un texte : canonique en tête, puis les doublons dans l'ordre d'ajout."""
+        groups = {}
+        for position in range(len(self.parent)):
+            groups.setdefault(self.find(position), []).append(position)
+        return [[root] + [m for m in members if m != root]
+                for root, members in groups.items() if len(members) > 1]
+
+
+def deduplicate(chunks: list[dict]) -> list[list[int]]:
+    """
+    Marque les chunks quasi identiques (en place) : le canonique de chaque
+    groupe reçoit "doublons", les autres "doublon_de". Les marques d'un
+    passage précédent sont recalculées. Retourne les groupes (positions).
+    """
+    index = NearDuplicateIndex()
+    for chunk in chunks:
+        chunk["doublons"] = None
+        chunk["doublon_de"] = None
+        index.add(chunk["texte"], canonical_key(chunk))
+
+    groups = index.groups()
+    for members in groups:
+        canonical = chunks[members[0]]
+        canonical["doublons"] = [
+            {"id": chunks[m]["id"], "source": chunks[m]["source"], "section": chunks[m]["section"]}
+            for m in members[1:]
+        ]
+        for m in members[1:]:
+            chunks[m]["doublon_de"] = canonical["id"]
+    return groups
+
+
+def dedup_report(chunks: list[dict], groups: list[list[int]]) -> None:
+    """Affiche la réduction du corpus et les paires de sources qui se recouvrent."""
+    duplicates = [m for members in groups for m in members[1:]]
+    total_tokens = sum(c["tokens"] for c in chunks)
+    saved_tokens = sum(chunks[m]["tokens"] for m in duplicates)
+    print(f"\n🔁 Doublons : {len(duplicates)} chunk(s) dans {len(groups)} groupe(s)")
+    print(f"   Corpus    : {len(chunks)} → {len(chunks) - len(duplicates)} chunks "
+          f"({len(duplicates) / max(len(chunks), 1):.1%} de moins)")
+    print(f"   Tokens    : {total_tokens:,} → {total_tokens - saved_tokens:,} "
+          f"({saved_tokens / max(total_tokens, 1):.1%} d'embeddings et d'index en moins)")
+
+    pairs = {}
+    for members in groups:
+        canonical_source = chunks[members[0]]["source"]
+        for m in members[1:]:
+            key = (chunks[m]["source"], canonical_source)
+            pairs[key] = pairs.get(key, 0) + 1
+    for (source, canonical_source), count in sorted(pairs.items(), key=lambda item: -item[1])[:10]:
+        where = "dans la même source" if source == canonical_source else f"→ {canonical_source}"
+        print(f"   {count:>5} × {source} {where}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Découpage des textes en chunks")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help=f"processus de découpage (1 = séquentiel, défaut {WORKERS})")
+    parser.add_argument("--compare", action="store_true",
+                        help="compare le débit séquentiel / parallèle sur tous les fichiers, sans rien écrire")
+    return parser.parse_args()
 
 
 def main():
-    txt_files = list(PROCESSED_DIR.glob("*.txt"))
+    args = parse_args()
+    txt_files = sorted(PROCESSED_DIR.glob("*.txt"))
 
     if not txt_files:
         print(f"❌ Aucun fichier .txt dans {PROCESSED_DIR}/")
         print("   Lance d'abord : python scripts/01_extract_text.py")
         return
 
-    # Charger les chunks existants pour identifier les fichiers déjà traités
+    if args.compare:
+        compare_modes(txt_files, max(args.workers, 2))
+        return
+
     output_path = CHUNKS_DIR / "milarepa_chunks.jsonl"
-    processed_sources = set()
 
-    if output_path.exists():
-        with open(output_path, "r", encoding="utf-8") as f:
-            for line in f:
-                chunk = json.loads(line)
-                # Extraire le nom du fichier source de l'ID (format: filename_0000)
-                source_file = "_".join(chunk["id"].split("_")[:-1])
-                processed_sources.add(source_file)
-        print(f"📋 {len(processed_sources)} fichier(s) déjà traité(s)")
+    # Empreinte de chaque fichier : contenu + paramètres de découpage
+    manifest = Manifest()
+    fingerprints = {f.stem: fingerprint(manifest.file_hash(f), CHUNK_PARAMS) for f in txt_files}
+    fresh_sources = {
+        stem for stem, fp in fingerprints.items()
+        if manifest.is_fresh("chunk", stem, fp) and output_path.exists()
+    }
+    removed_sources = set(manifest.entries("chunk")) - set(fingerprints)
+    print(f"📋 {len(fresh_sources)} fichier(s) déjà à jour")
+
+    # Ne traiter que les fichiers nouveaux ou modifiés
+    new_txt_files = [f for f in txt_files if f.stem not in fresh_sources]
 
-    # Filtrer pour ne traiter que les nouveaux fichiers
-    new_txt_files = [f for f in txt_files if f.stem not in processed_sources]
+    # Les doublons se recalculent sur tout le corpus dès que le fichier de chunks change
+    dedup_fresh = output_path.exists() and manifest.is_fresh(
+        "dedup", output_path.name, fingerprint(manifest.file_hash(output_path), DEDUP_PARAMS))
 
-    if not new_txt_files:
+    if not new_txt_files and not removed_sources and dedup_fresh:
         print(f"✅ Tous les fichiers .txt ont déjà été chunkés ({len(txt_files)} fichiers)")
         print(f"   Aucun nouveau fichier à traiter.")
         return
 
     print(f"📚 {len(txt_files)} fichier(s) .txt trouvé(s)")
-    print(f"📚 {len(new_txt_files)} nouveau(x) fichier(s) à chunker\n")
+    print(f"📚 {len(new_txt_files)} fichier(s) nouveau(x) ou modifié(s) à chunker\n")
 
     all_chunks = []
-
-    for txt_path in new_txt_files:
-        print(f"\n📖 Traitement de {txt_path.name}...")
-        chunks = process_file(txt_path)
-        all_chunks.extend(chunks)
-        print(f"  ✅ {len(chunks)} chunks créés")
-
-    # Sauvegarder en mode APPEND (ajouter aux chunks existants)
-    mode = "a" if output_path.exists() else "w"
-    with open(output_path, mode, encoding="utf-8") as f:
-        for chunk in all_chunks:
-            f.write(json.dumps(asdict(chunk), ensure_ascii=False) + "\n")
+    chunk_counts = {}
+
+    if args.workers > 1 and len(new_txt_files) > 0:
+        print(f"⚙️  Découpage parallèle ({args.workers} processus)...")
+        start = time.perf_counter()
+        chunks_by_stem, encoded_tokens = process_files_parallel(new_txt_files, args.workers)
+        elapsed = time.perf_counter() - start
+        for txt_path in new_txt_files:
+            chunks = chunks_by_stem[txt_path.stem]
+            all_chunks.extend(chunks)
+            chunk_counts[txt_path.stem] = len(chunks)
+            print(f"  ✅ {txt_path.name} : {len(chunks)} chunks créés")
+        print(f"  ⏱️  {encoded_tokens:,} tokens en {elapsed:.2f}s ({encoded_tokens / max(elapsed, 1e-9):,.0f} tokens/s)")
+    else:
+        for txt_path in new_txt_files:
+            print(f"\n📖 Traitement de {txt_path.name}...")
+            chunks = process_file(txt_path)
+            all_chunks.extend(chunks)
+            chunk_counts[txt_path.stem] = len(chunks)
+            print(f"  ✅ {len(chunks)} chunks créés")
+
+    # Conserver les chunks des fichiers à jour (id au format : filename_0000)
+    kept_chunks = []
+    if output_path.exists():
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                if chunk["id"].rsplit("_", 1)[0] in fresh_sources:
+                    kept_chunks.append(chunk)
+
+    # Chunks conservés + (re)générés, dans l'ordre des noms de fichiers
+    output_chunks = sorted(kept_chunks + [asdict(chunk) for chunk in all_chunks],
+                           key=lambda c: c["id"].rsplit("_", 1)[0])
+    start = time.perf_counter()
+    groups = deduplicate(output_chunks)
+    print(f"\n🔍 Recherche des doublons : {time.perf_counter() - start:.2f}s")
+
+    # Réécrire le fichier
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for chunk in output_chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+
+    for stem, count in chunk_counts.items():
+        manifest.record("chunk", stem, fingerprints[stem], chunks=count)
+    for stem in removed_sources:
+        manifest.forget("chunk", stem)
+    manifest.record("dedup", output_path.name, fingerprint(manifest.file_hash(output_path), DEDUP_PARAMS),
+                    groups=len(groups))
+    manifest.save()
 
     # Stats
     total_tokens = sum(c.tokens for c in all_chunks)
@@ -268,14 +726,19 @@ def main():
     for c in all_chunks:
         types[c.type] = types.get(c.type, 0) + 1
 
+    dedup_report(output_chunks, groups)
+
     print(f"\n{'='*50}")
     print(f"🎉 CHUNKING TERMINÉ")
     print(f"   Nouveaux chunks : {len(all_chunks)}")
+    print(f"   Conservés       : {len(kept_chunks)}")
+    print(f"   Doublons        : {sum(len(members) - 1 for members in groups)} (non vectorisés)")
     print(f"   Total tokens    : {total_tokens:,}")
-    print(f"   Moyenne/chunk   : {total_tokens // len(all_chunks)} tokens")
+    print(f"   Moyenne/chunk   : {total_tokens // max(len(all_chunks), 1)} tokens")
     print(f"   Types : {types}")
     print(f"   Fichier : {output_path}")
-    print(f"   Mode : {'APPEND (ajout)' if mode == 'a' else 'NOUVEAU'}")
+    if removed_sources:
+        print(f"   Sources retirées : {', '.join(sorted(removed_sources))}")
 
 
 if __name__ == "__main__":
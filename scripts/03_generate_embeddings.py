@@ -4,105 +4,345 @@ MILARIPPA - Étape 3 : Génération des Embeddings
 Transforme chaque chunk de texte en vecteur numérique (embedding).
 Ces vecteurs capturent le SENS du texte, pas juste les mots.
 Utilise l'API OpenAI (text-embedding-3-small) par défaut.
+Les vecteurs sont écrits en binaire (data/chunks/embeddings/, voir
+app/embedding_store.py), les métadonnées à côté, ligne à ligne.
 """
 
 import json
 import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APIStatusError, RateLimitError
 from tqdm import tqdm
 
+from embedding_cache import EmbeddingCache
+from manifest import Manifest, fingerprint, hash_text
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+from embedding_store import EMBEDDINGS_DIR, EmbeddingStore, open_store
+from storage import check_embedding_dimensions
+
 load_dotenv()
 
 # Config
 CHUNKS_DIR = Path("data/chunks")
 INPUT_FILE = CHUNKS_DIR / "milarepa_chunks.jsonl"
-OUTPUT_FILE = CHUNKS_DIR / "milarepa_chunks_with_embeddings.jsonl"
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
-BATCH_SIZE = 50  # Nombre de chunks par requête API (max ~2048 pour OpenAI)
+# Dimensions réduites par l'API (text-embedding-3, 0 : dimension native). Doit valoir
+# la même chose pour l'app ; seulement avec RETRIEVAL_BACKEND=local (Supabase : VECTOR(1536))
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 0))
+# Changer de modèle ou de dimensions re-vectorise tout (empreintes et clés du cache)
+EMBED_PARAMS = {"model": EMBEDDING_MODEL, **({"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {})}
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")  # float16 : magasin deux fois plus petit
+NATIVE_DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+# Batches remplis au nombre de tokens (limite API : 300k tokens et 2048 textes par requête)
+MAX_BATCH_TOKENS = 100_000
+MAX_BATCH_INPUTS = 2048
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))  # Requêtes simultanées
+MAX_ATTEMPTS = 8          # Tentatives par batch avant d'arrêter le run
+BACKOFF_BASE = 1.0        # Secondes, doublées à chaque échec
+BACKOFF_MAX = 60.0
+PRICE_PER_M_TOKENS = 0.02  # text-embedding-3-small, en dollars
+COMPACT_RATIO = 2.0  # Compacter le magasin quand il a plus de 2 lignes par chunk vivant
+
+# Les retries sont gérés ici (en-têtes de rate limit), pas par le client
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+def parse_reset(value: str | None) -> float:
+    """Durée d'un en-tête x-ratelimit-reset-* ("20ms", "1s", "6m0s") en secondes."""
+    if not value:
+        return 0.0
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(n) * units[u] for n, u in re.findall(r"([\d.]+)(ms|h|m|s)", value))
+
+
+class RateLimiter:
+    """
+    Pause partagée par tous les threads : après un 429 (Retry-After) ou quand
+    les en-têtes annoncent un quota épuisé, plus aucune requête ne part avant
+    la fin de la fenêtre.
+    """
+
+    def __init__(self):
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def update(self, headers, batch_tokens: int) -> None:
+        """Anticipe le rate limit : si le quota restant ne couvre pas un batch de plus, attendre le reset."""
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_requests is not None and int(remaining_requests) < 1:
+            self.pause(parse_reset(headers.get("x-ratelimit-reset-requests")))
+        if remaining_tokens is not None and int(remaining_tokens) < batch_tokens:
+            self.pause(parse_reset(headers.get("x-ratelimit-reset-tokens")))
+
+
+rate_limiter = RateLimiter()
+
+
+def chunk_tokens(chunk: dict) -> int:
+    """Tokens d'un chunk (compté à l'étape 2, sinon estimé)."""
+    return chunk.get("tokens") or len(chunk["texte"]) // 3 + 1
+
+
+def pack_batches(chunks: list[dict]) -> list[list[dict]]:
+    """Regroupe les chunks en batches remplis jusqu'à MAX_BATCH_TOKENS / MAX_BATCH_INPUTS."""
+    batches = []
+    batch, batch_tokens = [], 0
+    for chunk in chunks:
+        tokens = chunk_tokens(chunk)
+        if batch and (batch_tokens + tokens > MAX_BATCH_TOKENS or len(batch) >= MAX_BATCH_INPUTS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_retryable(error: Exception) -> bool:
+    """Erreurs passagères : rate limit, réseau, timeouts, erreurs 5xx."""
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Délai avant la tentative suivante : Retry-After si fourni, sinon backoff exponentiel."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        reset = parse_reset(response.headers.get("x-ratelimit-reset-tokens"))
+        if reset:
+            return reset
+    return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
 
 
-def get_embeddings(texts: list[str]) -> list[list[float]]:
-    """Génère les embeddings pour une liste de textes."""
-    response = client.embeddings.create(
-        model=EMBEDDING_MODEL,
-        input=texts,
-    )
-    return [item.embedding for item in response.data]
+def get_embeddings(texts: list[str], batch_tokens: int = 0) -> list[list[float]]:
+    """Génère les embeddings pour une liste de textes (avec retries et rate limit)."""
+    for attempt in range(MAX_ATTEMPTS):
+        rate_limiter.wait()
+        try:
+            raw = client.embeddings.with_raw_response.create(
+                input=texts,
+                **EMBED_PARAMS,
+            )
+        except Exception as e:
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = retry_delay(e, attempt)
+            if isinstance(e, RateLimitError):
+                rate_limiter.pause(delay)  # Tous les threads ralentissent
+            else:
+                time.sleep(delay)
+            continue
+
+        rate_limiter.update(raw.headers, batch_tokens)
+        response = raw.parse()
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def estimate_cost(tokens: int) -> float:
+    """Coût estimé en dollars d'un nombre de tokens vectorisés."""
+    return (tokens / 1_000_000) * PRICE_PER_M_TOKENS
+
+
+def compact_if_needed(store: EmbeddingStore, manifest: Manifest, live_count: int) -> None:
+    """Les versions remplacées et les chunks supprimés s'accumulent : compacter au-delà du seuil."""
+    if len(store) > COMPACT_RATIO * max(live_count, 1):
+        dropped = store.compact(manifest.entries("embed"))
+        print(f"🗜️  Magasin compacté : {dropped} ligne(s) morte(s) retirée(s)")
+
+
+def open_embeddings_store(manifest: Manifest) -> EmbeddingStore:
+    """
+    Magasin des vecteurs de EMBED_PARAMS. Après un changement de modèle ou
+    de dimensions, l'ancien magasin est mis de côté (pas de mélange de
+    dimensions) et ses entrées du manifest oubliées : tout est re-vectorisé,
+    en reprenant du cache les textes déjà payés avec ces paramètres.
+    """
+    store, archived = open_store(EMBEDDINGS_DIR, EMBEDDING_DTYPE, EMBED_PARAMS,
+                                 dim=EMBEDDING_DIMENSIONS or NATIVE_DIMENSIONS.get(EMBEDDING_MODEL))
+    if archived is not None:
+        for chunk_id in list(manifest.entries("embed")):
+            manifest.forget("embed", chunk_id)
+        manifest.save()
+        print(f"♻️  Paramètres d'embedding changés ({EMBED_PARAMS}) : nouveau magasin,")
+        print(f"   l'ancien est gardé dans {archived}.")
+    repaired = store.reconcile()
+    if repaired:
+        print(f"🩹 Ajout interrompu réparé : {repaired} ligne(s) incomplète(s) retirée(s)")
+    return store
+
+
+def embed_batch(batch: list[dict]) -> list[dict]:
+    """Vectorise un batch de chunks (exécuté dans un thread)."""
+    embeddings = get_embeddings([chunk["texte"] for chunk in batch], sum(map(chunk_tokens, batch)))
+    return [{**chunk, "embedding": embedding} for chunk, embedding in zip(batch, embeddings)]
 
 
 def main():
+    try:
+        check_embedding_dimensions(EMBEDDING_DIMENSIONS)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
     if not INPUT_FILE.exists():
         print(f"❌ Fichier non trouvé : {INPUT_FILE}")
         print("   Lance d'abord : python scripts/02_chunk_texts.py")
         return
 
-    # Charger tous les chunks
+    # Charger tous les chunks, sauf les doublons (leur canonique est vectorisé)
     all_chunks = []
     with open(INPUT_FILE, "r", encoding="utf-8") as f:
         for line in f:
-            all_chunks.append(json.loads(line))
+            chunk = json.loads(line)
+            if not chunk.get("doublon_de"):
+                all_chunks.append(chunk)
+
+    # Empreinte de chaque chunk : hash du texte + modèle
+    manifest = Manifest()
+    fingerprints = {c["id"]: fingerprint(hash_text(c["texte"]), EMBED_PARAMS) for c in all_chunks}
+    store = open_embeddings_store(manifest)
+    output_exists = len(store) > 0
+
+    # Premier passage avec le manifest : adopter les embeddings déjà présents
+    # dont le texte n'a pas changé (pour ne pas payer deux fois)
+    if output_exists and not manifest.entries("embed"):
+        for _, chunk in store.iter_meta():
+            fp = fingerprints.get(chunk["id"])
+            if fp and fingerprint(hash_text(chunk["texte"]), EMBED_PARAMS) == fp:
+                manifest.record("embed", chunk["id"], fp)
+        print(f"📋 Manifest initialisé : {len(manifest.entries('embed'))} embedding(s) existant(s) repris")
+
+    # Ne vectoriser que les chunks nouveaux ou dont le texte a changé
+    chunks = [
+        c for c in all_chunks
+        if not (output_exists and manifest.is_fresh("embed", c["id"], fingerprints[c["id"]]))
+    ]
+    print(f"📋 {len(all_chunks) - len(chunks)} chunk(s) déjà vectorisé(s)")
 
-    # Charger les chunks qui ont déjà des embeddings
-    processed_chunk_ids = set()
-    if OUTPUT_FILE.exists():
-        with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                chunk = json.loads(line)
-                processed_chunk_ids.add(chunk["id"])
-        print(f"📋 {len(processed_chunk_ids)} chunk(s) déjà vectorisé(s)")
+    # Textes déjà payés (même texte, même modèle, autre id) : repris du cache
+    cache = EmbeddingCache()
+    if not len(cache) and output_exists:
+        # Premier passage avec le cache : y verser les embeddings déjà stockés
+        # (avant d'oublier les ids disparus, dont les textes restent utiles)
+        stored, rows = store.latest(manifest.entries("embed"))
+        keys = [manifest.entries("embed")[c["id"]]["fingerprint"] for c in stored]
+        cache.add(keys, store.vectors()[rows], [chunk_tokens(c) for c in stored])
+        print(f"♻️  Cache initialisé : {len(cache)} embedding(s)")
 
-    # Filtrer pour ne traiter que les nouveaux chunks
-    chunks = [c for c in all_chunks if c["id"] not in processed_chunk_ids]
+    # Oublier les chunks qui n'existent plus (leurs lignes mortes sont ignorées à la lecture)
+    removed_ids = set(manifest.entries("embed")) - set(fingerprints)
+    for chunk_id in removed_ids:
+        manifest.forget("embed", chunk_id)
+
+    hits = [c for c in chunks if fingerprints[c["id"]] in cache]
+    if hits:
+        store.append(hits, [cache.get(fingerprints[c["id"]]) for c in hits])
+        for chunk in hits:
+            manifest.record("embed", chunk["id"], fingerprints[chunk["id"]])
+        manifest.save()
+        hit_tokens = sum(map(chunk_tokens, hits))
+        print(f"♻️  Cache : {len(hits)}/{len(chunks)} chunk(s) repris sans appel API "
+              f"({hit_tokens:,} tokens, ${estimate_cost(hit_tokens):.4f} économisés)")
+        chunks = [c for c in chunks if fingerprints[c["id"]] not in cache]
 
     if not chunks:
+        manifest.save()
+        compact_if_needed(store, manifest, len(all_chunks))
         print(f"✅ Tous les chunks ont déjà des embeddings ({len(all_chunks)} chunks)")
         print(f"   Aucun nouveau chunk à vectoriser.")
         return
 
     print(f"📊 {len(all_chunks)} chunks au total")
-    print(f"📊 {len(chunks)} nouveau(x) chunk(s) à vectoriser")
-    print(f"🤖 Modèle : {EMBEDDING_MODEL}")
-    print(f"📦 Batch size : {BATCH_SIZE}\n")
+    print(f"📊 {len(chunks)} chunk(s) nouveau(x) ou modifié(s) à vectoriser")
+    print(f"🤖 Modèle : {EMBEDDING_MODEL}" + (f" ({EMBEDDING_DIMENSIONS} dimensions)" if EMBEDDING_DIMENSIONS else ""))
+    batches = pack_batches(chunks)
+    print(f"📦 {len(batches)} batch(es) de {MAX_BATCH_TOKENS:,} tokens max, {EMBED_CONCURRENCY} en parallèle\n")
 
-    # Traiter par batches
+    # Chaque batch terminé est ajouté au magasin et au manifest aussitôt :
+    # un run interrompu reprend exactement là où il s'est arrêté.
+    # Le magasin est en ajout : la dernière ligne d'un id remplace les précédentes.
     all_results = []
-    for i in tqdm(range(0, len(chunks), BATCH_SIZE), desc="Embedding"):
-        batch = chunks[i:i + BATCH_SIZE]
-        texts = [chunk["texte"] for chunk in batch]
+    dim = None
+    error = None
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as executor, \
+            tqdm(total=len(chunks), desc="Embedding") as progress:
+        pending = {executor.submit(embed_batch, batch) for batch in batches}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Pas de batch sauté : à la première erreur, les batches en attente sont
+                # annulés, mais ceux déjà en vol sont attendus et enregistrés (déjà payés)
+                try:
+                    results = future.result()
+                    vectors = [chunk.pop("embedding") for chunk in results]
+                    store.append(results, vectors)
+                except Exception as e:
+                    if error is None:
+                        error = e
+                        for other in pending:
+                            other.cancel()
+                    continue
 
-        try:
-            embeddings = get_embeddings(texts)
+                cache.add([fingerprints[c["id"]] for c in results], vectors, [chunk_tokens(c) for c in results])
+                dim = store.dim
+                for chunk in results:
+                    manifest.record("embed", chunk["id"], fingerprints[chunk["id"]])
+                manifest.save()
+                all_results.extend(results)
+                progress.update(len(results))
+            pending = {future for future in pending if not future.cancelled()}
 
-            for chunk, embedding in zip(batch, embeddings):
-                chunk["embedding"] = embedding
-                all_results.append(chunk)
+    manifest.save()
 
-        except Exception as e:
-            print(f"\n❌ Erreur batch {i}: {e}")
-            # On continue avec les suivants
-            continue
+    compact_if_needed(store, manifest, len(all_chunks))
 
-    # Sauvegarder en mode APPEND
-    mode = "a" if OUTPUT_FILE.exists() else "w"
-    with open(OUTPUT_FILE, mode, encoding="utf-8") as f:
-        for chunk in all_results:
-            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    if error is not None:
+        print(f"\n❌ Arrêt après une erreur non récupérable : {error}")
+        print(f"   {len(chunks) - len(all_results)} chunk(s) restant(s) : relance le script pour reprendre.")
 
     print(f"\n{'='*50}")
     print(f"🎉 EMBEDDINGS GÉNÉRÉS")
     print(f"   Nouveaux chunks : {len(all_results)}/{len(chunks)}")
-    print(f"   Dimension vecteur : {len(all_results[0]['embedding']) if all_results else 'N/A'}")
-    print(f"   Fichier : {OUTPUT_FILE}")
-    print(f"   Mode : {'APPEND (ajout)' if mode == 'a' else 'NOUVEAU'}")
+    print(f"   Dimension vecteur : {dim or 'N/A'} ({store.dtype.name})")
+    print(f"   Magasin : {store.directory} ({len(store)} lignes)")
 
     # Estimation du coût (text-embedding-3-small = $0.02 / 1M tokens)
     total_tokens = sum(c.get("tokens", 0) for c in all_results)
-    cost = (total_tokens / 1_000_000) * 0.02
-    print(f"   💰 Coût estimé : ${cost:.4f}")
+    print(f"   💰 Coût estimé : ${estimate_cost(total_tokens):.4f}")
+    if hits:
+        print(f"   ♻️  Économisé par le cache : ${estimate_cost(hit_tokens):.4f} ({len(hits)} chunk(s))")
+
+    if error is not None:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -2,21 +2,47 @@
 MILARIPPA - Étape 4 : Upload vers Supabase
 ===========================================
 Envoie tous les chunks avec leurs embeddings dans la base vectorielle Supabase.
-⚠️ Avant de lancer ce script, exécuter setup_supabase.sql dans le SQL Editor de Supabase !
+⚠️ Avant de lancer ce script, appliquer le schéma : python scripts/migrate.py
+(ou coller scripts/migrations/*.sql dans le SQL Editor de Supabase) !
+
+Les batches sont dimensionnés en octets (pas en lignes), envoyés en
+parallèle, et chaque batch confirmé est enregistré dans le manifest : un
+upload interrompu reprend sans relire la table.
+
+Mode --sync : compare les chunks voulus (étape 3) à ceux présents dans
+Supabase, puis supprime, met à jour et insère par batches ; le magasin
+d'embeddings local est compacté (lignes mortes retirées).
 """
 
+import argparse
 import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+
+import numpy as np
 from dotenv import load_dotenv
 from supabase import create_client
 from tqdm import tqdm
 
+from manifest import Manifest, fingerprint, hash_text
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+from embedding_store import EMBEDDINGS_DIR, EmbeddingStore
+from storage import SUPABASE_VECTOR_DIM
+
 load_dotenv()
 
 # Config
-CHUNKS_FILE = Path("data/chunks/milarepa_chunks_with_embeddings.jsonl")
-BATCH_SIZE = 50  # Supabase accepte des inserts en batch
+MAX_BATCH_BYTES = 1_000_000   # Taille max d'une requête d'upsert (JSON)
+MAX_BATCH_ROWS = 500
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))  # Requêtes simultanées
+ID_PAGE_SIZE = 1000           # Limite de lignes par requête de l'API REST Supabase
+DELETE_BATCH_SIZE = 1000      # Ids par appel de delete_milarepa_chunks (dans le corps JSON)
+MAX_ATTEMPTS = 5              # Tentatives par batch
+BACKOFF_BASE = 1.0           # Secondes, doublées à chaque échec
 
 supabase = create_client(
     os.getenv("SUPABASE_URL"),
@@ -24,77 +50,309 @@ supabase = create_client(
 )
 
 
-def main():
-    if not CHUNKS_FILE.exists():
-        print(f"❌ Fichier non trouvé : {CHUNKS_FILE}")
-        print("   Lance d'abord : python scripts/03_generate_embeddings.py")
-        return
+def vector_literal(vector) -> str:
+    """Vecteur au format texte de pgvector, le plus court possible ("[0.0123,-0.04]")."""
+    # str() d'un float32 numpy = plus courte écriture qui relit la même valeur
+    return "[" + ",".join(map(str, np.asarray(vector, dtype=np.float32))) + "]"
 
-    # Charger tous les chunks
-    all_chunks = []
-    with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            all_chunks.append(json.loads(line))
 
-    print(f"📋 {len(all_chunks)} chunks chargés depuis le fichier")
+def upload_row(chunk: dict, vector) -> dict:
+    """Ligne de la table milarepa_chunks (vecteur en texte pgvector compact)."""
+    return {
+        "id": chunk["id"],
+        "source": chunk["source"],
+        "langue": chunk["langue"],
+        "section": chunk.get("section", ""),
+        "type": chunk.get("type", "enseignement"),
+        "texte": chunk["texte"],
+        "tokens": chunk.get("tokens", 0),
+        "embedding": vector_literal(vector),
+    }
 
-    # Récupérer les IDs déjà présents dans Supabase
-    print(f"🔍 Vérification des chunks déjà présents dans Supabase...")
-    try:
-        existing_chunks = supabase.table("milarepa_chunks").select("id").execute()
-        existing_ids = {chunk["id"] for chunk in existing_chunks.data}
-        print(f"📊 {len(existing_ids)} chunk(s) déjà en base")
-    except Exception as e:
-        print(f"⚠️ Erreur lors de la récupération des IDs : {e}")
-        print(f"   Tentative d'upload de tous les chunks...")
-        existing_ids = set()
 
-    # Filtrer pour ne uploader que les nouveaux chunks
-    chunks = [c for c in all_chunks if c["id"] not in existing_ids]
+def fetch_existing_ids() -> list[str]:
+    """Tous les ids présents dans la table, page par page (l'API tronque les gros select)."""
+    ids = []
+    start = 0
+    while True:
+        page = (
+            supabase.table("milarepa_chunks")
+            .select("id")
+            .order("id")
+            .range(start, start + ID_PAGE_SIZE - 1)
+            .execute()
+        )
+        ids.extend(row["id"] for row in page.data)
+        if len(page.data) < ID_PAGE_SIZE:
+            return ids
+        start += ID_PAGE_SIZE
 
-    if not chunks:
-        print(f"✅ Tous les chunks sont déjà dans Supabase ({len(all_chunks)} chunks)")
-        print(f"   Aucun nouveau chunk à uploader.")
-        return
 
-    print(f"📤 Upload de {len(chunks)} nouveau(x) chunk(s) vers Supabase...\n")
+def pack_batches(rows: list[dict]) -> list[list[dict]]:
+    """Regroupe les lignes jusqu'à MAX_BATCH_BYTES de JSON (ou MAX_BATCH_ROWS lignes)."""
+    batches = []
+    batch, batch_bytes = [], 0
+    for row in rows:
+        size = len(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+        if batch and (batch_bytes + size > MAX_BATCH_BYTES or len(batch) >= MAX_BATCH_ROWS):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(row)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def upload_batch(rows: list[dict]) -> list[dict]:
+    """Upsert d'un batch, avec backoff exponentiel sur les erreurs (exécuté dans un thread)."""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            supabase.table("milarepa_chunks").upsert(rows).execute()
+            return rows
+        except Exception:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(BACKOFF_BASE * 2 ** attempt)
+
+
+def delete_batch(ids: list[str]) -> list[str]:
+    """Suppression d'un batch d'ids, avec backoff exponentiel (exécuté dans un thread)."""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            # RPC (migration 005) : les ids partent dans le corps, pas dans l'URL
+            supabase.rpc("delete_milarepa_chunks", {"ids": ids}).execute()
+            return ids
+        except Exception:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(BACKOFF_BASE * 2 ** attempt)
+
+
+def check_vector_dim(dim: int) -> None:
+    """La colonne embedding est un VECTOR(1536) : un autre magasin échouerait à chaque batch."""
+    if dim and dim != SUPABASE_VECTOR_DIM:
+        print(f"❌ Vecteurs de {dim} dimensions : Supabase attend VECTOR({SUPABASE_VECTOR_DIM})")
+        print("   Avec EMBEDDING_DIMENSIONS, la recherche passe par l'index local (05_build_index.py)")
+        sys.exit(1)
+
+
+def embedded_chunks(store: EmbeddingStore, manifest: Manifest) -> tuple[dict, list[dict], np.ndarray]:
+    """
+    Chunks vivants de l'étape 3 : (empreintes {id: entrée}, dernières
+    versions, lignes dans le magasin). Sans manifest d'embeddings (magasin
+    converti, manifest supprimé), toutes les lignes du magasin comptent, avec
+    une empreinte recalculée depuis leur texte (non enregistrée : c'est
+    l'étape 3 qui tient le manifest des embeddings).
+    """
+    embedded = manifest.entries("embed")
+    if embedded:
+        chunks, rows = store.latest(embedded)
+        return embedded, chunks, rows
+
+    chunks, rows = store.latest()
+    params = store.stored_params() or {}
+    print(f"⚠️ Manifest d'embeddings vide : les {len(chunks)} chunks du magasin sont pris tels quels")
+    embedded = {chunk["id"]: {"fingerprint": fingerprint(hash_text(chunk["texte"]), params)} for chunk in chunks}
+    return embedded, chunks, rows
+
+
+def upload_chunks(chunks: list[dict], vectors, row_of: dict, manifest: Manifest,
+                  embedded: dict) -> tuple[int, int]:
+    """
+    Upsert de chunks par batches concurrents ; chaque batch confirmé est
+    enregistré dans le manifest aussitôt (empreintes de `embedded`).
+    Retourne (succès, erreurs).
+    """
+    upload_rows = [upload_row(chunk, vectors[row_of[chunk["id"]]]) for chunk in chunks]
+    batches = pack_batches(upload_rows)
+    print(f"📦 {len(batches)} batch(es) de {MAX_BATCH_BYTES / 1_000_000:.1f} Mo max, {UPLOAD_CONCURRENCY} en parallèle\n")
 
-    # Upload par batches
     success = 0
     errors = 0
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor, \
+            tqdm(total=len(upload_rows), desc="Upload") as progress:
+        futures = {executor.submit(upload_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"\n❌ Erreur batch ({batch[0]['id']}…, {len(batch)} chunks) : {e}")
+                errors += len(batch)
+                continue
+
+            success += len(batch)
+            for row in batch:
+                manifest.record("upload", row["id"], embedded[row["id"]]["fingerprint"])
+            manifest.save()
+            progress.update(len(batch))
+
+    manifest.save()
+    return success, errors
+
+
+def sync(store: EmbeddingStore, manifest: Manifest, dry_run: bool = False) -> None:
+    """Aligne Supabase sur les chunks voulus : suppressions, mises à jour, insertions."""
+    embedded, all_chunks, rows = embedded_chunks(store, manifest)
+    row_of = {chunk["id"]: int(row) for chunk, row in zip(all_chunks, rows)}
+    if not all_chunks:
+        # Un magasin vide viderait la table : c'est forcément une erreur
+        print("❌ Aucun chunk dans le magasin d'embeddings : rien n'est supprimé")
+        sys.exit(1)
+
+    print(f"🔍 Lecture des ids présents dans Supabase...")
+    deployed = set(fetch_existing_ids())
+    desired = set(row_of)
 
-    for i in tqdm(range(0, len(chunks), BATCH_SIZE), desc="Upload"):
-        batch = chunks[i:i + BATCH_SIZE]
-
-        # Préparer les données (format Supabase)
-        rows = []
-        for chunk in batch:
-            rows.append({
-                "id": chunk["id"],
-                "source": chunk["source"],
-                "langue": chunk["langue"],
-                "section": chunk.get("section", ""),
-                "type": chunk.get("type", "enseignement"),
-                "texte": chunk["texte"],
-                "tokens": chunk.get("tokens", 0),
-                "embedding": chunk["embedding"],
-            })
+    # Premier --sync sans manifest d'upload : les chunks en base sont supposés à jour
+    # (comme au premier upload), au lieu d'être tous ré-upsertés
+    if not manifest.entries("upload"):
+        for chunk_id in deployed & desired:
+            manifest.record("upload", chunk_id, embedded[chunk_id]["fingerprint"])
+        if not dry_run:
+            manifest.save()
+        print(f"📋 Manifest d'upload initialisé : {len(deployed & desired)} chunk(s) déjà en base")
 
+    to_delete = sorted(deployed - desired)
+    to_insert = [c for c in all_chunks if c["id"] not in deployed]
+    to_update = [
+        c for c in all_chunks
+        if c["id"] in deployed and not manifest.is_fresh("upload", c["id"], embedded[c["id"]]["fingerprint"])
+    ]
+
+    print(f"📋 Voulus : {len(desired)} | En base : {len(deployed)}")
+    print(f"   🗑️  À supprimer   : {len(to_delete)}")
+    print(f"   ✏️  À mettre à jour : {len(to_update)}")
+    print(f"   ➕ À insérer     : {len(to_insert)}")
+    if dry_run:
+        print(f"\n🔎 --dry-run : aucune modification")
+        return
+
+    # Suppressions d'abord : les chunks périmés ne concurrencent plus la recherche
+    deleted = 0
+    delete_errors = 0
+    batches = [to_delete[i:i + DELETE_BATCH_SIZE] for i in range(0, len(to_delete), DELETE_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor:
+        for future in as_completed([executor.submit(delete_batch, batch) for batch in batches]):
+            try:
+                ids = future.result()
+            except Exception as e:
+                print(f"\n❌ Erreur de suppression : {e}")
+                delete_errors += 1
+                continue
+            deleted += len(ids)
+            for chunk_id in ids:
+                manifest.forget("upload", chunk_id)
+            manifest.save()
+
+    # Le manifest ne garde que ce qui est réellement en base
+    for chunk_id in set(manifest.entries("upload")) - deployed:
+        manifest.forget("upload", chunk_id)
+
+    success, errors = (0, 0)
+    if to_update or to_insert:
+        vectors = store.vectors()
+        success, errors = upload_chunks(to_update + to_insert, vectors, row_of, manifest, embedded)
+    manifest.save()
+
+    # Compacter le magasin local : une seule ligne par chunk vivant
+    before = len(store)
+    store.compact(embedded)
+
+    print(f"\n{'='*50}")
+    print("⚠️  SYNCHRONISATION INCOMPLÈTE" if errors or delete_errors else "🎉 SYNCHRONISATION TERMINÉE")
+    print(f"   🗑️  Supprimés        : {deleted}" + (f" ({delete_errors} batch(es) en erreur)" if delete_errors else ""))
+    print(f"   ✅ Upsertés         : {success}")
+    print(f"   ❌ Erreurs          : {errors}" + (" (relance pour reprendre)" if errors or delete_errors else ""))
+    print(f"   🗜️  Magasin compacté : {before} → {len(store)} lignes")
+    count = supabase.table("milarepa_chunks").select("id", count="exact").execute()
+    print(f"   📊 Total en base    : {count.count} chunks")
+    if errors or delete_errors:
+        sys.exit(1)  # Code d'erreur pour les enchaînements (CI, cron)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload des chunks vers Supabase")
+    parser.add_argument("--sync", action="store_true",
+                        help="supprime aussi de Supabase les chunks qui n'existent plus et compacte le magasin local")
+    parser.add_argument("--dry-run", action="store_true", help="avec --sync : affiche le plan sans rien modifier")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    store = EmbeddingStore(EMBEDDINGS_DIR)
+    if not store.exists():
+        print(f"❌ Embeddings non trouvés : {EMBEDDINGS_DIR}")
+        print("   Lance d'abord : python scripts/03_generate_embeddings.py")
+        return
+
+    check_vector_dim(store.dim)
+
+    # Chunks vivants = ceux vectorisés par l'étape 3 (dernière version de chaque id)
+    manifest = Manifest()
+    if args.sync:
+        sync(store, manifest, dry_run=args.dry_run)
+        return
+
+    embedded, all_chunks, rows = embedded_chunks(store, manifest)
+    vectors = store.vectors()
+    row_of = {chunk["id"]: int(row) for chunk, row in zip(all_chunks, rows)}
+
+    print(f"📋 {len(all_chunks)} chunks chargés depuis le magasin d'embeddings")
+    if not all_chunks:
+        print("❌ Aucun chunk à uploader : lance d'abord python scripts/03_generate_embeddings.py")
+        sys.exit(1)
+
+    # Premier passage avec le manifest : reprendre les IDs déjà présents dans Supabase
+    if not manifest.entries("upload"):
+        print(f"🔍 Vérification des chunks déjà présents dans Supabase...")
         try:
-            result = supabase.table("milarepa_chunks").upsert(rows).execute()
-            success += len(batch)
+            for chunk_id in fetch_existing_ids():
+                if chunk_id in embedded:
+                    manifest.record("upload", chunk_id, embedded[chunk_id]["fingerprint"])
+            manifest.save()
+            print(f"📊 {len(manifest.entries('upload'))} chunk(s) déjà en base")
         except Exception as e:
-            print(f"\n❌ Erreur batch {i}: {e}")
-            errors += len(batch)
+            print(f"⚠️ Erreur lors de la récupération des IDs : {e}")
+            print(f"   Tentative d'upload de tous les chunks...")
+
+    # N'uploader que les chunks nouveaux ou dont l'embedding a changé
+    chunks = [
+        c for c in all_chunks
+        if not manifest.is_fresh("upload", c["id"], embedded[c["id"]]["fingerprint"])
+    ]
+
+    # Chunks supprimés localement : ils restent en base (suppression avec --sync)
+    stale_ids = set(manifest.entries("upload")) - set(embedded)
+    for chunk_id in stale_ids:
+        manifest.forget("upload", chunk_id)
+    if stale_ids:
+        print(f"⚠️ {len(stale_ids)} chunk(s) retiré(s) localement restent dans Supabase (--sync pour les supprimer)")
+
+    if not chunks:
+        manifest.save()
+        print(f"✅ Tous les chunks sont déjà dans Supabase ({len(all_chunks)} chunks)")
+        print(f"   Aucun nouveau chunk à uploader.")
+        return
+
+    print(f"📤 Upload de {len(chunks)} chunk(s) nouveau(x) ou modifié(s) vers Supabase...")
+    start = time.perf_counter()
+    success, errors = upload_chunks(chunks, vectors, row_of, manifest, embedded)
+    elapsed = time.perf_counter() - start
 
     print(f"\n{'='*50}")
-    print(f"🎉 UPLOAD TERMINÉ")
+    print("⚠️  UPLOAD INCOMPLET" if errors else "🎉 UPLOAD TERMINÉ")
     print(f"   ✅ Nouveaux chunks uploadés : {success}")
-    print(f"   ❌ Erreurs : {errors}")
+    print(f"   ❌ Erreurs : {errors}" + (" (relance le script pour reprendre)" if errors else ""))
+    print(f"   ⏱️  {elapsed:.1f}s ({success / max(elapsed, 1e-9):,.0f} chunks/s)")
 
     # Vérification
     count = supabase.table("milarepa_chunks").select("id", count="exact").execute()
     print(f"   📊 Total en base : {count.count} chunks")
+    if errors:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
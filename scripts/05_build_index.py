@@ -0,0 +1,73 @@
+"""
+MILARIPPA - Étape 5 : Construction de l'index local
+====================================================
+Transforme les chunks vectorisés en index binaire mappé en mémoire
+(vecteurs + offsets), servi par l'app avec RETRIEVAL_BACKEND=local.
+Tous les workers de l'app partagent le même index en lecture seule.
+Un préfixe de INDEX_PREFIX_DIM dimensions sert de premier tri rapide.
+Chaque exécution publie un nouveau snapshot versionné : l'app le détecte
+et le charge à chaud, sans redéploiement.
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+from manifest import Manifest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+from embedding_store import EMBEDDINGS_DIR, EmbeddingStore
+from vector_index import INFO_FILE, PREFIX_DIM, publish_snapshot
+
+load_dotenv()
+
+# Config
+INDEX_DIR = Path(os.getenv("INDEX_DIR", "data/index"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+KEEP_SNAPSHOTS = 3  # Versions conservées sur disque
+INDEX_PREFIX_DIM = int(os.getenv("INDEX_PREFIX_DIM", PREFIX_DIM))  # 0 : recherche exacte seule
+
+
+def main():
+    store = EmbeddingStore(EMBEDDINGS_DIR)
+    if not store.exists():
+        print(f"❌ Embeddings non trouvés : {EMBEDDINGS_DIR}")
+        print("   Lance d'abord : python scripts/03_generate_embeddings.py")
+        return
+
+    # Charger les chunks vivants (la dernière version d'un id l'emporte).
+    # Sans manifest d'embeddings (magasin converti, manifest supprimé) : tout le magasin
+    embedded = Manifest().entries("embed")
+    if not embedded:
+        print("⚠️ Manifest d'embeddings vide : tous les chunks du magasin sont indexés")
+    chunks, vectors = store.load(embedded or None)
+    print(f"📋 {len(chunks)} chunks chargés depuis {EMBEDDINGS_DIR}")
+    if not chunks:
+        print("❌ Aucun chunk à indexer : le snapshot actuel reste en service")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    version = publish_snapshot(chunks, INDEX_DIR, embedding_model=EMBEDDING_MODEL, keep=KEEP_SNAPSHOTS,
+                               vectors=vectors, prefix_dim=INDEX_PREFIX_DIM)
+    elapsed = time.perf_counter() - start
+
+    snapshot_dir = INDEX_DIR / version
+    info = json.loads((snapshot_dir / INFO_FILE).read_text(encoding="utf-8"))
+    size = sum(p.stat().st_size for p in snapshot_dir.iterdir() if p.is_file())
+    print(f"\n{'='*50}")
+    print(f"🎉 INDEX PUBLIÉ")
+    print(f"   Version   : {version}")
+    print(f"   Chunks    : {info['count']}")
+    print(f"   Dimension : {info['dim']}")
+    print(f"   Préfixe   : {info['prefix_dim'] or 'aucun (recherche exacte)'}")
+    print(f"   Taille    : {size / 1_000_000:.1f} Mo")
+    print(f"   Durée     : {elapsed:.2f}s")
+    print(f"   Dossier   : {snapshot_dir}")
+    print(f"   ♻️  L'app bascule sur cette version automatiquement")
+
+
+if __name__ == "__main__":
+    main()
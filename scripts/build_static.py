@@ -0,0 +1,102 @@
+"""
+MILARIPPA - Build des fichiers statiques
+========================================
+Minifie les CSS/JS de app/static/, nomme chaque fichier d'après son contenu
+(css/style.3f9a1c2e07.css) et le précompresse (.br, .gz) dans app/static/dist/.
+dist/manifest.json associe chaque chemin source à sa version construite :
+le template passe par asset_url() (app/assets.py) et le serveur envoie la
+variante compressée acceptée par le navigateur, en cache immuable d'un an.
+Un fichier modifié change de nom : aucun cache à purger.
+
+À relancer après chaque modification de app/static/ (le Dockerfile le fait).
+Sans build, l'app sert les fichiers source tels quels.
+"""
+
+import gzip
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+import brotli
+import rcssmin
+import rjsmin
+
+# Config
+STATIC_DIR = Path(__file__).resolve().parent.parent / "app" / "static"
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_FILE = "manifest.json"
+ASSET_SUFFIXES = {".css", ".js", ".svg"}
+HASH_LENGTH = 10
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11  # Compression faite une fois au build : le niveau maximal ne coûte rien au service
+
+MINIFIERS = {
+    ".css": rcssmin.cssmin,
+    ".js": rjsmin.jsmin,
+}
+
+
+def source_files() -> list[Path]:
+    """Fichiers statiques à construire (hors dist/)."""
+    return sorted(
+        path for path in STATIC_DIR.rglob("*")
+        if path.is_file() and path.suffix in ASSET_SUFFIXES and DIST_DIR not in path.parents
+    )
+
+
+def hashed_name(relative: Path, content: bytes) -> Path:
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    return relative.with_name(f"{relative.stem}.{digest}{relative.suffix}")
+
+
+def compressed_variants(content: bytes) -> dict:
+    """Variantes .br et .gz, gardées seulement si elles sont plus petites que l'original."""
+    variants = {
+        "br": (".br", brotli.compress(content, quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)),
+        "gzip": (".gz", gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)),  # mtime=0 : build reproductible
+    }
+    return {encoding: variant for encoding, variant in variants.items() if len(variant[1]) < len(content)}
+
+
+def build_asset(path: Path) -> tuple[str, dict]:
+    relative = path.relative_to(STATIC_DIR)
+    source = path.read_bytes()
+    minify = MINIFIERS.get(path.suffix)
+    content = minify(source.decode("utf-8")).encode("utf-8") if minify else source
+
+    built = hashed_name(relative, content)
+    output = DIST_DIR / built
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(content)
+
+    variants = compressed_variants(content)
+    for suffix, data in variants.values():
+        output.with_name(output.name + suffix).write_bytes(data)
+
+    sizes = {"source": len(source), "minified": len(content),
+             **{encoding: len(data) for encoding, (_, data) in variants.items()}}
+    print(f"   ✅ {relative.as_posix():<20} → {built.as_posix():<32} "
+          + "  ".join(f"{name} {size / 1024:.1f} Ko" for name, size in sizes.items()))
+    return relative.as_posix(), {"path": built.as_posix(), "encodings": list(variants), "sizes": sizes}
+
+
+def main():
+    files = source_files()
+    print(f"📦 {len(files)} fichiers statiques → {DIST_DIR}")
+
+    # Reconstruction complète : pas de versions périmées qui s'accumulent
+    if DIST_DIR.exists():
+        shutil.rmtree(DIST_DIR)
+    DIST_DIR.mkdir(parents=True)
+
+    manifest = dict(build_asset(path) for path in files)
+    (DIST_DIR / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    source = sum(entry["sizes"]["source"] for entry in manifest.values())
+    transferred = sum(min(entry["sizes"].values()) for entry in manifest.values())
+    print(f"\n🎉 {source / 1024:.1f} Ko → {transferred / 1024:.1f} Ko transférés (meilleure variante)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+MILARIPPA - Conversion des embeddings JSONL → magasin binaire
+=============================================================
+Convertit l'ancien fichier milarepa_chunks_with_embeddings.jsonl (vecteurs
+en texte JSON) en magasin binaire data/chunks/embeddings/ (vectors.npy +
+meta.jsonl), sans rappeler l'API. L'ordre des lignes est conservé : la
+dernière version d'un id l'emporte toujours. Les chunks convertis sont
+enregistrés dans le manifest (étape "embed") : les étapes 4 et 5 les
+trouvent sans relancer l'étape 3.
+
+Usage :
+    python scripts/convert_embeddings.py [--dtype float16]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+from embedding_store import DTYPES, EMBEDDINGS_DIR, EmbeddingStore
+from manifest import Manifest, fingerprint, hash_text
+
+load_dotenv()
+
+# Config
+JSONL_FILE = Path("data/chunks/milarepa_chunks_with_embeddings.jsonl")
+BLOCK_ROWS = 1000  # Lignes converties par écriture
+# Paramètres du fichier converti, comme à l'étape 3 (empreintes du manifest)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 0))
+EMBED_PARAMS = {"model": EMBEDDING_MODEL, **({"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {})}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Conversion des embeddings JSONL en magasin binaire")
+    parser.add_argument("--input", type=Path, default=JSONL_FILE, help=f"fichier JSONL (défaut {JSONL_FILE})")
+    parser.add_argument("--dtype", choices=sorted(DTYPES), default="float32", help="type des vecteurs stockés")
+    parser.add_argument("--force", action="store_true", help="remplace un magasin existant")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.input.exists():
+        print(f"❌ Fichier non trouvé : {args.input}")
+        return
+
+    store = EmbeddingStore(EMBEDDINGS_DIR, dtype=args.dtype)
+    if store.exists():
+        if not args.force:
+            print(f"⚠️ Le magasin {EMBEDDINGS_DIR} existe déjà ({len(store)} lignes)")
+            print("   Relance avec --force pour le remplacer.")
+            return
+        store.vectors_path.unlink()
+        store.meta_path.unlink()
+        store.params_path.unlink(missing_ok=True)
+    store = EmbeddingStore(EMBEDDINGS_DIR, dtype=args.dtype, params=EMBED_PARAMS)
+
+    print(f"🔄 Conversion de {args.input} → {EMBEDDINGS_DIR} ({args.dtype})")
+    start = time.perf_counter()
+    chunks, vectors = [], []
+    with open(args.input, "r", encoding="utf-8") as f:
+        for line in f:
+            chunk = json.loads(line)
+            vectors.append(chunk.pop("embedding"))
+            chunks.append(chunk)
+            if len(chunks) >= BLOCK_ROWS:
+                store.append(chunks, vectors)
+                chunks, vectors = [], []
+    store.append(chunks, vectors)
+
+    # Le magasin remplace l'ancien manifest d'embeddings
+    manifest = Manifest()
+    for chunk_id in list(manifest.entries("embed")):
+        manifest.forget("embed", chunk_id)
+    for _, chunk in store.iter_meta():
+        manifest.record("embed", chunk["id"], fingerprint(hash_text(chunk["texte"]), EMBED_PARAMS))
+    manifest.save()
+    elapsed = time.perf_counter() - start
+
+    old_size = args.input.stat().st_size
+    new_size = store.vectors_path.stat().st_size + store.meta_path.stat().st_size
+    print(f"\n{'='*50}")
+    print(f"🎉 CONVERSION TERMINÉE")
+    print(f"   Lignes    : {len(store)}")
+    print(f"   Dimension : {store.dim}")
+    print(f"   Manifest  : {len(manifest.entries('embed'))} chunk(s) enregistré(s)")
+    print(f"   Taille    : {old_size / 1_000_000:.1f} Mo → {new_size / 1_000_000:.1f} Mo")
+    print(f"   Durée     : {elapsed:.2f}s")
+    print(f"   L'ancien fichier peut être supprimé : {args.input}")
+
+
+if __name__ == "__main__":
+    main()
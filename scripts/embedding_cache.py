@@ -0,0 +1,71 @@
+"""
+MILARIPPA - Cache des embeddings par contenu
+============================================
+Un embedding ne dépend que du texte et du modèle, pas de l'id du chunk.
+Quand un nouveau découpage renumérote les chunks, leurs textes inchangés
+retrouvent ici leur vecteur au lieu d'être re-payés à l'API.
+
+Clé = empreinte du chunk (hash du texte + paramètres d'embedding, voir
+manifest.fingerprint). Stockage : magasins binaires (float32, sans perte)
+en ajout seul, un par dimension de vecteur : data/cache/embeddings/dim-<n>/
+(le magasin d'origine, à la racine, garde sa dimension). Changer de
+dimensions ne perd donc pas les vecteurs déjà payés avec les anciennes.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+from embedding_store import EmbeddingStore
+
+CACHE_DIR = Path("data/cache/embeddings")
+
+
+class EmbeddingCache:
+    """Vecteurs déjà payés, indexés par empreinte de contenu."""
+
+    def __init__(self, directory: Path = CACHE_DIR):
+        self.directory = Path(directory)
+        self._stores = {}   # dimension → magasin
+        self._rows = {}     # clé → (dimension, ligne)
+        self._vectors = {}  # dimension → vecteurs mappés
+        for path in [self.directory, *sorted(self.directory.glob("dim-*"))]:
+            store = EmbeddingStore(path, dtype="float32")
+            if not store.exists():
+                continue
+            store.reconcile()
+            self._stores[store.dim] = store
+            for row, meta in store.iter_meta():
+                self._rows[meta["id"]] = (store.dim, row)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def get(self, key: str) -> np.ndarray | None:
+        if key not in self._rows:
+            return None
+        dim, row = self._rows[key]
+        vectors = self._vectors.get(dim)
+        if vectors is None or row >= len(vectors):
+            vectors = self._vectors[dim] = self._stores[dim].vectors()
+        return np.asarray(vectors[row], dtype=np.float32)
+
+    def add(self, keys: list[str], vectors, tokens: list[int]) -> None:
+        """Ajoute les vecteurs de clés encore absentes (dans le magasin de leur dimension)."""
+        new = {key: (key, vector, count) for key, vector, count in zip(keys, vectors, tokens) if key not in self._rows}
+        new = list(new.values())
+        if not new:
+            return
+        dim = len(new[0][1])
+        store = self._stores.get(dim)
+        if store is None:
+            store = self._stores[dim] = EmbeddingStore(self.directory / f"dim-{dim}", dtype="float32")
+        start = len(store)
+        store.append([{"id": key, "tokens": count} for key, _, count in new], [vector for _, vector, _ in new])
+        for offset, (key, _, _) in enumerate(new):
+            self._rows[key] = (dim, start + offset)
@@ -0,0 +1,95 @@
+"""
+MILARIPPA - Manifest du pipeline
+================================
+Mémoire partagée des quatre étapes du pipeline (extraction, chunking,
+embeddings, upload). Pour chaque élément traité, on garde une empreinte :
+hash du contenu d'entrée + paramètres de l'étape. Une étape ne recalcule
+que les éléments dont l'empreinte a changé (PDF modifié, MAX_TOKENS changé,
+texte de chunk différent, autre modèle d'embedding...).
+
+Les hash de fichiers sont mis en cache par (taille, date de modification),
+comme l'index de git : un fichier inchangé n'est jamais relu.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_PATH = Path("data/manifest.json")
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hash_bytes(text.encode("utf-8"))
+
+
+def fingerprint(content_hash: str, params: dict) -> str:
+    """Empreinte d'un élément : hash du contenu + paramètres de l'étape."""
+    return hash_text(content_hash + json.dumps(params, sort_keys=True))
+
+
+def latest_records(path: Path, keep_ids) -> list[dict]:
+    """
+    Lit un fichier JSONL en ajout seul : garde la dernière version de chaque id,
+    et seulement les ids encore vivants (keep_ids).
+    """
+    records = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["id"] in keep_ids:
+                records[record["id"]] = record
+    return list(records.values())
+
+
+class Manifest:
+    """Empreintes par étape, sauvegardées dans data/manifest.json."""
+
+    def __init__(self, path: Path = MANIFEST_PATH):
+        self.path = Path(path)
+        if self.path.exists():
+            self.data = json.loads(self.path.read_text(encoding="utf-8"))
+        else:
+            self.data = {"files": {}, "stages": {}}
+
+    def file_hash(self, path: Path) -> str:
+        """Hash SHA-256 d'un fichier, recalculé seulement si taille ou date ont changé."""
+        path = Path(path)
+        stat = path.stat()
+        key = str(path)
+        cached = self.data["files"].get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        self.data["files"][key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        return sha256
+
+    def entries(self, stage: str) -> dict:
+        """Éléments enregistrés pour une étape : {clé: {"fingerprint": ..., ...}}."""
+        return self.data["stages"].setdefault(stage, {})
+
+    def is_fresh(self, stage: str, key: str, fp: str) -> bool:
+        entry = self.entries(stage).get(key)
+        return entry is not None and entry["fingerprint"] == fp
+
+    def record(self, stage: str, key: str, fp: str, **extra) -> None:
+        self.entries(stage)[key] = {"fingerprint": fp, **extra}
+
+    def forget(self, stage: str, key: str) -> None:
+        self.entries(stage).pop(key, None)
+
+    def save(self) -> None:
+        """Écriture atomique (fichier temporaire puis renommage)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self.data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,269 @@
+"""
+MILARIPPA - Migrations du schéma Postgres
+=========================================
+Applique dans l'ordre les fichiers scripts/migrations/NNN_*.sql pas encore
+appliqués, chacun dans sa transaction, et les enregistre dans la table
+schema_migrations (version, empreinte, date). Une migration déjà appliquée
+dont le fichier a changé est signalée, jamais rejouée : on corrige par une
+nouvelle migration.
+
+Connexion directe à Postgres (pas l'API REST) : SUPABASE_DB_URL
+(Dashboard → Project Settings → Database → Connection string, port 5432),
+ou tout Postgres local avec l'extension pgvector.
+
+    python scripts/migrate.py              # applique les migrations en attente
+    python scripts/migrate.py --status     # état, sans rien appliquer
+    python scripts/migrate.py --bench      # plans et latences des requêtes de l'app
+    python scripts/migrate.py --bench --seed 20000   # idem sur des données synthétiques (retirées ensuite)
+"""
+
+import argparse
+import hashlib
+import os
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import psycopg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Config
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+DB_URL = os.getenv("SUPABASE_DB_URL")
+EMBEDDING_DIM = 1536
+BENCH_QUERIES = 50             # Questions par réglage de ef_search
+BENCH_EF_SEARCH = [10, 20, 40, 80, 160]
+BENCH_K = 5
+BENCH_NOISE = 0.5              # Bruit relatif ajouté aux chunks tirés comme questions
+SEED_USER = "migrate-bench"    # user_id des conversations synthétiques (--seed)
+SEED_PREFIX = "migrate_bench_"  # Préfixe des ids des chunks synthétiques (--seed)
+SEED_CLUSTER_SIZE = 20         # Chunks synthétiques par thème : des voisins proches, comme un vrai corpus
+PLAN_LINE_WIDTH = 160          # Les vecteurs littéraux rendent les lignes du plan illisibles
+HNSW_INDEX = "milarepa_chunks_embedding_hnsw_idx"
+
+
+def migration_files() -> list[tuple[str, Path]]:
+    """(version, chemin) des migrations, dans l'ordre des numéros."""
+    return sorted((path.name.split("_", 1)[0], path) for path in MIGRATIONS_DIR.glob("[0-9]*_*.sql"))
+
+
+def checksum(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def applied_migrations(conn) -> dict:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    conn.commit()
+    return {version: (name, digest) for version, name, digest
+            in conn.execute("SELECT version, name, checksum FROM schema_migrations")}
+
+
+def status(conn) -> list[tuple[str, Path]]:
+    """Affiche l'état de chaque migration ; retourne celles en attente."""
+    applied = applied_migrations(conn)
+    pending = []
+    for version, path in migration_files():
+        if version not in applied:
+            pending.append((version, path))
+            print(f"   ⏳ {path.name}")
+        elif applied[version][1] != checksum(path):
+            print(f"   ⚠️  {path.name} (modifié depuis son application : ajouter une nouvelle migration)")
+        else:
+            print(f"   ✅ {path.name}")
+    return pending
+
+
+def migrate(conn) -> None:
+    pending = status(conn)
+    if not pending:
+        print("\n✅ Schéma à jour")
+        return
+
+    print()
+    for version, path in pending:
+        start = time.perf_counter()
+        # Une transaction par migration : une erreur n'en laisse rien
+        with conn.transaction():
+            conn.execute(path.read_text(encoding="utf-8"))
+            conn.execute("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                         (version, path.name, checksum(path)))
+        print(f"   ✅ {path.name} appliquée en {time.perf_counter() - start:.2f}s")
+    print(f"\n🎉 {len(pending)} migration(s) appliquée(s)")
+
+
+# === BENCH ===
+
+def vector_literal(vector) -> str:
+    return "[" + ",".join(f"{v:.6g}" for v in vector) + "]"
+
+
+def parse_vector(text: str) -> np.ndarray:
+    return np.array(text.strip("[]").split(","), dtype=np.float32)
+
+
+def seed(conn, count: int) -> None:
+    """Chunks (groupés par thème) et conversations synthétiques, pour mesurer une base de test."""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((max(count // SEED_CLUSTER_SIZE, 1), EMBEDDING_DIM)).astype(np.float32)
+    # Insérer un à un dans un index HNSW est ~10x plus lent que le construire :
+    # sur une table vide (base de test), l'index est reconstruit après la copie
+    rebuild = conn.execute("SELECT NOT EXISTS (SELECT 1 FROM milarepa_chunks)").fetchone()[0]
+    index_sql = conn.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", (HNSW_INDEX,)).fetchone()
+    rebuild = rebuild and index_sql is not None
+
+    print(f"🌱 {count} chunks et {count // 10} conversations synthétiques...")
+    with conn.transaction(), conn.cursor() as cur:
+        if rebuild:
+            cur.execute(f"DROP INDEX {HNSW_INDEX}")
+        with cur.copy("COPY milarepa_chunks (id, source, langue, texte, tokens, embedding) FROM STDIN") as copy:
+            for i in range(count):
+                vector = centers[i % len(centers)] + rng.standard_normal(EMBEDDING_DIM).astype(np.float32)
+                copy.write_row((f"{SEED_PREFIX}{i:06d}", "bench", "fr", "texte", 1, vector_literal(vector / np.linalg.norm(vector))))
+        if rebuild:
+            cur.execute("SET LOCAL maintenance_work_mem = '256MB'")
+            cur.execute(index_sql[0])
+
+        conversations = [str(uuid.uuid4()) for _ in range(count // 10)]
+        cur.executemany("INSERT INTO conversations (id, title, user_id) VALUES (%s, 'bench', %s)",
+                        [(conversation_id, SEED_USER) for conversation_id in conversations])
+        cur.executemany("INSERT INTO messages (conversation_id, role, content) VALUES (%s, %s, 'bench')",
+                        [(conversation_id, "user" if j % 2 == 0 else "assistant")
+                         for conversation_id in conversations for j in range(10)])
+    conn.execute("ANALYZE milarepa_chunks; ANALYZE conversations; ANALYZE messages")
+    conn.commit()
+
+
+def unseed(conn) -> None:
+    with conn.transaction():
+        conn.execute("DELETE FROM milarepa_chunks WHERE id LIKE %s", (SEED_PREFIX + "%",))
+        conn.execute("DELETE FROM conversations WHERE user_id = %s", (SEED_USER,))
+    print("🧹 Données synthétiques retirées")
+
+
+def explain(conn, title: str, sql: str, params: tuple, settings: str = "") -> None:
+    """Plan exécuté (EXPLAIN ANALYZE) d'une requête, avec l'index utilisé ou le parcours séquentiel."""
+    with conn.transaction():
+        if settings:
+            conn.execute(settings)
+        plan = [row[0] for row in conn.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)]
+    access = [line.strip() for line in plan if "Scan" in line]
+    flag = "🐢" if any(line.startswith(("Seq Scan", "->  Seq Scan")) for line in access) else "✅"
+    print(f"\n{flag} {title}")
+    for line in plan:
+        print(f"   {line[:PLAN_LINE_WIDTH]}{'…' if len(line) > PLAN_LINE_WIDTH else ''}")
+
+
+def search_ids(conn, vector: str, k: int, ef_search: int, exact: bool = False) -> tuple[list[str], float]:
+    """Ids renvoyés par search_milarepa et durée (exact : parcours complet, sans index)."""
+    with conn.transaction():
+        if exact:
+            conn.execute("SET LOCAL enable_indexscan = off")
+        start = time.perf_counter()
+        rows = conn.execute("SELECT id FROM search_milarepa(%s::vector, %s, -1, %s)", (vector, k, ef_search)).fetchall()
+        return [row[0] for row in rows], time.perf_counter() - start
+
+
+def bench(conn, queries: int) -> None:
+    pending = [version for version, _ in migration_files() if version not in applied_migrations(conn)]
+    if pending:
+        print(f"❌ Migrations en attente ({', '.join(pending)}) : lance d'abord python scripts/migrate.py")
+        return
+
+    count = conn.execute("SELECT COUNT(*) FROM milarepa_chunks").fetchone()[0]
+    if not count:
+        print("❌ Aucun chunk : lancer l'étape 4, ou --seed N sur une base de test")
+        return
+    print(f"📊 {count} chunks")
+
+    # Questions : des chunks tirés au hasard, bruités (toujours au moins un voisin proche)
+    rng = np.random.default_rng(1)
+    samples = [parse_vector(row[0]) for row in conn.execute(
+        "SELECT embedding::text FROM milarepa_chunks ORDER BY random() LIMIT %s", (queries,))]
+    vectors = []
+    for vector in samples:
+        noisy = vector + rng.standard_normal(len(vector)).astype(np.float32) * BENCH_NOISE / np.sqrt(len(vector))
+        vectors.append(vector_literal(noisy / np.linalg.norm(noisy)))
+
+    user_id = conn.execute("SELECT user_id FROM conversations GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    conversation_id = conn.execute("SELECT conversation_id FROM messages GROUP BY conversation_id "
+                                   "ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    conn.commit()
+
+    explain(conn, "Recherche vectorielle (search_milarepa)",
+            "SELECT id, 1 - (embedding <=> %s::vector) AS similarity FROM milarepa_chunks "
+            "WHERE 1 - (embedding <=> %s::vector) > 0.3 ORDER BY embedding <=> %s::vector LIMIT 5",
+            (vectors[0], vectors[0], vectors[0]), settings="SET LOCAL hnsw.ef_search = 40")
+    if user_id:
+        explain(conn, "Conversations d'un utilisateur",
+                "SELECT * FROM conversations WHERE user_id = %s ORDER BY updated_at DESC", user_id)
+    if conversation_id:
+        explain(conn, "Messages d'une conversation",
+                "SELECT * FROM messages WHERE conversation_id = %s ORDER BY created_at", conversation_id)
+
+    # Recall et latence de chaque ef_search, face à la recherche exacte
+    print(f"\n⏱️  search_milarepa sur {len(vectors)} questions (k = {BENCH_K})")
+    reference = []
+    exact_times = []
+    for vector in vectors:
+        ids, seconds = search_ids(conn, vector, BENCH_K, 40, exact=True)
+        reference.append(set(ids))
+        exact_times.append(seconds)
+    print(f"   {'exact':<14} recall 1.000   p50 {np.percentile(exact_times, 50) * 1000:8.2f} ms   "
+          f"p95 {np.percentile(exact_times, 95) * 1000:8.2f} ms")
+
+    for ef_search in BENCH_EF_SEARCH:
+        recalls, times = [], []
+        for vector, expected in zip(vectors, reference):
+            ids, seconds = search_ids(conn, vector, BENCH_K, ef_search)
+            recalls.append(len(expected & set(ids)) / max(len(expected), 1))
+            times.append(seconds)
+        print(f"   ef_search={ef_search:<4} recall {np.mean(recalls):.3f}   p50 {np.percentile(times, 50) * 1000:8.2f} ms   "
+              f"p95 {np.percentile(times, 95) * 1000:8.2f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migrations du schéma Postgres (scripts/migrations/)")
+    parser.add_argument("--db-url", default=DB_URL, help="URL Postgres (défaut : SUPABASE_DB_URL)")
+    parser.add_argument("--status", action="store_true", help="affiche l'état des migrations sans rien appliquer")
+    parser.add_argument("--bench", action="store_true", help="plans d'exécution et latences des requêtes de l'app")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="avec --bench : N chunks synthétiques (et N/10 conversations), retirés à la fin")
+    parser.add_argument("--queries", type=int, default=BENCH_QUERIES, help="avec --bench : questions par réglage")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.db_url:
+        print("❌ SUPABASE_DB_URL non défini (ou --db-url)")
+        return
+
+    with psycopg.connect(args.db_url) as conn:
+        if args.status:
+            print("📋 Migrations")
+            status(conn)
+        elif args.bench:
+            if args.seed:
+                seed(conn, args.seed)
+            try:
+                bench(conn, args.queries)
+            finally:
+                if args.seed:
+                    unseed(conn)
+        else:
+            print("📋 Migrations")
+            migrate(conn)
+
+
+if __name__ == "__main__":
+    main()
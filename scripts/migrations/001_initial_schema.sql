@@ -1,8 +1,9 @@
 -- =============================================
--- MILARIPPA - Setup Supabase (pgvector)
+-- MILARIPPA - Migration 001 : schéma initial (pgvector)
 -- =============================================
--- Exécuter ce SQL dans l'éditeur SQL de Supabase
--- Dashboard → SQL Editor → New Query
+-- Appliqué par scripts/migrate.py, avec les migrations suivantes, dans
+-- l'ordre. Sans accès direct à la base : coller chaque fichier de
+-- scripts/migrations/ dans Dashboard → SQL Editor → New Query.
 
 -- 1. Activer l'extension pgvector
 CREATE EXTENSION IF NOT EXISTS vector;
@@ -63,6 +64,56 @@ BEGIN
 END;
 $$;
 
+-- 4b. Recherche groupée (endpoint /api/chat/batch)
+-- Un seul appel RPC pour plusieurs questions : query_embeddings est un tableau
+-- JSON d'embeddings, query_index donne la position de la question (0-based).
+CREATE OR REPLACE FUNCTION search_milarepa_batch(
+    query_embeddings JSONB,
+    match_count INT DEFAULT 5,
+    match_threshold FLOAT DEFAULT 0.3
+)
+RETURNS TABLE (
+    query_index INT,
+    id TEXT,
+    source TEXT,
+    langue TEXT,
+    section TEXT,
+    type TEXT,
+    texte TEXT,
+    tokens INTEGER,
+    similarity FLOAT
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        (q.ord - 1)::INT AS query_index,
+        m.id,
+        m.source,
+        m.langue,
+        m.section,
+        m.type,
+        m.texte,
+        m.tokens,
+        m.similarity
+    FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(embedding, ord)
+    CROSS JOIN LATERAL (
+        SELECT
+            mc.id,
+            mc.source,
+            mc.langue,
+            mc.section,
+            mc.type,
+            mc.texte,
+            mc.tokens,
+            1 - (mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)) AS similarity
+        FROM milarepa_chunks mc
+        WHERE 1 - (mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)) > match_threshold
+        ORDER BY mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)
+        LIMIT match_count
+    ) m
+    ORDER BY q.ord, m.similarity DESC;
+$$;
+
 -- 5. Créer la table des conversations
 CREATE TABLE IF NOT EXISTS conversations (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -78,7 +129,7 @@ CREATE TABLE IF NOT EXISTS messages (
     conversation_id UUID NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
     role TEXT NOT NULL,           -- "user" ou "assistant"
     content TEXT NOT NULL,        -- Le message
-    sources TEXT,                 -- JSON array des sources citées
+    sources JSONB,                -- Tableau des sources citées (voir migration 002)
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -0,0 +1,38 @@
+-- =============================================
+-- MILARIPPA - Migration 002 : messages.sources en JSONB
+-- =============================================
+-- Pour les bases créées avec l'ancien schéma (sources TEXT contenant du
+-- JSON). Sans effet si la colonne est déjà en JSONB (bases créées par 001).
+--
+-- Après la migration, Supabase renvoie directement les sources décodées :
+-- l'app ne fait plus de json.loads message par message.
+
+-- Conversion tolérante : une valeur illisible devient un tableau vide
+-- (même comportement que l'ancien décodage côté Python).
+CREATE OR REPLACE FUNCTION pg_temp.sources_to_jsonb(value TEXT)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF value IS NULL OR btrim(value) = '' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::JSONB;
+EXCEPTION WHEN others THEN
+    RETURN '[]'::JSONB;
+END;
+$$;
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'messages' AND column_name = 'sources') = 'text' THEN
+        ALTER TABLE messages
+            ALTER COLUMN sources TYPE JSONB
+            USING pg_temp.sources_to_jsonb(sources);
+    END IF;
+END;
+$$;
+
+-- Vérification
+-- SELECT jsonb_typeof(sources), COUNT(*) FROM messages GROUP BY 1;
@@ -0,0 +1,30 @@
+-- =============================================
+-- MILARIPPA - Migration 003 : index HNSW et index composites
+-- =============================================
+-- Recherche vectorielle : HNSW remplace IVFFlat. L'index IVFFlat de 001 est
+-- créé sur une table vide : ses 50 listes ne reflètent pas les données, et
+-- une requête n'en visite qu'une (ivfflat.probes = 1), d'où un recall
+-- médiocre. HNSW ne s'entraîne pas sur les données, reste bon quand on
+-- ajoute des chunks, et se règle à la requête (hnsw.ef_search, voir 004).
+
+DROP INDEX IF EXISTS milarepa_chunks_embedding_idx;
+
+CREATE INDEX IF NOT EXISTS milarepa_chunks_embedding_hnsw_idx
+ON milarepa_chunks
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- Requêtes de l'app (app/storage.py), filtre et tri dans le même index :
+--   conversations WHERE user_id = ? ORDER BY updated_at DESC
+--   messages WHERE conversation_id = ? ORDER BY created_at
+-- (pas de colonnes INCLUDE : content, la plus grosse, est lue dans la table de toute façon)
+CREATE INDEX IF NOT EXISTS conversations_user_updated_idx ON conversations(user_id, updated_at DESC);
+CREATE INDEX IF NOT EXISTS messages_conversation_created_idx ON messages(conversation_id, created_at);
+
+-- Les index d'une seule colonne sont des préfixes des précédents (y compris
+-- pour la suppression en cascade des messages) : redondants
+DROP INDEX IF EXISTS conversations_user_id_idx;
+DROP INDEX IF EXISTS messages_conversation_id_idx;
+
+-- Vérification
+-- EXPLAIN SELECT id FROM milarepa_chunks ORDER BY embedding <=> (SELECT embedding FROM milarepa_chunks LIMIT 1) LIMIT 5;
@@ -0,0 +1,106 @@
+-- =============================================
+-- MILARIPPA - Migration 004 : ef_search réglable sur les fonctions de recherche
+-- =============================================
+-- hnsw.ef_search = nombre de candidats explorés dans le graphe HNSW :
+-- plus haut, meilleur recall et recherche plus lente (défaut pgvector : 40).
+-- Il est fixé pour la seule transaction de l'appel RPC (set_config local),
+-- jamais moins que match_count (sinon HNSW renvoie moins de résultats).
+-- L'app le transmet si HNSW_EF_SEARCH est défini ; voir
+-- `python scripts/migrate.py --bench` pour choisir la valeur.
+
+-- Nouvelle signature : l'ancienne version est supprimée pour que l'appel
+-- RPC (paramètres nommés) ne soit pas ambigu
+DROP FUNCTION IF EXISTS search_milarepa(VECTOR(1536), INT, FLOAT);
+DROP FUNCTION IF EXISTS search_milarepa_batch(JSONB, INT, FLOAT);
+
+CREATE OR REPLACE FUNCTION search_milarepa(
+    query_embedding VECTOR(1536),
+    match_count INT DEFAULT 5,
+    match_threshold FLOAT DEFAULT 0.3,
+    ef_search INT DEFAULT 40
+)
+RETURNS TABLE (
+    id TEXT,
+    source TEXT,
+    langue TEXT,
+    section TEXT,
+    type TEXT,
+    texte TEXT,
+    tokens INTEGER,
+    similarity FLOAT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::TEXT, true);
+
+    RETURN QUERY
+    SELECT
+        mc.id,
+        mc.source,
+        mc.langue,
+        mc.section,
+        mc.type,
+        mc.texte,
+        mc.tokens,
+        1 - (mc.embedding <=> query_embedding) AS similarity
+    FROM milarepa_chunks mc
+    WHERE 1 - (mc.embedding <=> query_embedding) > match_threshold
+    ORDER BY mc.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+-- Recherche groupée (endpoint /api/chat/batch), même réglage
+CREATE OR REPLACE FUNCTION search_milarepa_batch(
+    query_embeddings JSONB,
+    match_count INT DEFAULT 5,
+    match_threshold FLOAT DEFAULT 0.3,
+    ef_search INT DEFAULT 40
+)
+RETURNS TABLE (
+    query_index INT,
+    id TEXT,
+    source TEXT,
+    langue TEXT,
+    section TEXT,
+    type TEXT,
+    texte TEXT,
+    tokens INTEGER,
+    similarity FLOAT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::TEXT, true);
+
+    RETURN QUERY
+    SELECT
+        (q.ord - 1)::INT AS query_index,
+        m.id,
+        m.source,
+        m.langue,
+        m.section,
+        m.type,
+        m.texte,
+        m.tokens,
+        m.similarity
+    FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(embedding, ord)
+    CROSS JOIN LATERAL (
+        SELECT
+            mc.id,
+            mc.source,
+            mc.langue,
+            mc.section,
+            mc.type,
+            mc.texte,
+            mc.tokens,
+            1 - (mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)) AS similarity
+        FROM milarepa_chunks mc
+        WHERE 1 - (mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)) > match_threshold
+        ORDER BY mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)
+        LIMIT match_count
+    ) m
+    ORDER BY q.ord, m.similarity DESC;
+END;
+$$;
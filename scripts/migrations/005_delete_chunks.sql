@@ -0,0 +1,17 @@
+-- =============================================
+-- MILARIPPA - Migration 005 : suppression de chunks par lot
+-- =============================================
+-- `04_upload_to_supabase.py --sync` supprimait par DELETE ?id=in.(...) :
+-- les ids voyagent dans l'URL (limite de longueur, guillemets et
+-- antislashs mal échappés). Ici les ids arrivent dans le corps JSON de
+-- l'appel RPC, sous forme de tableau. Retourne le nombre de lignes supprimées.
+
+CREATE OR REPLACE FUNCTION delete_milarepa_chunks(ids TEXT[])
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH deleted AS (
+        DELETE FROM milarepa_chunks WHERE id = ANY(ids) RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM deleted;
+$$;
@@ -0,0 +1,109 @@
+-- =============================================
+-- MILARIPPA - Migration 006 : ef_search par défaut = réglage de la base
+-- =============================================
+-- Avec 004, un appel sans ef_search fixait quand même hnsw.ef_search à
+-- GREATEST(40, match_count) : le réglage du serveur ou de la base (ALTER
+-- DATABASE ... SET hnsw.ef_search) était ignoré. ef_search vaut maintenant
+-- NULL par défaut et set_config n'est appelé que s'il est fourni
+-- (HNSW_EF_SEARCH côté app). Sans lui, c'est le réglage de la base qui
+-- s'applique : le garder au moins égal à match_count.
+
+-- Le défaut d'un paramètre ne change pas avec CREATE OR REPLACE
+DROP FUNCTION IF EXISTS search_milarepa(VECTOR(1536), INT, FLOAT, INT);
+DROP FUNCTION IF EXISTS search_milarepa_batch(JSONB, INT, FLOAT, INT);
+
+CREATE OR REPLACE FUNCTION search_milarepa(
+    query_embedding VECTOR(1536),
+    match_count INT DEFAULT 5,
+    match_threshold FLOAT DEFAULT 0.3,
+    ef_search INT DEFAULT NULL
+)
+RETURNS TABLE (
+    id TEXT,
+    source TEXT,
+    langue TEXT,
+    section TEXT,
+    type TEXT,
+    texte TEXT,
+    tokens INTEGER,
+    similarity FLOAT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF ef_search IS NOT NULL THEN
+        PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::TEXT, true);
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        mc.id,
+        mc.source,
+        mc.langue,
+        mc.section,
+        mc.type,
+        mc.texte,
+        mc.tokens,
+        1 - (mc.embedding <=> query_embedding) AS similarity
+    FROM milarepa_chunks mc
+    WHERE 1 - (mc.embedding <=> query_embedding) > match_threshold
+    ORDER BY mc.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+-- Recherche groupée (endpoint /api/chat/batch), même réglage
+CREATE OR REPLACE FUNCTION search_milarepa_batch(
+    query_embeddings JSONB,
+    match_count INT DEFAULT 5,
+    match_threshold FLOAT DEFAULT 0.3,
+    ef_search INT DEFAULT NULL
+)
+RETURNS TABLE (
+    query_index INT,
+    id TEXT,
+    source TEXT,
+    langue TEXT,
+    section TEXT,
+    type TEXT,
+    texte TEXT,
+    tokens INTEGER,
+    similarity FLOAT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF ef_search IS NOT NULL THEN
+        PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count)::TEXT, true);
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        (q.ord - 1)::INT AS query_index,
+        m.id,
+        m.source,
+        m.langue,
+        m.section,
+        m.type,
+        m.texte,
+        m.tokens,
+        m.similarity
+    FROM jsonb_array_elements(query_embeddings) WITH ORDINALITY AS q(embedding, ord)
+    CROSS JOIN LATERAL (
+        SELECT
+            mc.id,
+            mc.source,
+            mc.langue,
+            mc.section,
+            mc.type,
+            mc.texte,
+            mc.tokens,
+            1 - (mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)) AS similarity
+        FROM milarepa_chunks mc
+        WHERE 1 - (mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)) > match_threshold
+        ORDER BY mc.embedding <=> (q.embedding::TEXT)::VECTOR(1536)
+        LIMIT match_count
+    ) m
+    ORDER BY q.ord, m.similarity DESC;
+END;
+$$;
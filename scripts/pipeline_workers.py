@@ -0,0 +1,51 @@
+"""
+MILARIPPA - Scripts numérotés comme modules, et processus du pipeline
+=====================================================================
+run_pipeline.py importe 01_extract_text.py, 02_chunk_texts.py... sous les
+noms "extract_text", "chunk_texts"... Les fonctions envoyées aux processus
+(extract_pages, _chunk_task) sont désignées par ces noms, qui ne
+correspondent à aucun fichier : chaque processus du pool importe d'abord ce
+module-ci (importable, lui) et y enregistre les scripts avant de recevoir
+sa première tâche. Le pool fonctionne ainsi avec fork comme avec spawn.
+"""
+
+import importlib.util
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+WORKER_SCRIPTS = ("01_extract_text", "02_chunk_texts")  # Scripts dont les fonctions partent aux processus
+
+
+def module_name(script: str) -> str:
+    """Nom de module d'un script numéroté : 02_chunk_texts → chunk_texts."""
+    return script.split("_", 1)[1]
+
+
+def load_script(name: str):
+    """Importe un script numéroté (01_extract_text.py...) comme module, enregistré dans sys.modules."""
+    spec = importlib.util.spec_from_file_location(module_name(name), SCRIPTS_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def init_worker() -> None:
+    """Initialisation d'un processus du pool : scripts de WORKER_SCRIPTS importables par leur nom."""
+    for name in WORKER_SCRIPTS:
+        if module_name(name) not in sys.modules:  # Déjà là après un fork
+            load_script(name)
+
+
+def create_pool(workers: int, mp_context=None) -> ProcessPoolExecutor:
+    """
+    Pool de processus partagé par les étapes, à créer depuis le thread
+    principal avant de lancer les threads des étapes : avec fork, tous les
+    processus partent ici (premier submit), et non d'un thread en cours.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=init_worker)
+    pool.submit(os.getpid).result()
+    return pool
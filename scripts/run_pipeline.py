@@ -0,0 +1,496 @@
+"""
+MILARIPPA - Pipeline complet en flux
+====================================
+Enchaîne extraction → découpage → embeddings → upload en une seule commande.
+Chaque étape tourne dans son propre thread et passe ses résultats à la
+suivante par une file bornée : les embeddings et l'upload (réseau)
+commencent dès le premier livre découpé, pendant que l'extraction et le
+découpage (CPU, un pool de processus partagé) continuent sur les livres suivants.
+Le nettoyage du texte se fait page par page pendant l'extraction.
+
+Mêmes artefacts et même manifest que les scripts 01 à 04 : on peut passer
+de l'un à l'autre, et un run interrompu reprend là où il s'est arrêté.
+
+Usage :
+    python scripts/run_pipeline.py [--skip-upload] [--stats-interval 5]
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import asdict
+
+from manifest import Manifest, fingerprint, hash_text
+from pipeline_workers import create_pool, load_script
+
+extract = load_script("01_extract_text")
+chunking = load_script("02_chunk_texts")
+embedding = load_script("03_generate_embeddings")
+
+from embedding_cache import EmbeddingCache
+from storage import check_embedding_dimensions
+
+# Config
+QUEUE_SIZES = {"extract": 8, "chunk": 2000, "embed": 2000}  # Éléments en attente entre deux étapes
+STATS_INTERVAL = 5.0  # Secondes entre deux lignes de suivi
+HIT_FLUSH_SIZE = 500  # Chunks servis par le cache écrits d'un coup
+
+DONE = object()    # Fin de flux : l'étape a tout traité
+FAILED = object()  # Flux incomplet : l'étape (ou une étape en amont) s'est arrêtée en cours de route
+IDLE = object()  # Rien de nouveau en entrée : l'étape peut vider ses batches partiels
+
+
+class PipelineStopped(Exception):
+    """Une autre étape a échoué : on s'arrête sans bloquer sur une file pleine."""
+
+
+class Stage:
+    """
+    Une étape : consomme la file de l'étape précédente, produit dans sa
+    propre file bornée, et compte ses éléments pour le suivi.
+    """
+
+    def __init__(self, name: str, func, unit: str, source=None, maxsize: int = 0):
+        self.name = name
+        self.func = func
+        self.unit = unit
+        self.source = source
+        self.output = queue.Queue(maxsize)
+        self.count = 0
+        self.max_depth = 0
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name=f"stage-{name}", daemon=True)
+
+    def inputs(self):
+        """
+        Éléments de l'étape précédente, jusqu'à la fin du flux. IDLE est
+        produit quand l'entrée est vide depuis 0,1 s. Un flux incomplet lève
+        PipelineStopped : le code qui suit la boucle d'une étape (réécriture
+        du fichier de chunks, oubli des entrées du manifest) ne s'exécute
+        que si toutes les étapes en amont sont allées au bout.
+        """
+        while True:
+            try:
+                item = self.source.output.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    raise PipelineStopped()
+                yield IDLE
+                continue
+            if item is DONE:
+                return
+            if item is FAILED:
+                raise PipelineStopped()
+            yield item
+
+    def put(self, item) -> None:
+        while True:
+            try:
+                self.output.put(item, timeout=0.1)
+                self.max_depth = max(self.max_depth, self.output.qsize())
+                return
+            except queue.Full:
+                if stop.is_set():
+                    raise PipelineStopped()
+
+    def _run(self) -> None:
+        self.started = time.perf_counter()
+        completed = False
+        try:
+            args = (self.inputs(),) if self.source else ()
+            for item, units in self.func(*args):
+                self.count += units
+                if item is not None:
+                    self.put(item)
+            completed = True
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            self.error = e
+            stop.set()
+        finally:
+            self.finished = time.perf_counter()
+            try:
+                self.put(DONE if completed else FAILED)
+            except PipelineStopped:
+                pass
+
+    def rate(self) -> float:
+        end = self.finished or time.perf_counter()
+        return self.count / max(end - (self.started or end), 1e-9)
+
+
+stop = threading.Event()
+manifest = Manifest()
+manifest_lock = threading.Lock()  # Le manifest est partagé par les threads des étapes
+
+
+def save_records(stage: str, records: list[tuple[str, str]], **extra) -> None:
+    with manifest_lock:
+        for key, fp in records:
+            manifest.record(stage, key, fp, **extra)
+        manifest.save()
+
+
+# === ÉTAPES ===
+
+def extract_stage(workers: int, pool: ProcessPoolExecutor):
+    """PDFs → fichiers texte nettoyés. Produit (chemin du .txt, pages)."""
+    pdf_files = sorted(extract.RAW_DIR.glob("*.pdf"))
+    with manifest_lock:
+        fingerprints = {p.name: fingerprint(manifest.file_hash(p), extract.EXTRACT_PARAMS) for p in pdf_files}
+        for name in set(manifest.entries("extract")) - set(fingerprints):
+            manifest.forget("extract", name)
+
+    stale = []
+    for pdf_path in pdf_files:
+        output_path = extract.PROCESSED_DIR / f"{pdf_path.stem}.txt"
+        if manifest.is_fresh("extract", pdf_path.name, fingerprints[pdf_path.name]) and output_path.exists():
+            yield output_path, 0
+        else:
+            stale.append(pdf_path)
+
+    for pdf_path, output_path, pages, _ in extract.extract_files(stale, workers, executor=pool):
+        save_records("extract", [(pdf_path.name, fingerprints[pdf_path.name])], output=str(output_path))
+        yield output_path, pages
+
+    # Textes ajoutés à la main dans data/processed/ (sans PDF)
+    pdf_stems = {p.stem for p in pdf_files}
+    for txt_path in sorted(extract.PROCESSED_DIR.glob("*.txt")):
+        if txt_path.stem not in pdf_stems:
+            yield txt_path, 0
+
+
+def chunk_stage(txt_paths, workers: int, pool: ProcessPoolExecutor):
+    """
+    Fichiers texte → chunks (dicts). Les fichiers à jour renvoient leurs
+    chunks existants (l'étape embeddings filtre ce qui est déjà fait) ;
+    les autres sont découpés dans le pool de processus partagé. Un chunk n'est
+    transmis que s'il est le canonique de son groupe de doublons parmi les
+    chunks déjà vus (plus petite clé, voir canonical_key) : le canonique
+    final l'est toujours, quel que soit l'ordre d'arrivée des fichiers. Le
+    fichier de chunks est réécrit à la fin, comme dans 02_chunk_texts.py,
+    avec les doublons recalculés sur tout le corpus (un ancien canonique
+    transmis avant l'arrivée d'un doublon de plus petite clé est marqué
+    doublon_de, et ignoré au prochain 03_generate_embeddings.py).
+    """
+    output_path = chunking.CHUNKS_DIR / "milarepa_chunks.jsonl"
+    existing = {}
+    if output_path.exists():
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                existing.setdefault(chunk["id"].rsplit("_", 1)[0], []).append(chunk)
+
+    seen = {}        # stem -> empreinte
+    written = {}     # stem -> chunks
+    chunked = []     # (stem, empreinte, nombre de chunks), enregistrés après réécriture du fichier
+    pending = deque()
+    duplicates = chunking.NearDuplicateIndex()
+
+    def fresh(chunks):
+        """Chunks canoniques de leur groupe de doublons parmi les chunks déjà vus."""
+        return [chunk for chunk in chunks
+                if duplicates.is_canonical(duplicates.add(chunk["texte"], chunking.canonical_key(chunk)))]
+
+    def emit(future, txt_path):
+        chunks = [asdict(chunk) for chunk in future.result()]
+        written[txt_path.stem] = chunks
+        chunked.append((txt_path.stem, seen[txt_path.stem], len(chunks)))
+        return chunks
+
+    for txt_path in txt_paths:
+        if txt_path is IDLE:
+            while pending and pending[0][0].done():
+                for chunk in fresh(emit(*pending.popleft())):
+                    yield chunk, 1
+            continue
+        with manifest_lock:
+            fp = fingerprint(manifest.file_hash(txt_path), chunking.CHUNK_PARAMS)
+        seen[txt_path.stem] = fp
+        if manifest.is_fresh("chunk", txt_path.stem, fp) and txt_path.stem in existing:
+            written[txt_path.stem] = existing[txt_path.stem]
+            for chunk in fresh(existing[txt_path.stem]):
+                yield chunk, 0
+            continue
+
+        pending.append((pool.submit(chunking.process_file, txt_path), txt_path))
+        # Rendre les fichiers terminés dans l'ordre, sans attendre les suivants
+        while pending and (pending[0][0].done() or len(pending) >= 2 * workers):
+            for chunk in fresh(emit(*pending.popleft())):
+                yield chunk, 1
+
+    while pending:
+        for chunk in fresh(emit(*pending.popleft())):
+            yield chunk, 1
+
+    # Réécrire le fichier de chunks : fichiers vus uniquement (les sources retirées
+    # disparaissent), dans l'ordre des noms comme 02_chunk_texts.py
+    output_chunks = [chunk for stem in sorted(seen) for chunk in written[stem]]
+    groups = chunking.deduplicate(output_chunks)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for chunk in output_chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+
+    with manifest_lock:
+        for stem, fp, count in chunked:
+            manifest.record("chunk", stem, fp, chunks=count)
+        for stem in set(manifest.entries("chunk")) - set(seen):
+            manifest.forget("chunk", stem)
+        manifest.record("dedup", output_path.name,
+                        fingerprint(manifest.file_hash(output_path), chunking.DEDUP_PARAMS), groups=len(groups))
+        manifest.save()
+
+
+def embed_stage(chunks):
+    """
+    Chunks → (chunk, vecteur). Les chunks déjà vectorisés sont relus du
+    magasin, les textes connus viennent du cache, les autres partent à
+    l'API en batches remplis au nombre de tokens, plusieurs à la fois.
+    """
+    with manifest_lock:
+        store = embedding.open_embeddings_store(manifest)
+    cache = EmbeddingCache()
+    with manifest_lock:
+        stored, rows = store.latest(manifest.entries("embed"))
+    row_of = {chunk["id"]: int(row) for chunk, row in zip(stored, rows)}
+    stored_vectors = store.vectors()
+    live_ids = set()
+
+    batch, batch_tokens = [], 0
+    hits = []  # Chunks servis par le cache, écrits par paquets
+    pending = set()
+
+    def flush_hits():
+        vectors = [cache.get(key) for _, key in hits]
+        store.append([chunk for chunk, _ in hits], vectors)
+        save_records("embed", [(chunk["id"], key) for chunk, key in hits])
+        items = [(chunk, vector) for (chunk, _), vector in zip(hits, vectors)]
+        hits.clear()
+        return items
+
+    def finish(done):
+        for future in done:
+            results = future.result()
+            vectors = [chunk.pop("embedding") for chunk in results]
+            keys = [fingerprint(hash_text(c["texte"]), embedding.EMBED_PARAMS) for c in results]
+            store.append(results, vectors)
+            cache.add(keys, vectors, [embedding.chunk_tokens(c) for c in results])
+            save_records("embed", [(c["id"], key) for c, key in zip(results, keys)])
+            yield from zip(results, vectors)
+
+    with ThreadPoolExecutor(max_workers=embedding.EMBED_CONCURRENCY) as executor:
+        for chunk in chunks:
+            if chunk is IDLE:
+                # Entrée au repos : servir le cache, envoyer le batch partiel s'il reste de la place
+                if hits:
+                    for item in flush_hits():
+                        yield item, 1
+                if batch and len(pending) < embedding.EMBED_CONCURRENCY:
+                    pending.add(executor.submit(embedding.embed_batch, batch))
+                    batch, batch_tokens = [], 0
+                done = {future for future in pending if future.done()}
+                pending -= done
+                for item in finish(done):
+                    yield item, 1
+                continue
+
+            live_ids.add(chunk["id"])
+            key = fingerprint(hash_text(chunk["texte"]), embedding.EMBED_PARAMS)
+
+            if manifest.is_fresh("embed", chunk["id"], key) and chunk["id"] in row_of:
+                yield (chunk, stored_vectors[row_of[chunk["id"]]]), 0
+                continue
+            if key in cache:
+                hits.append((chunk, key))
+                if len(hits) >= HIT_FLUSH_SIZE:
+                    for item in flush_hits():
+                        yield item, 1
+                continue
+
+            tokens = embedding.chunk_tokens(chunk)
+            if batch and (batch_tokens + tokens > embedding.MAX_BATCH_TOKENS
+                          or len(batch) >= embedding.MAX_BATCH_INPUTS):
+                pending.add(executor.submit(embedding.embed_batch, batch))
+                batch, batch_tokens = [], 0
+            batch.append(chunk)
+            batch_tokens += tokens
+
+            # Pas plus de EMBED_CONCURRENCY batches en vol
+            while len(pending) >= embedding.EMBED_CONCURRENCY:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for item in finish(done):
+                    yield item, 1
+
+        if hits:
+            for item in flush_hits():
+                yield item, 1
+        if batch:
+            pending.add(executor.submit(embedding.embed_batch, batch))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for item in finish(done):
+                yield item, 1
+
+    with manifest_lock:
+        for chunk_id in set(manifest.entries("embed")) - live_ids:
+            manifest.forget("embed", chunk_id)
+        manifest.save()
+
+
+def upload_stage(items, upload):
+    """(chunk, vecteur) → Supabase, en batches dimensionnés en octets, plusieurs à la fois."""
+    with manifest_lock:
+        bootstrap = not manifest.entries("upload")
+    if bootstrap:
+        existing = set(upload.fetch_existing_ids())
+    else:
+        existing = set()
+
+    batch, batch_bytes = [], 0
+    pending = set()
+
+    def finish(done):
+        for future in done:
+            rows = future.result()
+            with manifest_lock:
+                records = [(row["id"], manifest.entries("embed")[row["id"]]["fingerprint"]) for row in rows]
+            save_records("upload", records)
+            yield len(rows)
+
+    with ThreadPoolExecutor(max_workers=upload.UPLOAD_CONCURRENCY) as executor:
+        for item in items:
+            if item is IDLE:
+                if batch and len(pending) < upload.UPLOAD_CONCURRENCY:
+                    pending.add(executor.submit(upload.upload_batch, batch))
+                    batch, batch_bytes = [], 0
+                done = {future for future in pending if future.done()}
+                pending -= done
+                for count in finish(done):
+                    yield None, count
+                continue
+
+            chunk, vector = item
+            with manifest_lock:
+                fp = manifest.entries("embed")[chunk["id"]]["fingerprint"]
+            if chunk["id"] in existing:
+                with manifest_lock:
+                    manifest.record("upload", chunk["id"], fp)
+            if manifest.is_fresh("upload", chunk["id"], fp):
+                continue
+
+            row = upload.upload_row(chunk, vector)
+            size = len(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+            if batch and (batch_bytes + size > upload.MAX_BATCH_BYTES or len(batch) >= upload.MAX_BATCH_ROWS):
+                pending.add(executor.submit(upload.upload_batch, batch))
+                batch, batch_bytes = [], 0
+            batch.append(row)
+            batch_bytes += size
+
+            while len(pending) >= upload.UPLOAD_CONCURRENCY:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for count in finish(done):
+                    yield None, count
+
+        if batch:
+            pending.add(executor.submit(upload.upload_batch, batch))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for count in finish(done):
+                yield None, count
+
+    with manifest_lock:
+        for chunk_id in set(manifest.entries("upload")) - set(manifest.entries("embed")):
+            manifest.forget("upload", chunk_id)
+        manifest.save()
+
+
+# === SUIVI ===
+
+def stats_line(stages: list[Stage]) -> str:
+    parts = []
+    for stage in stages:
+        depth = f" [file {stage.output.qsize()}/{stage.output.maxsize}]" if stage.output.maxsize else ""
+        parts.append(f"{stage.name} {stage.count:,} {stage.unit} ({stage.rate():,.1f}/s){depth}")
+    return " | ".join(parts)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pipeline complet : extraction → chunks → embeddings → upload")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processus pour l'extraction et le découpage")
+    parser.add_argument("--skip-upload", action="store_true", help="s'arrêter après les embeddings")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help="secondes entre deux lignes de suivi")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        check_embedding_dimensions(embedding.EMBEDDING_DIMENSIONS)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    stages = [Stage("extract", lambda: extract_stage(args.workers, pool), "pages", maxsize=QUEUE_SIZES["extract"])]
+    stages.append(Stage("chunk", lambda paths: chunk_stage(paths, args.workers, pool), "chunks",
+                        source=stages[-1], maxsize=QUEUE_SIZES["chunk"]))
+    stages.append(Stage("embed", embed_stage, "chunks", source=stages[-1],
+                        maxsize=0 if args.skip_upload else QUEUE_SIZES["embed"]))
+    if not args.skip_upload:
+        upload = load_script("04_upload_to_supabase")
+        if embedding.EMBEDDING_DIMENSIONS:
+            upload.check_vector_dim(embedding.EMBEDDING_DIMENSIONS)
+        stages.append(Stage("upload", lambda items: upload_stage(items, upload), "chunks", source=stages[-1]))
+
+    print(f"🚀 Pipeline : {' → '.join(stage.name for stage in stages)} ({args.workers} processus)\n")
+    start = time.perf_counter()
+    # Pool d'extraction et de découpage, lancé avant les threads des étapes
+    pool = create_pool(args.workers)
+    for stage in stages:
+        stage.thread.start()
+
+    # La dernière étape est vidée ici ; suivi périodique en attendant
+    last = stages[-1]
+    next_stats = time.perf_counter() + args.stats_interval
+    while last.thread.is_alive() or not last.output.empty():
+        try:
+            last.output.get(timeout=0.2)
+        except queue.Empty:
+            pass
+        if time.perf_counter() >= next_stats:
+            print(f"⏱️  {stats_line(stages)}")
+            next_stats += args.stats_interval
+    for stage in stages:
+        stage.thread.join()
+    pool.shutdown(cancel_futures=True)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'='*50}")
+    errors = [stage for stage in stages if stage.error]
+    print(f"{'❌ PIPELINE INTERROMPU' if errors else '🎉 PIPELINE TERMINÉ'} en {elapsed:.1f}s")
+    for stage in stages:
+        busy = (stage.finished or time.perf_counter()) - (stage.started or start)
+        depth = f", file max {stage.max_depth}/{stage.output.maxsize}" if stage.output.maxsize else ""
+        print(f"   {stage.name:<8}: {stage.count:>8,} {stage.unit:<6} en {busy:6.1f}s "
+              f"({stage.rate():,.1f}/s{depth})")
+    for stage in errors:
+        print(f"   ❌ {stage.name} : {stage.error}")
+    if errors:
+        print("   Relance la commande pour reprendre (le manifest garde ce qui est fait).")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Les tests importent les modules de app/ et scripts/ comme le font l'app et
+les scripts (dossiers ajoutés au chemin d'import).
+
+    python -m pytest tests/
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "app"))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+# app/main.py crée son stockage à l'import : SQLite jetable, sans Supabase
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", str(Path(tempfile.mkdtemp()) / "tests.db"))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+
+def load_script(name: str):
+    """Importe un script numéroté (02_chunk_texts.py...) comme run_pipeline.py."""
+    spec = importlib.util.spec_from_file_location(name.split("_", 1)[1], ROOT / "scripts" / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,97 @@
+"""
+Routes Flask via app.test_client(), sur le stockage SQLite jetable de conftest.py.
+"""
+
+import threading
+import time
+
+import pytest
+
+import main
+import rag
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+class BrokenManager:
+    @property
+    def current(self):
+        raise RuntimeError("/srv/data/index/v42 introuvable")
+
+
+def test_admin_index_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    assert client.get("/admin/index").status_code == 404
+
+
+def test_admin_index_rejects_wrong_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    assert client.get("/admin/index").status_code == 401
+    response = client.get("/admin/index", headers={"Authorization": "Bearer autre"})
+    assert response.status_code == 401
+
+
+def test_admin_index_accepts_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(main, "RETRIEVAL_BACKEND", "supabase")
+    response = client.get("/admin/index", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.get_json()["backend"] == "supabase"
+
+
+def test_admin_index_hides_exception_text(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(main, "RETRIEVAL_BACKEND", "local")
+    monkeypatch.setattr(main, "get_index_manager", lambda: BrokenManager())
+    response = client.get("/admin/index", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 500
+    assert "/srv/data" not in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("payload", [
+    {"questions": []},
+    {"questions": "Qui est Milarepa ?"},
+    {"questions": ["Qui est Milarepa ?", 42]},
+    {"questions": ["Qui est Milarepa ?", "   "]},
+    {},
+])
+def test_batch_rejects_invalid_questions(client, payload):
+    response = client.post("/api/chat/batch", json=payload)
+    assert response.status_code == 400
+
+
+def test_batch_rejects_oversized_list(client):
+    questions = ["Qui est Milarepa ?"] * (main.MAX_BATCH_QUESTIONS + 1)
+    response = client.post("/api/chat/batch", json={"questions": questions})
+    assert response.status_code == 400
+    assert str(main.MAX_BATCH_QUESTIONS) in response.get_json()["error"]
+
+
+def test_batch_close_does_not_wait_for_calls(monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def answer(question, chunks):
+        started.append(question)
+        if question != "rapide":
+            release.wait(10)  # Appels Claude lents, encore en vol à la déconnexion
+        return {"answer": question, "sources": []}
+
+    monkeypatch.setattr(rag, "BATCH_CONCURRENCY", 2)
+    monkeypatch.setattr(rag, "get_query_embeddings", lambda questions: [[0.0]] * len(questions))
+    monkeypatch.setattr(rag, "search_similar_chunks_batch", lambda embeddings: [[] for _ in embeddings])
+    monkeypatch.setattr(rag, "answer_with_chunks", answer)
+
+    results = rag.generate_batch_responses(["rapide", "lent"] + ["en attente"] * 5)
+    assert next(results) == (0, {"answer": "rapide", "sources": []})
+
+    start = time.perf_counter()
+    results.close()  # Client déconnecté
+    elapsed = time.perf_counter() - start
+    release.set()
+
+    assert elapsed < 1
+    assert started.count("en attente") <= 1  # Les appels pas encore partis sont annulés
@@ -0,0 +1,131 @@
+"""
+Découpage sur les offsets de tokens (TokenIndex, section_spans,
+subdivide_spans) : mêmes chunks que l'ancien découpage, qui réencodait
+chaque section, paragraphe et chunk.
+"""
+
+import random
+import re
+
+import pytest
+
+from conftest import load_script
+
+chunking = load_script("02_chunk_texts")
+enc = chunking.enc
+
+WORDS = ("Milarepa chanta devant ses disciples dans la grotte de neige ; le maître répondit que "
+         "l'esprit est vaste comme le ciel. He sang of the mountain, the nettle soup and the cold wind.").split()
+
+
+# === Ancien découpage (avant TokenIndex), gardé comme référence ===
+
+def old_split_by_sections(text):
+    for pattern in chunking.SECTION_PATTERNS:
+        splits = re.split(pattern, text)
+        headers = re.findall(pattern, text)
+        if len(splits) > 3:
+            sections = []
+            for i, content in enumerate(splits):
+                if content.strip():
+                    header = headers[i - 1].strip() if i > 0 and i - 1 < len(headers) else "Introduction"
+                    sections.append((header, content.strip()))
+            return sections
+
+    paragraphs = text.split('\n\n')
+    sections = []
+    current = []
+    current_title = "Section 1"
+    section_num = 1
+    for para in paragraphs:
+        current.append(para)
+        if len(enc.encode('\n\n'.join(current))) > chunking.MAX_TOKENS:
+            sections.append((current_title, '\n\n'.join(current[:-1])))
+            current = [para]
+            section_num += 1
+            current_title = f"Section {section_num}"
+    if current:
+        sections.append((current_title, '\n\n'.join(current)))
+    return sections
+
+
+def old_subdivide_chunk(text, max_tokens=chunking.MAX_TOKENS):
+    if len(enc.encode(text)) <= max_tokens:
+        return [text]
+    chunks = []
+    current_chunk = []
+    current_tokens = 0
+    for para in text.split('\n\n'):
+        para_tokens = len(enc.encode(para))
+        if current_tokens + para_tokens > max_tokens and current_chunk:
+            chunk_text = '\n\n'.join(current_chunk).strip()
+            if chunk_text:
+                chunks.append(chunk_text)
+            current_chunk = [current_chunk[-1] if current_chunk else '', para]
+            current_tokens = para_tokens + len(enc.encode(current_chunk[0]))
+        else:
+            current_chunk.append(para)
+            current_tokens += para_tokens
+    if current_chunk:
+        chunk_text = '\n\n'.join(current_chunk).strip()
+        if chunk_text:
+            chunks.append(chunk_text)
+    return chunks
+
+
+def old_chunks(text):
+    chunks = []
+    for section_title, section_content in old_split_by_sections(text):
+        if len(enc.encode(section_content)) < chunking.MIN_TOKENS:
+            continue
+        for sub_text in old_subdivide_chunk(section_content):
+            tokens = len(enc.encode(sub_text))
+            if tokens >= chunking.MIN_TOKENS:
+                chunks.append((section_title[:100], sub_text, tokens))
+    return chunks
+
+
+# === Textes de test ===
+
+def paragraph(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 90)))
+
+
+def flat_text(seed=0, paragraphs=120):
+    rng = random.Random(seed)
+    return "\n\n".join(paragraph(rng) for _ in range(paragraphs))
+
+
+def chapter_text(seed=1):
+    rng = random.Random(seed)
+    parts = ["Préface du traducteur.\n\n" + paragraph(rng)]
+    for number, size in enumerate([3, 40, 8, 1, 60], start=1):
+        body = "\n\n".join(paragraph(rng) for _ in range(size))
+        parts.append(f"\nCHAPTER {number}. Le chant {number}\n{body}")
+    return "\n".join(parts)
+
+
+def paged_text(seed=2):
+    rng = random.Random(seed)
+    return "".join(f"\n--- PAGE {page} ---\n" + "\n\n".join(paragraph(rng) for _ in range(rng.randint(1, 15)))
+                   for page in range(1, 12))
+
+
+@pytest.mark.parametrize("text", [flat_text(), chapter_text(), paged_text()], ids=["plat", "chapitres", "pages"])
+def test_chunk_sections_matches_old_chunking(text):
+    drafts, _ = chunking.chunk_sections(chunking.split_by_sections(text), "Test")
+    expected = old_chunks(text)
+
+    assert len(expected) > 3
+    assert [(d["section"], d["texte"]) for d in drafts] == [(section, body) for section, body, _ in expected]
+    # Un token de blancs à cheval sur une frontière de paragraphe n'est compté que d'un côté
+    for draft, (_, _, tokens) in zip(drafts, expected):
+        assert abs(draft["tokens"] - tokens) <= 2
+
+
+def test_token_index_counts_match_encode():
+    text = "Mi-la-ré-pa chanta : « Écoute ! »\n\nLe yogi répondit — 悟り — puis se tut.\n\n" * 5
+    index = chunking.TokenIndex(text)
+    assert index.total == len(enc.encode(text))
+    for start, end in chunking.paragraph_spans(text, 0, len(text)):
+        assert index.count(start, end) == pytest.approx(len(enc.encode(text[start:end])), abs=1)
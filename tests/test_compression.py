@@ -0,0 +1,85 @@
+"""
+Compression gzip des réponses JSON : à partir de COMPRESS_MIN_BYTES
+seulement, jamais pour le NDJSON streamé de /api/chat/batch.
+"""
+
+import gzip
+import json
+
+import pytest
+from flask import Flask, Response, jsonify
+
+import compression
+import main
+from json_provider import OrjsonProvider
+
+THRESHOLD = 200
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+def body_of_size(size: int) -> dict:
+    """Objet dont la réponse jsonify fait exactement size octets ({"x":"..."} + saut de ligne)."""
+    return {"x": "a" * (size - len('{"x":""}\n'))}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESS_MIN_BYTES", THRESHOLD)
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    app.after_request(compression.compress_response)
+
+    @app.route("/json/<int:size>")
+    def sized(size):
+        return jsonify(body_of_size(size))
+
+    @app.route("/error")
+    def error():
+        return jsonify(body_of_size(THRESHOLD * 2)), 500
+
+    @app.route("/stream")
+    def stream():
+        lines = (json.dumps({"index": i, "answer": "a" * 100}) + "\n" for i in range(20))
+        return Response(lines, mimetype="application/json")
+
+    return app.test_client()
+
+
+def test_below_threshold_is_not_compressed(client):
+    response = client.get(f"/json/{THRESHOLD - 1}", headers=GZIP)
+    assert "Content-Encoding" not in response.headers
+    assert len(response.get_data()) == THRESHOLD - 1
+
+
+def test_threshold_and_above_are_compressed(client):
+    for size in (THRESHOLD, THRESHOLD * 10):
+        response = client.get(f"/json/{size}", headers=GZIP)
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert json.loads(gzip.decompress(response.get_data())) == body_of_size(size)
+
+
+def test_client_without_gzip_gets_plain_json(client):
+    response = client.get(f"/json/{THRESHOLD * 10}")
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["Vary"]  # Les caches distinguent les deux versions
+    assert response.get_json() == body_of_size(THRESHOLD * 10)
+
+
+def test_errors_and_streams_are_not_compressed(client):
+    assert "Content-Encoding" not in client.get("/error", headers=GZIP).headers
+    assert "Content-Encoding" not in client.get("/stream", headers=GZIP).headers
+
+
+def test_batch_ndjson_is_never_compressed(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESS_MIN_BYTES", THRESHOLD)
+    monkeypatch.setattr(main, "generate_batch_responses",
+                        lambda questions: ((i, {"answer": "réponse " * 50, "sources": []}) for i in range(len(questions))))
+
+    response = main.app.test_client().post("/api/chat/batch", json={"questions": ["Q1", "Q2", "Q3"]}, headers=GZIP)
+
+    assert response.mimetype == "application/x-ndjson"
+    assert "Content-Encoding" not in response.headers
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    assert len(response.get_data()) > THRESHOLD
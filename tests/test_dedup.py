@@ -0,0 +1,102 @@
+"""
+Doublons MinHash/LSH de 02_chunk_texts.py : doublons exacts et quasi
+identiques regroupés, textes distincts conservés, canonique indépendant de
+l'ordre des chunks (fichier de chunks et mode streaming de run_pipeline.py).
+"""
+
+import random
+
+import pytest
+
+from conftest import load_script
+
+chunking = load_script("02_chunk_texts")
+
+WORDS = ("vent neige grotte chant disciple maître ortie montagne souffle chaleur yogi vallée "
+         "mère lampe rivière silence corps esprit nuit aube pierre feu chemin cloche").split()
+
+
+def text(seed: int, words: int = 120) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def near(original: str) -> str:
+    """Même texte, un mot changé en fin de texte."""
+    words = original.split()
+    words[-3] = "variante"
+    return " ".join(words)
+
+
+@pytest.fixture
+def chunks():
+    base = [text(seed) for seed in range(6)]
+    texts = {
+        "a_0000": base[0],
+        "a_0001": base[1],
+        "b_0000": base[0],          # Doublon exact de a_0000
+        "b_0001": near(base[1]),    # Quasi-doublon de a_0001
+        "c_0000": near(base[1]),    # Troisième membre du groupe de a_0001
+        "c_0001": base[2],
+        "c_0002": base[3],
+        "d_0000": base[4],
+        "d_0001": base[5],
+    }
+    return [{"id": chunk_id, "texte": body, "source": chunk_id[0], "section": "", "tokens": 1}
+            for chunk_id, body in texts.items()]
+
+
+def marks(chunks):
+    return {c["id"]: c["doublon_de"] for c in chunks}
+
+
+def test_duplicates_collapse_to_lowest_key(chunks):
+    groups = chunking.deduplicate(chunks)
+    assert sorted(sorted(chunks[m]["id"] for m in members) for members in groups) == [
+        ["a_0000", "b_0000"],
+        ["a_0001", "b_0001", "c_0000"],
+    ]
+
+    by_id = {c["id"]: c for c in chunks}
+    for members in groups:
+        group = [chunks[m] for m in members]
+        canonical = min(group, key=chunking.canonical_key)
+        assert group[0] is canonical and canonical["doublon_de"] is None
+        assert sorted(d["id"] for d in canonical["doublons"]) == sorted(c["id"] for c in group[1:])
+        assert all(by_id[c["id"]]["doublon_de"] == canonical["id"] for c in group[1:])
+
+
+def test_distinct_chunks_survive(chunks):
+    chunking.deduplicate(chunks)
+    kept = [c["id"] for c in chunks if not c["doublon_de"]]
+    assert {"c_0001", "c_0002", "d_0000", "d_0001"} <= set(kept)
+    assert len(kept) == 6
+
+
+def test_exact_duplicates_break_ties_on_id(chunks):
+    chunking.deduplicate(chunks)
+    assert marks(chunks)["b_0000"] == "a_0000"  # Même texte, même hash : le plus petit id
+
+
+def test_canonical_does_not_depend_on_order(chunks):
+    chunking.deduplicate(chunks)
+    expected = marks(chunks)
+    for seed in range(5):
+        shuffled = [dict(c) for c in chunks]
+        random.Random(seed).shuffle(shuffled)
+        chunking.deduplicate(shuffled)
+        assert marks(shuffled) == expected
+
+
+def test_streaming_emits_final_canonicals(chunks):
+    chunking.deduplicate(chunks)
+    canonicals = {c["id"] for c in chunks if not c["doublon_de"]}
+
+    for seed in range(5):
+        arrival = list(chunks)
+        random.Random(seed).shuffle(arrival)
+        index = chunking.NearDuplicateIndex()
+        emitted = {c["id"] for c in arrival
+                   if index.is_canonical(index.add(c["texte"], chunking.canonical_key(c)))}
+        # Tous les canoniques partent ; un ancien canonique en trop reste marqué doublon_de
+        assert canonicals <= emitted
@@ -0,0 +1,105 @@
+"""
+Changement de paramètres d'embedding (modèle, dimensions) : le magasin et
+le cache ne doivent jamais recevoir des vecteurs d'une autre dimension.
+"""
+
+import numpy as np
+import pytest
+
+from embedding_cache import EmbeddingCache
+from embedding_store import EmbeddingStore, open_store
+
+SMALL = {"model": "text-embedding-3-small"}
+REDUCED = {"model": "text-embedding-3-small", "dimensions": 512}
+
+
+def chunks(*ids):
+    return [{"id": chunk_id, "texte": f"texte {chunk_id}"} for chunk_id in ids]
+
+
+def vectors(count, dim):
+    return np.random.default_rng(0).random((count, dim), dtype=np.float32)
+
+
+def test_store_records_params(tmp_path):
+    store, archived = open_store(tmp_path / "embeddings", "float32", SMALL, dim=1536)
+    store.append(chunks("a", "b"), vectors(2, 1536))
+
+    assert archived is None
+    assert EmbeddingStore(tmp_path / "embeddings").stored_params() == SMALL
+
+
+def test_same_params_keep_store(tmp_path):
+    store, _ = open_store(tmp_path / "embeddings", "float32", SMALL, dim=1536)
+    store.append(chunks("a"), vectors(1, 1536))
+
+    store, archived = open_store(tmp_path / "embeddings", "float32", SMALL, dim=1536)
+    assert archived is None
+    assert len(store) == 1
+
+
+def test_changed_dimensions_start_fresh_store(tmp_path):
+    store, _ = open_store(tmp_path / "embeddings", "float32", SMALL, dim=1536)
+    store.append(chunks("a", "b"), vectors(2, 1536))
+
+    store, archived = open_store(tmp_path / "embeddings", "float32", REDUCED, dim=512)
+    assert archived is not None and archived.exists()
+    assert len(store) == 0
+
+    store.append(chunks("a", "b"), vectors(2, 512))
+    assert store.dim == 512
+    assert store.stored_params() == REDUCED
+    # L'ancien magasin reste intact à côté
+    assert len(EmbeddingStore(archived)) == 2 and EmbeddingStore(archived).dim == 1536
+
+
+def test_legacy_store_with_other_dimension_is_archived(tmp_path):
+    # Magasin d'avant params.json : seule sa dimension permet de le reconnaître
+    EmbeddingStore(tmp_path / "embeddings").append(chunks("a"), vectors(1, 1536))
+
+    store, archived = open_store(tmp_path / "embeddings", "float32", REDUCED, dim=512)
+    assert archived is not None
+    assert len(store) == 0
+
+
+def test_legacy_store_with_same_dimension_is_adopted(tmp_path):
+    EmbeddingStore(tmp_path / "embeddings").append(chunks("a"), vectors(1, 1536))
+
+    store, archived = open_store(tmp_path / "embeddings", "float32", SMALL, dim=1536)
+    store.append(chunks("b"), vectors(1, 1536))
+    assert archived is None
+    assert len(store) == 2
+    assert store.stored_params() == SMALL
+
+
+def test_append_other_dimension_still_raises(tmp_path):
+    store = EmbeddingStore(tmp_path / "embeddings")
+    store.append(chunks("a"), vectors(1, 1536))
+    with pytest.raises(ValueError, match="Dimension 512"):
+        store.append(chunks("b"), vectors(1, 512))
+
+
+def test_cache_keeps_each_dimension(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache")
+    cache.add(["small-a"], vectors(1, 1536), [10])
+    cache.add(["reduced-a", "reduced-b"], vectors(2, 512), [10, 12])
+
+    reopened = EmbeddingCache(tmp_path / "cache")
+    assert len(reopened) == 3
+    assert reopened.get("small-a").shape == (1536,)
+    assert reopened.get("reduced-b").shape == (512,)
+    np.testing.assert_array_equal(reopened.get("reduced-a"), vectors(2, 512)[0])
+
+
+def test_cache_reads_legacy_root_store(tmp_path):
+    # Cache d'avant les sous-dossiers par dimension : un magasin à la racine
+    EmbeddingStore(tmp_path / "cache").append([{"id": "old", "tokens": 5}], vectors(1, 1536))
+
+    cache = EmbeddingCache(tmp_path / "cache")
+    cache.add(["new"], vectors(1, 512), [5])
+    cache.add(["old-2"], vectors(1, 1536), [5])
+
+    assert cache.get("old").shape == (1536,)
+    assert cache.get("new").shape == (512,)
+    assert len(EmbeddingStore(tmp_path / "cache")) == 2  # Même dimension : magasin d'origine
+    assert len(EmbeddingCache(tmp_path / "cache")) == 3
@@ -0,0 +1,125 @@
+"""
+Cache des historiques : éviction LRU, comptage des tokens, validité liée au
+updated_at de la conversation et invalidation quand /api/chat échoue.
+"""
+
+import pytest
+
+import history_cache
+import main
+from history_cache import HistoryCache
+
+T0 = "2026-01-01T10:00:00.100000+00:00"
+T1 = "2026-01-01T10:05:00+00:00"
+
+
+class WordEncoder:
+    """Un token par mot : évite de télécharger cl100k_base."""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(history_cache, "_encoder", WordEncoder())
+
+
+def messages(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+
+def test_lru_evicts_least_recently_used():
+    cache = HistoryCache(max_conversations=2)
+    cache.put("a", messages("un"), T0)
+    cache.put("b", messages("deux"), T0)
+    cache.get("a", T0)  # "a" redevient la plus récente
+    cache.put("c", messages("trois"), T0)
+
+    assert len(cache) == 2
+    assert cache.get("b", T0) is None
+    assert cache.get("a", T0) == messages("un")
+    assert cache.get("c", T0) == messages("trois")
+
+
+def test_disabled_cache_keeps_nothing():
+    cache = HistoryCache(max_conversations=0)
+    cache.put("a", messages("un"), T0)
+    assert cache.get("a", T0) is None
+
+
+def test_token_accounting_follows_appends():
+    cache = HistoryCache()
+    cache.put("a", messages("trois mots ici", "deux mots"), T0)
+    assert cache.tokens("a") == 5
+
+    cache.append("a", "assistant", "encore quatre mots là")
+    assert cache.tokens("a") == 9
+    assert cache.get("a", T0)[-1] == {"role": "assistant", "content": "encore quatre mots là"}
+    assert cache.tokens("absente") == 0
+
+
+def test_append_ignores_uncached_conversation():
+    cache = HistoryCache()
+    cache.append("a", "user", "bonjour")
+    assert len(cache) == 0
+
+
+def test_changed_updated_at_misses():
+    cache = HistoryCache()
+    cache.put("a", messages("un"), T0)
+    assert cache.get("a", T1) is None  # Un autre worker a écrit entre-temps
+    assert len(cache) == 0
+
+
+def test_touch_adopts_new_date():
+    cache = HistoryCache()
+    cache.put("a", messages("un"), T0)
+    cache.touch("a", T1)
+    assert cache.get("a", T1) == messages("un")
+    # Même instant écrit autrement (microsecondes abrégées par Supabase)
+    assert cache.get("a", "2026-01-01T10:05:00.000+00:00") == messages("un")
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+def test_chat_failure_invalidates_history(client, monkeypatch):
+    conversation = main.storage.create_conversation("test-user", "Nouvelle conversation")
+    main.storage.add_message(conversation["id"], "user", "ancienne question")
+
+    def broken_response(question, history):
+        assert main.history_cache.get(conversation["id"], conversation["updated_at"]) == history
+        raise RuntimeError("Claude indisponible")
+
+    monkeypatch.setattr(main, "generate_response", broken_response)
+    response = client.post("/api/chat", json={"message": "Bonjour", "conversation_id": conversation["id"]})
+
+    assert response.status_code == 500
+    assert main.history_cache.get(conversation["id"], conversation["updated_at"]) is None
+
+
+def test_chat_success_keeps_history_current(client, monkeypatch):
+    conversation = main.storage.create_conversation("test-user", "Nouvelle conversation")
+    monkeypatch.setattr(main, "generate_response", lambda question, history: {"answer": "Réponse", "sources": []})
+
+    response = client.post("/api/chat", json={"message": "Bonjour", "conversation_id": conversation["id"]})
+
+    assert response.status_code == 200
+    updated_at = main.storage.get_conversation(conversation["id"])["updated_at"]
+    assert main.history_cache.get(conversation["id"], updated_at) == [
+        {"role": "user", "content": "Bonjour"},
+        {"role": "assistant", "content": "Réponse"},
+    ]
+
+
+def test_unknown_conversation_is_not_cached(client):
+    before = len(main.history_cache)
+    response = client.post("/api/chat", json={"message": "Bonjour", "conversation_id": "inconnue"})
+    assert response.status_code == 404
+    assert len(main.history_cache) == before
+
+    client.get("/api/conversations/inconnue/messages")
+    assert len(main.history_cache) == before
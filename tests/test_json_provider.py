@@ -0,0 +1,86 @@
+"""
+OrjsonProvider face au fournisseur JSON par défaut de Flask : mêmes
+réponses (dates, ordre des clés), UTF-8 au lieu d'échappements \\uXXXX.
+"""
+
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+from flask import Flask, jsonify
+
+from json_provider import OrjsonProvider
+
+ASCII_PAYLOAD = {
+    "zeta": 1,
+    "alpha": {"beta": [1, 2.5, None, True], "aaa": "texte"},
+    "created_at": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "day": date(2026, 1, 2),
+    "price": Decimal("1.10"),
+}
+UNICODE_PAYLOAD = {"title": "Milarépa — chant de la grotte", "texte": "悟り « Écoute ! »", "a": "é"}
+
+
+def make_app(orjson: bool) -> Flask:
+    app = Flask(__name__)
+    if orjson:
+        app.json = OrjsonProvider(app)
+
+    @app.route("/ascii")
+    def ascii_payload():
+        return jsonify(ASCII_PAYLOAD)
+
+    @app.route("/unicode")
+    def unicode_payload():
+        return jsonify(UNICODE_PAYLOAD)
+
+    return app
+
+
+@pytest.fixture
+def clients():
+    return make_app(orjson=False).test_client(), make_app(orjson=True).test_client()
+
+
+def keys_in_order(body: bytes) -> list:
+    keys = []
+    json.loads(body, object_pairs_hook=lambda pairs: keys.append([k for k, _ in pairs]) or dict(pairs))
+    return keys
+
+
+def test_ascii_response_is_identical(clients):
+    default, fast = (client.get("/ascii") for client in clients)
+    assert fast.get_data() == default.get_data()
+    assert fast.mimetype == default.mimetype == "application/json"
+    assert fast.get_json()["created_at"] == "Fri, 02 Jan 2026 03:04:05 GMT"
+
+
+def test_unicode_response_is_utf8(clients):
+    default, fast = (client.get("/unicode") for client in clients)
+    assert fast.get_json() == default.get_json() == UNICODE_PAYLOAD
+    assert "Milarépa".encode("utf-8") in fast.get_data()
+    assert b"\\u00e9" in default.get_data() and b"\\u" not in fast.get_data()
+
+
+def test_keys_are_sorted_like_default(clients):
+    default, fast = (client.get("/unicode") for client in clients)
+    assert keys_in_order(fast.get_data()) == keys_in_order(default.get_data()) == [["a", "texte", "title"]]
+
+
+def test_sort_keys_can_be_disabled():
+    app = make_app(orjson=True)
+    app.json.sort_keys = False
+    assert keys_in_order(app.test_client().get("/unicode").get_data()) == [list(UNICODE_PAYLOAD)]
+
+
+def test_dumps_matches_default_json():
+    default, fast = make_app(orjson=False), make_app(orjson=True)
+    assert json.loads(fast.json.dumps(ASCII_PAYLOAD)) == json.loads(default.json.dumps(ASCII_PAYLOAD))
+    assert fast.json.loads(fast.json.dumps(UNICODE_PAYLOAD)) == UNICODE_PAYLOAD
+
+
+def test_debug_indents_like_default():
+    default, fast = make_app(orjson=False), make_app(orjson=True)
+    default.debug = fast.debug = True
+    assert fast.test_client().get("/ascii").get_data() == default.test_client().get("/ascii").get_data()
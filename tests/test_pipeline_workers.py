@@ -0,0 +1,26 @@
+"""
+Pool de run_pipeline.py : les fonctions des scripts numérotés partent aux
+processus sous leur nom de module ("chunk_texts"...), avec fork comme avec
+spawn (processus neuf, sans les modules du parent).
+"""
+
+import multiprocessing
+
+import pytest
+
+from pipeline_workers import create_pool, load_script
+
+chunking = load_script("02_chunk_texts")
+
+TEXT = "\n\n".join(f"CHAPTER {n}. Le chant {n}\nMilarepa chanta dans la grotte de neige." for n in range(1, 6))
+
+
+@pytest.mark.parametrize("method", ["fork", "spawn"])
+def test_pool_runs_script_functions(method):
+    pool = create_pool(2, mp_context=multiprocessing.get_context(method))
+    try:
+        result = pool.submit(chunking.split_by_sections, "\n" + TEXT).result(timeout=120)
+    finally:
+        pool.shutdown()
+    assert result == chunking.split_by_sections("\n" + TEXT)
+    assert len(result) == 5
@@ -0,0 +1,112 @@
+"""
+Stockage : dimensions acceptées par Supabase, backend SQLite (base
+temporaire par test).
+"""
+
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import storage
+from storage import SUPABASE_VECTOR_DIM, SQLiteStorage, Storage, check_embedding_dimensions
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("dimensions", [0, SUPABASE_VECTOR_DIM])
+def test_native_dimensions_accepted_with_supabase(dimensions):
+    check_embedding_dimensions(dimensions, "supabase")
+
+
+def test_reduced_dimensions_refused_with_supabase():
+    with pytest.raises(ValueError, match="RETRIEVAL_BACKEND=local"):
+        check_embedding_dimensions(512, "supabase")
+
+
+def test_reduced_dimensions_accepted_with_local_index():
+    check_embedding_dimensions(512, "local")
+
+
+# === SQLite ===
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge factice : une seconde de plus à chaque lecture (ordre déterministe)."""
+    ticks = itertools.count()
+    monkeypatch.setattr(storage, "utc_now", lambda: (START + timedelta(seconds=next(ticks))).isoformat())
+
+
+@pytest.fixture
+def db(tmp_path):
+    return SQLiteStorage(tmp_path / "milarippa.db")
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+def test_create_and_get_conversation(db):
+    conversation = db.create_conversation("user-1", "Chants de Milarepa")
+    assert db.get_conversation(conversation["id"]) == conversation
+    assert conversation["created_at"] == conversation["updated_at"]
+    assert db.get_conversation("inconnue") is None
+
+
+def test_messages_keep_insertion_order(db, monkeypatch):
+    conversation_id = db.create_conversation("user-1", "Ordre")["id"]
+    # Même horodatage pour tous : rowid départage
+    monkeypatch.setattr(storage, "utc_now", lambda: START.isoformat())
+    db.add_message(conversation_id, "user", "Question 1")
+    db.add_message(conversation_id, "assistant", "Réponse 1", [{"source": "Cent mille chants", "similarity": 0.8}])
+    db.add_message(conversation_id, "user", "Question 2")
+
+    messages = db.get_messages(conversation_id)
+    assert [m["content"] for m in messages] == ["Question 1", "Réponse 1", "Question 2"]
+    assert messages[1]["sources"] == [{"source": "Cent mille chants", "similarity": 0.8}]
+    assert messages[0]["sources"] is None
+    assert db.get_history(conversation_id) == [
+        {"role": "user", "content": "Question 1"},
+        {"role": "assistant", "content": "Réponse 1"},
+        {"role": "user", "content": "Question 2"},
+    ]
+
+
+def test_touch_conversation_updates_date_and_title(db, clock):
+    conversation = db.create_conversation("user-1", "Titre")
+    db.touch_conversation(conversation["id"])
+    touched = db.get_conversation(conversation["id"])
+    assert touched["updated_at"] > conversation["updated_at"]
+    assert touched["title"] == "Titre"
+
+    db.touch_conversation(conversation["id"], title="Nouveau titre")
+    assert db.get_conversation(conversation["id"])["title"] == "Nouveau titre"
+
+
+def test_list_conversations_by_user_most_recent_first(db, clock):
+    first = db.create_conversation("user-1", "Première")
+    second = db.create_conversation("user-1", "Deuxième")
+    db.create_conversation("user-2", "Autre utilisateur")
+    assert [c["id"] for c in db.list_conversations("user-1")] == [second["id"], first["id"]]
+
+    db.touch_conversation(first["id"])
+    assert [c["id"] for c in db.list_conversations("user-1")] == [first["id"], second["id"]]
+    assert db.list_conversations("personne") == []
+
+
+def test_delete_conversation_removes_messages(db):
+    conversation_id = db.create_conversation("user-1", "À supprimer")["id"]
+    db.add_message(conversation_id, "user", "Question")
+    db.delete_conversation(conversation_id)
+    assert db.get_conversation(conversation_id) is None
+    assert db.get_messages(conversation_id) == []
+
+
+def test_writes_visible_from_other_threads(db):
+    conversation_id = db.create_conversation("user-1", "Threads")["id"]
+    thread = threading.Thread(target=db.add_message, args=(conversation_id, "user", "Depuis un autre thread"))
+    thread.start()
+    thread.join()
+    assert [m["content"] for m in db.get_messages(conversation_id)] == ["Depuis un autre thread"]
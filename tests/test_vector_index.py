@@ -0,0 +1,116 @@
+"""
+Index local : la recherche en deux temps (préfixe puis vecteurs complets)
+doit renvoyer les mêmes passages que la recherche exacte ; les snapshots
+publiés sont chargés à chaud et les plus anciens supprimés.
+"""
+
+import numpy as np
+import pytest
+
+import vector_index
+from vector_index import CURRENT_FILE, IndexManager, VectorIndex, build_index, publish_snapshot
+
+DIM = 64
+PREFIX = 16
+COUNT = 2000
+
+
+def fixture_vectors(count=COUNT, dim=DIM, seed=0):
+    """Vecteurs dont l'information décroît avec la dimension, comme text-embedding-3."""
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((count, dim)) / (1 + np.arange(dim) / 4)).astype(np.float32)
+
+
+def fixture_chunks(count=COUNT):
+    return [{"id": f"c{i}", "source": "test", "langue": "fr", "texte": f"texte {i}", "tokens": 2}
+            for i in range(count)]
+
+
+@pytest.fixture(scope="module")
+def indexes(tmp_path_factory):
+    root = tmp_path_factory.mktemp("index")
+    vectors = fixture_vectors()
+    build_index(fixture_chunks(), root / "exact", vectors=vectors, prefix_dim=0, compress_texts=False)
+    build_index(fixture_chunks(), root / "prefix", vectors=vectors, prefix_dim=PREFIX, compress_texts=False)
+    return VectorIndex(root / "exact"), VectorIndex(root / "prefix"), vectors
+
+
+def queries(vectors, count=50, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), count, replace=False)
+    return (vectors[rows] + 0.3 * rng.standard_normal((count, vectors.shape[1])) * vectors.std(axis=0)).tolist()
+
+
+def test_prefix_rerank_matches_exact_search(indexes):
+    exact, prefix, vectors = indexes
+    assert exact.prefix is None and prefix.prefix is not None
+
+    for k in (1, 5, 10):
+        expected = exact.search_batch(queries(vectors), k, -1.0)
+        found = prefix.search_batch(queries(vectors), k, -1.0)
+        assert [[c["id"] for c in r] for r in found] == [[c["id"] for c in r] for r in expected]
+        # Similarités re-scorées sur les vecteurs complets : cosinus exacts
+        for got, want in zip(found, expected):
+            assert [c["similarity"] for c in got] == pytest.approx([c["similarity"] for c in want], abs=1e-6)
+
+
+def test_shortlist_size_follows_rerank_factor(indexes, monkeypatch):
+    _, prefix, vectors = indexes
+    query = vector_index.normalize(np.asarray(queries(vectors, count=1)))
+    monkeypatch.setattr(vector_index, "MIN_CANDIDATES", 20)
+
+    monkeypatch.setattr(vector_index, "RERANK_FACTOR", 5)
+    assert len(prefix.shortlist(query, 10)[0]) == 50
+    monkeypatch.setattr(vector_index, "RERANK_FACTOR", 10)
+    assert len(prefix.shortlist(query, 10)[0]) == 100
+    # Plancher pour les petits num_results
+    assert len(prefix.shortlist(query, 1)[0]) == 20
+
+
+def test_shortlist_skipped_when_candidates_cover_index(indexes, monkeypatch):
+    _, prefix, vectors = indexes
+    query = vector_index.normalize(np.asarray(queries(vectors, count=1)))
+    monkeypatch.setattr(vector_index, "RERANK_FACTOR", COUNT)
+    assert prefix.shortlist(query, 1) is None
+
+
+# === Snapshots et rechargement à chaud ===
+
+def publish(root, count, keep=3):
+    return publish_snapshot(fixture_chunks(count), root, keep=keep, vectors=fixture_vectors(count),
+                            prefix_dim=PREFIX)
+
+
+def snapshot_dirs(root):
+    return sorted(p.name for p in root.iterdir() if p.is_dir())
+
+
+def test_reload_swaps_to_published_snapshot(tmp_path):
+    first = publish(tmp_path, 100)
+    manager = IndexManager(tmp_path)
+    served = manager.current
+    assert served.version == first and len(served) == 100
+    assert manager.reload() is False  # Version inchangée : rien à recharger
+
+    second = publish(tmp_path, 120)
+    assert (tmp_path / CURRENT_FILE).read_text(encoding="utf-8") == second
+    assert manager.current is served  # Pas de bascule avant le rechargement
+    assert manager.reload() is True
+    assert manager.current.version == second and len(manager.current) == 120
+    assert manager.status()["version"] == second
+
+    # Une requête qui garde l'ancien snapshot peut finir sa recherche
+    assert len(served.search(fixture_vectors(100)[0].tolist(), 3, -1.0)) == 3
+
+
+def test_publish_keeps_last_snapshots(tmp_path):
+    versions = [publish(tmp_path, 50, keep=3) for _ in range(5)]
+    assert snapshot_dirs(tmp_path) == versions[-3:]
+    assert IndexManager(tmp_path).current.version == versions[-1]
+
+
+def test_publish_refuses_empty_index(tmp_path):
+    first = publish(tmp_path, 50)
+    with pytest.raises(ValueError):
+        publish_snapshot([], tmp_path)
+    assert (tmp_path / CURRENT_FILE).read_text(encoding="utf-8") == first